@@ -0,0 +1,206 @@
+import logging
+import queue
+import threading
+import time
+from collections import Counter
+from typing import NamedTuple, Optional
+
+import practice
+
+logger = logging.getLogger(__name__)
+
+
+class AnswerEvent(NamedTuple):
+    test_bank_id: int
+    question_id: int
+    # Selected options in stored order (bit 0 is the first option), so
+    # per-option counts do not depend on how the options were shuffled
+    selected_mask: int
+    correct: bool
+    created_at: float
+    session_id: Optional[str] = None
+
+
+def option_indexes(mask):
+    index = 0
+    while mask:
+        if mask & 1:
+            yield index
+        mask >>= 1
+        index += 1
+
+
+def apply_batch(cursor, events):
+    """Append events and fold them into the per-question and per-option rollups and the practice schedule."""
+    banks = {event.test_bank_id for event in events}
+    live = {
+        row[0] for row in cursor.execute(
+            f"SELECT id FROM test_banks WHERE id IN ({','.join('?' * len(banks))}) AND deleted_at IS NULL", tuple(banks)
+        )
+    }
+    # Answers to a bank deleted while they were queued are dropped
+    events = [event for event in events if event.test_bank_id in live]
+    if not events:
+        return 0
+
+    cursor.executemany("""
+        INSERT INTO answer_events (test_bank_id, question_id, session_id, selected_mask, correct, created_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, [
+        (e.test_bank_id, e.question_id, e.session_id, e.selected_mask, int(e.correct), e.created_at)
+        for e in events
+    ])
+
+    attempts = Counter()
+    correct = Counter()
+    picks = Counter()
+    for e in events:
+        question = (e.test_bank_id, e.question_id)
+        attempts[question] += 1
+        correct[question] += e.correct
+        for index in option_indexes(e.selected_mask):
+            picks[question + (index,)] += 1
+
+    cursor.executemany("""
+        INSERT INTO question_stats (test_bank_id, question_id, attempts, correct_count)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT (test_bank_id, question_id) DO UPDATE SET
+            attempts = attempts + excluded.attempts,
+            correct_count = correct_count + excluded.correct_count
+    """, [question + (count, correct[question]) for question, count in attempts.items()])
+    cursor.executemany("""
+        INSERT INTO option_stats (test_bank_id, question_id, option_index, picks)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT (test_bank_id, question_id, option_index) DO UPDATE SET
+            picks = picks + excluded.picks
+    """, [option + (count,) for option, count in picks.items()])
+    practice.apply_answers(cursor, events)
+    return len(events)
+
+
+def delete_questions(cursor, test_bank_id, question_ids):
+    """Drop the rollups for some of a bank's questions."""
+    params = [(test_bank_id, qid) for qid in question_ids]
+    cursor.executemany("DELETE FROM question_stats WHERE test_bank_id = ? AND question_id = ?", params)
+    cursor.executemany("DELETE FROM option_stats WHERE test_bank_id = ? AND question_id = ?", params)
+    practice.delete_questions(cursor, test_bank_id, question_ids)
+
+
+def delete_bank(cursor, test_bank_id):
+    cursor.execute("DELETE FROM answer_events WHERE test_bank_id = ?", (test_bank_id,))
+    cursor.execute("DELETE FROM question_stats WHERE test_bank_id = ?", (test_bank_id,))
+    cursor.execute("DELETE FROM option_stats WHERE test_bank_id = ?", (test_bank_id,))
+    practice.delete_bank(cursor, test_bank_id)
+
+
+def read_bank_stats(conn, test_bank_id):
+    """Rollups for one bank as {question_id: (attempts, correct_count, {option_index: picks})}."""
+    stats = {
+        question_id: (attempts, correct_count, {})
+        for question_id, attempts, correct_count in conn.execute("""
+            SELECT question_id, attempts, correct_count FROM question_stats
+            WHERE test_bank_id = ? ORDER BY question_id
+        """, (test_bank_id,))
+    }
+    for question_id, option_index, picks in conn.execute("""
+        SELECT question_id, option_index, picks FROM option_stats WHERE test_bank_id = ?
+    """, (test_bank_id,)):
+        if question_id in stats:
+            stats[question_id][2][option_index] = picks
+    return stats
+
+
+class AnswerEventLog:
+    """Write-behind log of graded answers.
+
+    Request handlers only put events on a bounded in-process queue; one
+    writer thread drains it and commits up to ``max_batch`` events per
+    transaction, so grading never waits on SQLite's writer lock. When the
+    queue is full, new events are dropped and counted rather than blocking.
+    ``on_written`` is called with each batch inside its transaction, just
+    before it commits.
+    """
+
+    def __init__(self, database, max_batch=1000, flush_interval=0.5, max_queue=100000, on_written=None):
+        self.database = database
+        self.on_written = on_written
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self._dropped_lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def queued(self):
+        return self._queue.qsize()
+
+    def record(self, test_bank_id, question_id, selected_mask, correct, session_id=None):
+        """Queue a graded answer; returns the event, or None if the queue was full and it was dropped."""
+        event = AnswerEvent(test_bank_id, question_id, selected_mask, bool(correct), time.time(), session_id)
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            # Request threads drop concurrently; += alone could lose counts
+            with self._dropped_lock:
+                self.dropped += 1
+                dropped = self.dropped
+            if dropped % 1000 == 1:
+                logger.warning("Answer event queue full; %d events dropped so far", dropped)
+            return None
+        return event
+
+    def _drain(self, first=None):
+        events = [] if first is None else [first]
+        while len(events) < self.max_batch:
+            try:
+                events.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return events
+
+    def _write(self, events):
+        with self.database.transaction() as conn:
+            written = apply_batch(conn.cursor(), events)
+            if self.on_written is not None:
+                self.on_written(events)
+            return written
+
+    def flush(self):
+        """Synchronously write everything queued so far; returns the number of events stored."""
+        written = 0
+        while True:
+            events = self._drain()
+            if not events:
+                return written
+            written += self._write(events)
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="answer-events", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                first = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            # Let a burst accumulate so it lands in a single transaction
+            if self._queue.qsize() < self.max_batch:
+                self._stop.wait(self.flush_interval / 10)
+            events = self._drain(first)
+            try:
+                self._write(events)
+            except Exception:
+                logger.exception("Failed to write %d answer events", len(events))
@@ -0,0 +1,133 @@
+import threading
+from array import array
+from typing import NamedTuple
+
+from shuffle import option_order, permute_mask, unpermute_mask
+
+
+class AnswerKey(NamedTuple):
+    test_bank_id: int
+    option_count: int
+    is_true_false: bool
+    mask: int
+
+    def displayed_mask(self, question_id, shuffle=True, seed=None):
+        """Correct-letter mask as shown to a client that used the given shuffle settings."""
+        order = option_order(question_id, self.option_count, self.is_true_false, shuffle, seed)
+        return permute_mask(self.mask, order)
+
+    def stored_selection(self, question_id, selected_mask, shuffle=True, seed=None):
+        """Map a client's selected-letter mask back onto stored option positions."""
+        order = option_order(question_id, self.option_count, self.is_true_false, shuffle, seed)
+        return unpermute_mask(selected_mask, order)
+
+
+def correct_mask(is_correct):
+    """Bitmask of the correct options in stored order (bit 0 is the first option)."""
+    mask = 0
+    for index, correct in enumerate(is_correct):
+        if correct:
+            mask |= 1 << index
+    return mask
+
+
+def stored_mask(question):
+    return correct_mask(question.is_correct)
+
+
+def mask_to_answer(mask):
+    return ",".join(chr(97 + i) for i in range(mask.bit_length()) if mask >> i & 1)
+
+
+def parse_selection(selected):
+    """Turn "a,c" into a bitmask; returns -1 for anything that is not a letter list."""
+    mask = 0
+    for part in selected.strip().lower().split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if len(part) != 1 or not "a" <= part <= "z":
+            return -1
+        mask |= 1 << (ord(part) - 97)
+    return mask
+
+
+def is_correct(selected_mask, key_mask):
+    return selected_mask > 0 and selected_mask == key_mask
+
+
+class AnswerKeyIndex:
+    """Precomputed answer keys for every question of the banks seen so far.
+
+    Each entry is a single int packing, from the top down, the stored-order
+    correct mask, the option count, the true/false flag and the 32-bit test
+    bank id, so grading is one dict lookup plus a cached permutation.
+    Keys are small and are kept independently of the compiled bank LRU.
+
+    Questions without options get a 0 entry, so they are not looked for
+    again until their bank is invalidated. As in BankCache, callers read
+    ``generation`` before fetching a bank and pass it back, so keys built
+    from a bank that was invalidated meanwhile are not added.
+    """
+
+    def __init__(self):
+        self._keys = {}
+        self._bank_questions = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    @property
+    def generation(self):
+        return self._generation
+
+    def add_bank(self, bank, generation=None):
+        """Index a compiled bank's keys; returns False if it was invalidated since ``generation``."""
+        question_ids = array("q")
+        packed = {}
+        for question_id, option_count, is_true_false, correct in bank.key_rows():
+            question_ids.append(question_id)
+            packed[question_id] = correct_mask(correct) << 40 | option_count << 33 | is_true_false << 32 | bank.id
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return False
+            self._drop_bank(bank.id)
+            self._keys.update(packed)
+            self._bank_questions[bank.id] = question_ids
+        return True
+
+    def add_missing(self, test_bank_id, question_id, generation):
+        """Remember that a question of an indexed bank has no options."""
+        with self._lock:
+            questions = self._bank_questions.get(test_bank_id)
+            if generation != self._generation or questions is None:
+                return
+            self._keys[question_id] = 0
+            questions.append(question_id)
+
+    def is_missing(self, question_id):
+        return self._keys.get(question_id) == 0
+
+    def lookup(self, question_id):
+        """Return the question's AnswerKey, or None if it is not indexed or has no options."""
+        packed = self._keys.get(question_id)
+        if not packed:
+            return None
+        return AnswerKey(
+            test_bank_id=packed & 0xFFFFFFFF,
+            option_count=packed >> 33 & 0x7F,
+            is_true_false=bool(packed >> 32 & 1),
+            mask=packed >> 40,
+        )
+
+    def invalidate(self, test_bank_id=None):
+        with self._lock:
+            self._generation += 1
+            if test_bank_id is None:
+                self._keys.clear()
+                self._bank_questions.clear()
+            else:
+                self._drop_bank(test_bank_id)
+
+    def _drop_bank(self, test_bank_id):
+        for question_id in self._bank_questions.pop(test_bank_id, ()):
+            self._keys.pop(question_id, None)
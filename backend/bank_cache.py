@@ -0,0 +1,280 @@
+import json
+import threading
+from collections import OrderedDict
+from typing import Dict, NamedTuple, Optional, Tuple
+
+from coherence import bump_generation
+
+
+def image_url(exam_code, name):
+    """Build the public URL for an exam image, or None if there is no image."""
+    return f"/exams/{exam_code}/images/{name}" if name else None
+
+
+class CompiledQuestion(NamedTuple):
+    id: int
+    question_text: str
+    explanation: str
+    question_images: Tuple[Optional[str], ...]
+    explanation_images: Tuple[Optional[str], ...]
+    options: Tuple[str, ...]
+    option_images: Tuple[Optional[str], ...]
+    is_correct: Tuple[bool, ...]
+    is_true_false: bool
+
+
+class CompiledBank(NamedTuple):
+    id: int
+    exam_code: str
+    version: int
+    questions: Tuple[CompiledQuestion, ...]
+    positions: Dict[int, int]
+
+    def question(self, question_id):
+        position = self.positions.get(question_id)
+        return None if position is None else self.questions[position]
+
+    def key_rows(self):
+        """(question id, option count, is true/false, correct options) for every question."""
+        for q in self.questions:
+            yield q.id, len(q.options), q.is_true_false, q.is_correct
+
+
+def bump_content_version(cursor, test_bank_id):
+    """Mark a bank's questions as changed; called in the transaction that changes them."""
+    cursor.execute("UPDATE test_banks SET content_version = content_version + 1 WHERE id = ?", (test_bank_id,))
+    bump_generation(cursor)
+
+
+def _compile_question(exam_code, row, options, image_urls=image_url):
+    q_id, question_text, explanation, question_images, explanation_images = row
+    question_images_list = json.loads(question_images) if question_images else []
+    explanation_images_list = json.loads(explanation_images) if explanation_images else []
+    return CompiledQuestion(
+        id=q_id,
+        question_text=question_text,
+        explanation=explanation or "",
+        question_images=tuple(image_urls(exam_code, img) for img in question_images_list),
+        explanation_images=tuple(image_urls(exam_code, img) for img in explanation_images_list),
+        options=tuple(text for text, _, _ in options),
+        option_images=tuple(image_urls(exam_code, img) for _, _, img in options),
+        is_correct=tuple(bool(is_correct) for _, is_correct, _ in options),
+        is_true_false=(
+            len(options) == 2 and
+            {text.lower() for text, _, _ in options} == {"true", "false"}
+        ),
+    )
+
+
+QUESTION_COLUMNS = """
+    q.id, q.question_text, q.explanation, q.question_images, q.explanation_images,
+    o.option_text, o.is_correct, o.image
+"""
+
+
+def iter_compiled_questions(rows, exam_code, image_urls=image_url):
+    """Group joined question/option rows, ordered by question id, into CompiledQuestions.
+
+    ``image_urls(exam_code, name)`` turns stored image names into public URLs.
+    """
+    current_row = None
+    options = []
+    for row in rows:
+        if current_row is None or row[0] != current_row[0]:
+            if current_row is not None:
+                yield _compile_question(exam_code, current_row, options, image_urls)
+            current_row = row[:5]
+            options = []
+        options.append(row[5:])
+    if current_row is not None:
+        yield _compile_question(exam_code, current_row, options, image_urls)
+
+
+def bank_header(conn, test_bank_id):
+    """Return (exam_code, content_version) for a bank, or None if it does not exist or was deleted."""
+    return conn.execute(
+        "SELECT exam_code, content_version FROM test_banks WHERE id = ? AND deleted_at IS NULL", (test_bank_id,)
+    ).fetchone()
+
+
+def fetch_page(conn, test_bank_id, exam_code, after_id, limit, image_urls=image_url):
+    """Compile up to ``limit`` questions with ids above ``after_id`` (keyset pagination).
+
+    Returns (questions, last_id); last_id is the highest question id scanned,
+    which may belong to a question skipped for having no options.
+    """
+    question_ids = [row[0] for row in conn.execute("""
+        SELECT id FROM questions
+        WHERE test_bank_id = ? AND id > ?
+        ORDER BY id
+        LIMIT ?
+    """, (test_bank_id, after_id, limit))]
+    last_id = question_ids[-1] if question_ids else None
+    return fetch_by_ids(conn, exam_code, question_ids, image_urls), last_id
+
+
+def fetch_by_ids(conn, exam_code, question_ids, image_urls=image_url):
+    """Compile the given questions, in ascending id order."""
+    if not question_ids:
+        return []
+    placeholders = ", ".join("?" for _ in question_ids)
+    rows = conn.execute(f"""
+        SELECT {QUESTION_COLUMNS}
+        FROM questions q
+        JOIN options o ON o.question_id = q.id
+        WHERE q.id IN ({placeholders})
+        ORDER BY q.id, o.id
+    """, tuple(question_ids))
+    return list(iter_compiled_questions(rows, exam_code, image_urls))
+
+
+# Random id probes tried per requested question before the rest of a sample
+# is filled by walking the index (only banks whose ids are mostly gaps get there)
+SAMPLE_PROBES_PER_QUESTION = 4
+
+# Only questions with options can be served (fetch_by_ids joins them)
+_SAMPLE_ELIGIBLE = "test_bank_id = ? AND EXISTS (SELECT 1 FROM options o WHERE o.question_id = questions.id)"
+
+
+def sample_ids(conn, test_bank_id, count, rng):
+    """Pick ``min(count, eligible questions)`` distinct question ids at random with indexed lookups.
+
+    Each probe is a random id between the bank's lowest and highest id, kept
+    if that exact id is one of the bank's questions with options, so every
+    question is equally likely however the ids are spread. If the probes run
+    out (ids with large gaps), the sample is topped up with the next unchosen
+    questions after a random starting id. Either way the cost is bounded by
+    the sample size, not the bank.
+    """
+    low, high = conn.execute(
+        "SELECT MIN(id), MAX(id) FROM questions WHERE test_bank_id = ?", (test_bank_id,)
+    ).fetchone()
+    if low is None:
+        return []
+    chosen = set()
+    tried = set()
+    for _ in range(count * SAMPLE_PROBES_PER_QUESTION):
+        if len(chosen) >= count or len(tried) > high - low:
+            break
+        probe = rng.randint(low, high)
+        if probe in tried:
+            continue
+        tried.add(probe)
+        if conn.execute(f"SELECT 1 FROM questions WHERE id = ? AND {_SAMPLE_ELIGIBLE}", (probe, test_bank_id)).fetchone():
+            chosen.add(probe)
+
+    start = rng.randint(low, high)
+    for first, last in ((start, high), (low, start - 1)):
+        need = count - len(chosen)
+        if need <= 0:
+            break
+        # Chosen ids in the range can come back too, so ask for that many more
+        taken = sum(1 for qid in chosen if first <= qid <= last)
+        rows = conn.execute(f"""
+            SELECT id FROM questions WHERE {_SAMPLE_ELIGIBLE} AND id BETWEEN ? AND ? ORDER BY id LIMIT ?
+        """, (test_bank_id, first, last, need + taken)).fetchall()
+        for (qid,) in rows:
+            if len(chosen) >= count:
+                break
+            chosen.add(qid)
+    return sorted(chosen)
+
+
+def compile_bank(conn, test_bank_id, image_urls=image_url):
+    """Read a whole test bank with a single joined query and compile it."""
+    header = bank_header(conn, test_bank_id)
+    if not header:
+        return None
+    exam_code, version = header
+
+    rows = conn.execute(f"""
+        SELECT {QUESTION_COLUMNS}
+        FROM questions q
+        JOIN options o ON o.question_id = q.id
+        WHERE q.test_bank_id = ?
+        ORDER BY q.id, o.id
+    """, (test_bank_id,))
+    questions = list(iter_compiled_questions(rows, exam_code, image_urls))
+
+    return CompiledBank(
+        id=test_bank_id,
+        exam_code=exam_code,
+        version=version,
+        questions=tuple(questions),
+        positions={q.id: i for i, q in enumerate(questions)},
+    )
+
+
+class BankCache:
+    """Thread-safe LRU cache of compiled test banks.
+
+    Bounded both by the number of banks and by the total number of cached
+    questions, so a handful of huge banks cannot pin unbounded memory.
+    """
+
+    def __init__(self, max_banks=32, max_questions=200_000, image_urls=image_url, snapshots=None):
+        self.max_banks = max_banks
+        self.max_questions = max_questions
+        self.image_urls = image_urls
+        # Optional snapshots.SnapshotStore: a snapshot at the bank's current
+        # content version is mapped instead of compiling the bank
+        self.snapshots = snapshots
+        self._banks = OrderedDict()
+        self._question_count = 0
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._banks)
+
+    @property
+    def question_count(self):
+        return self._question_count
+
+    def get(self, conn, test_bank_id):
+        """Return the compiled bank, compiling it from the database (or mapping its snapshot) on a miss."""
+        with self._lock:
+            bank = self._banks.get(test_bank_id)
+            if bank is not None:
+                self._banks.move_to_end(test_bank_id)
+                return bank
+            generation = self._generation
+
+        bank = None
+        if self.snapshots is not None:
+            header = bank_header(conn, test_bank_id)
+            if not header:
+                return None
+            bank = self.snapshots.load(test_bank_id, version=header[1])
+        if bank is None:
+            bank = compile_bank(conn, test_bank_id, self.image_urls)
+        if bank is None:
+            return None
+
+        with self._lock:
+            # Drop the result if the bank was invalidated while we were compiling
+            if generation == self._generation and test_bank_id not in self._banks:
+                self._banks[test_bank_id] = bank
+                self._question_count += len(bank.questions)
+                self._evict()
+        return bank
+
+    def invalidate(self, test_bank_id=None):
+        """Forget one compiled bank, or all of them if no id is given."""
+        with self._lock:
+            self._generation += 1
+            if test_bank_id is None:
+                self._banks.clear()
+                self._question_count = 0
+            else:
+                bank = self._banks.pop(test_bank_id, None)
+                if bank is not None:
+                    self._question_count -= len(bank.questions)
+
+    def _evict(self):
+        while self._banks and (
+            len(self._banks) > self.max_banks or
+            (self._question_count > self.max_questions and len(self._banks) > 1)
+        ):
+            _, bank = self._banks.popitem(last=False)
+            self._question_count -= len(bank.questions)
@@ -0,0 +1,145 @@
+import json
+
+# Summary rows are maintained by the same transactions that change the
+# underlying data, so GET /test_banks can read them without aggregating.
+
+LAST_SCORES = 3
+
+# Every attempt is also folded into per-day and per-week buckets (UTC,
+# weeks starting on Monday), so trend charts read a few rollup rows instead
+# of aggregating raw results. Values are SQL expressions over a timestamp.
+BUCKETS = {
+    "day": "date({})",
+    "week": "date({}, 'weekday 0', '-6 days')",
+}
+BUCKET_DAYS = {"day": 1, "week": 7}
+
+
+def percentage(score, total_questions):
+    return (score / total_questions * 100) if total_questions > 0 else 0
+
+
+def ensure_bank(cursor, test_bank_id):
+    cursor.execute("INSERT OR IGNORE INTO bank_stats (test_bank_id) VALUES (?)", (test_bank_id,))
+
+
+def add_questions(cursor, test_bank_id, count):
+    cursor.execute("""
+        INSERT INTO bank_stats (test_bank_id, question_count) VALUES (?, ?)
+        ON CONFLICT (test_bank_id) DO UPDATE SET question_count = question_count + excluded.question_count
+    """, (test_bank_id, count))
+
+
+def record_result(cursor, test_bank_id, score, total_questions, timestamp):
+    ensure_bank(cursor, test_bank_id)
+    cursor.execute("SELECT last_scores FROM bank_stats WHERE test_bank_id = ?", (test_bank_id,))
+    last_scores = json.loads(cursor.fetchone()[0])
+    value = percentage(score, total_questions)
+    last_scores = ([value] + last_scores)[:LAST_SCORES]
+    cursor.execute("""
+        UPDATE bank_stats
+        SET attempt_count = attempt_count + 1,
+            percentage_sum = percentage_sum + ?,
+            best_percentage = MAX(COALESCE(best_percentage, ?), ?),
+            last_scores = ?
+        WHERE test_bank_id = ?
+    """, (value, value, value, json.dumps(last_scores), test_bank_id))
+    for bucket, period in BUCKETS.items():
+        cursor.execute(f"""
+            INSERT INTO result_rollups (test_bank_id, bucket, period_start, attempts, percentage_sum, best_percentage)
+            VALUES (?, ?, {period.format("?")}, 1, ?, ?)
+            ON CONFLICT (test_bank_id, bucket, period_start) DO UPDATE SET
+                attempts = attempts + 1,
+                percentage_sum = percentage_sum + excluded.percentage_sum,
+                best_percentage = MAX(best_percentage, excluded.best_percentage)
+        """, (test_bank_id, bucket, timestamp, value, value))
+
+
+def delete_bank(cursor, test_bank_id):
+    cursor.execute("DELETE FROM bank_stats WHERE test_bank_id = ?", (test_bank_id,))
+    cursor.execute("DELETE FROM result_rollups WHERE test_bank_id = ?", (test_bank_id,))
+
+
+def rebuild_rollups(cursor):
+    """Recompute the day and week buckets from exam_results."""
+    cursor.execute("DELETE FROM result_rollups")
+    value = "CASE WHEN total_questions > 0 THEN score * 100.0 / total_questions ELSE 0 END"
+    for bucket, period in BUCKETS.items():
+        cursor.execute(f"""
+            INSERT INTO result_rollups (test_bank_id, bucket, period_start, attempts, percentage_sum, best_percentage)
+            SELECT test_bank_id, ?, {period.format("timestamp")}, COUNT(*), SUM({value}), MAX({value})
+            FROM exam_results
+            GROUP BY test_bank_id, {period.format("timestamp")}
+        """, (bucket,))
+
+
+def read_rollups(conn, test_bank_id, bucket, limit, window):
+    """The latest ``limit`` buckets, oldest first, as dicts.
+
+    moving_average is the attempt-weighted mean over the ``window`` calendar
+    buckets ending at each one (empty buckets count towards the window).
+    """
+    span = (window - 1) * BUCKET_DAYS[bucket]
+    rows = conn.execute(f"""
+        SELECT period_start, attempts, mean, best_percentage, moving_average FROM (
+            SELECT period_start, attempts, percentage_sum / attempts AS mean, best_percentage,
+                   SUM(percentage_sum) OVER w / SUM(attempts) OVER w AS moving_average
+            FROM result_rollups
+            WHERE test_bank_id = ? AND bucket = ?
+            WINDOW w AS (ORDER BY julianday(period_start) RANGE BETWEEN {int(span)} PRECEDING AND CURRENT ROW)
+        )
+        ORDER BY period_start DESC
+        LIMIT ?
+    """, (test_bank_id, bucket, limit)).fetchall()
+    return [
+        {
+            "period_start": period_start,
+            "attempts": attempts,
+            "mean_percentage": mean,
+            "best_percentage": best,
+            "moving_average": moving,
+        }
+        for period_start, attempts, mean, best, moving in reversed(rows)
+    ]
+
+
+def rebuild(cursor):
+    """Recompute every summary row from the base tables."""
+    cursor.execute("DELETE FROM bank_stats")
+    cursor.execute("""
+        INSERT INTO bank_stats (test_bank_id, question_count, attempt_count, percentage_sum, best_percentage)
+        SELECT tb.id,
+               (SELECT COUNT(*) FROM questions q WHERE q.test_bank_id = tb.id),
+               (SELECT COUNT(*) FROM exam_results r WHERE r.test_bank_id = tb.id),
+               (SELECT COALESCE(SUM(CASE WHEN r.total_questions > 0 THEN r.score * 100.0 / r.total_questions ELSE 0 END), 0)
+                FROM exam_results r WHERE r.test_bank_id = tb.id),
+               (SELECT MAX(CASE WHEN r.total_questions > 0 THEN r.score * 100.0 / r.total_questions ELSE 0 END)
+                FROM exam_results r WHERE r.test_bank_id = tb.id)
+        FROM test_banks tb
+    """)
+    for (test_bank_id,) in cursor.execute("SELECT id FROM test_banks").fetchall():
+        cursor.execute("""
+            SELECT score, total_questions FROM exam_results
+            WHERE test_bank_id = ?
+            ORDER BY timestamp DESC
+            LIMIT ?
+        """, (test_bank_id, LAST_SCORES))
+        last_scores = [percentage(score, total) for score, total in cursor.fetchall()]
+        cursor.execute(
+            "UPDATE bank_stats SET last_scores = ? WHERE test_bank_id = ?",
+            (json.dumps(last_scores), test_bank_id)
+        )
+
+
+def row_to_summary(question_count, last_scores, attempt_count, percentage_sum, best_percentage):
+    last_three_scores = json.loads(last_scores) if last_scores else []
+    while len(last_three_scores) < LAST_SCORES:
+        last_three_scores.append(None)
+    attempt_count = attempt_count or 0
+    return {
+        "question_count": question_count or 0,
+        "last_three_scores": last_three_scores,
+        "attempt_count": attempt_count,
+        "best_percentage": best_percentage,
+        "average_percentage": (percentage_sum / attempt_count) if attempt_count else None,
+    }
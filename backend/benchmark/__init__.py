@@ -0,0 +1,4 @@
+"""Reproducible load benchmarks for the exam API.
+
+Run from the backend directory, e.g. ``python -m benchmark run --questions 100000``.
+"""
@@ -0,0 +1,178 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+
+from benchmark import load, synthetic
+from benchmark.server import Server
+
+SCENARIOS = ("test_banks", "questions", "questions_shuffled", "answer", "exam_results")
+# Whole-bank downloads are far heavier than the other calls, so they get fewer requests by default
+HEAVY_SCENARIOS = ("questions", "questions_shuffled")
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def generate(args):
+    info = synthetic.write_bank(
+        args.output, args.questions, exam_code=args.exam_code, seed=args.seed,
+        options=args.options, image_count=args.images,
+    )
+    if args.images:
+        synthetic.write_images(args.images_dir or os.path.splitext(args.output)[0] + "_images", args.images)
+    print(json.dumps(info, indent=2))
+
+
+def run(args):
+    workdir = args.workdir or tempfile.mkdtemp(prefix="exam-bench-")
+    bank_path = os.path.join(workdir, f"bank-{args.questions}.json")
+    exam_code = "BENCH"
+    dataset = synthetic.write_bank(
+        bank_path, args.questions, exam_code=exam_code, seed=args.seed,
+        options=args.options, image_count=args.images,
+    )
+    if args.images:
+        # Put the images where the server expects them, as a hand-copied bank would be today
+        synthetic.write_images(os.path.join(workdir, "exams", exam_code, "images"), args.images)
+
+    selected = args.scenarios.split(",") if args.scenarios else list(SCENARIOS)
+    unknown = set(selected) - set(SCENARIOS)
+    if unknown:
+        sys.exit(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+    results = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "concurrency": args.concurrency,
+            "workers": args.workers,
+        },
+        "dataset": {key: value for key, value in dataset.items() if key != "path"},
+        "scenarios": {},
+    }
+
+    with Server(workdir, workers=args.workers) as server:
+        client = load.Client(server.port)
+        job, seconds = load.upload_import(client, bank_path)
+        if job["status"] != "completed":
+            sys.exit(f"Import failed: {job['errors']}")
+        results["import"] = {
+            "seconds": round(seconds, 3),
+            "questions": job["questions_done"],
+            "options": job["options_done"],
+            "questions_per_sec": round(job["questions_done"] / seconds, 1) if seconds else None,
+            "rss_after_kib": server.rss_kib(),
+        }
+        print(f"import: {job['questions_done']} questions in {seconds:.2f}s", file=sys.stderr)
+
+        test_bank_id = job["test_bank_id"]
+        ids = [item["id"] for item in client.json("GET", f"/questions?test_bank_id={test_bank_id}&fields=id")["questions"]]
+        client.close()
+
+        factories = load.scenarios(test_bank_id, ids)
+        for name in selected:
+            requests = args.heavy_requests if name in HEAVY_SCENARIOS else args.requests
+            # One untimed request warms the compiled-bank cache, as a running server would be
+            load.run_scenario(server.port, factories[name], 1, 1, seed=args.seed)
+            summary = load.run_scenario(server.port, factories[name], requests, args.concurrency, seed=args.seed)
+            summary["rss_after_kib"] = server.rss_kib()
+            results["scenarios"][name] = summary
+            latency = summary["latency_ms"]
+            print(
+                f"{name}: {summary['throughput_rps']} req/s, p50 {latency['p50']} ms, "
+                f"p95 {latency['p95']} ms, p99 {latency['p99']} ms, errors {summary['errors']}",
+                file=sys.stderr,
+            )
+    results["server"] = {"peak_rss_kib": server.peak_rss_kib}
+
+    output = args.output or os.path.join(
+        "benchmark-results",
+        f"{results['meta']['timestamp'].replace(':', '')}-{results['meta']['commit'] or 'unknown'}-{args.questions}.json",
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as out:
+        json.dump(results, out, indent=2)
+    print(output)
+
+
+def compare(args):
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+
+    def delta(old, new):
+        if old in (None, 0) or new is None:
+            return ""
+        return f"{(new - old) / old * 100:+.1f}%"
+
+    print(f"baseline {baseline['meta']['commit']}  vs  candidate {candidate['meta']['commit']}")
+    rows = [("import q/s", baseline.get("import", {}).get("questions_per_sec"),
+             candidate.get("import", {}).get("questions_per_sec"))]
+    for name in SCENARIOS:
+        old = baseline["scenarios"].get(name)
+        new = candidate["scenarios"].get(name)
+        if not old or not new:
+            continue
+        rows.append((f"{name} req/s", old["throughput_rps"], new["throughput_rps"]))
+        for key in ("p50", "p95", "p99"):
+            rows.append((f"{name} {key} ms", old["latency_ms"][key], new["latency_ms"][key]))
+    rows.append(("peak RSS KiB", baseline["server"]["peak_rss_kib"], candidate["server"]["peak_rss_kib"]))
+    for label, old, new in rows:
+        print(f"{label:<32} {str(old):>12} {str(new):>12} {delta(old, new):>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmark", description="Load benchmarks for the exam API.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    gen = commands.add_parser("generate", help="Write a synthetic bank in the /import JSON format")
+    gen.add_argument("output")
+    gen.add_argument("--questions", type=int, default=1000)
+    gen.add_argument("--options", type=int, default=4)
+    gen.add_argument("--images", type=int, default=0, help="Number of distinct images to reference (0 for none)")
+    gen.add_argument("--images-dir", help="Where to write the images (default: next to the bank)")
+    gen.add_argument("--exam-code", default="BENCH")
+    gen.add_argument("--seed", type=int, default=0)
+    gen.set_defaults(func=generate)
+
+    bench = commands.add_parser("run", help="Start a local uvicorn, import a synthetic bank and load each endpoint")
+    bench.add_argument("--questions", type=int, default=1000, help="Bank size (e.g. 1000 to 500000)")
+    bench.add_argument("--options", type=int, default=4)
+    bench.add_argument("--images", type=int, default=0, help="Number of distinct images to reference (0 for none)")
+    bench.add_argument("--concurrency", type=int, default=8, help="Concurrent client threads")
+    bench.add_argument("--requests", type=int, default=2000, help="Requests per light scenario")
+    bench.add_argument("--heavy-requests", type=int, default=50, help="Requests per whole-bank /questions scenario")
+    bench.add_argument("--scenarios", help=f"Comma-separated subset of: {','.join(SCENARIOS)}")
+    bench.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    bench.add_argument("--workdir", help="Scratch directory for the server's database (default: a new temp dir)")
+    bench.add_argument("--seed", type=int, default=0)
+    bench.add_argument("--output", help="Results file (default: benchmark-results/<time>-<commit>-<size>.json)")
+    bench.set_defaults(func=run)
+
+    cmp = commands.add_parser("compare", help="Compare two results files")
+    cmp.add_argument("baseline")
+    cmp.add_argument("candidate")
+    cmp.set_defaults(func=compare)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+import http.client
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Client:
+    """Keep-alive HTTP/1.1 client; one per worker thread."""
+
+    def __init__(self, port, timeout=600):
+        self.port = port
+        self.timeout = timeout
+        self._conn = None
+
+    def request(self, method, path, body=None, headers=None):
+        headers = dict(headers or {})
+        if isinstance(body, (dict, list)):
+            body = json.dumps(body).encode()
+            headers["Content-Type"] = "application/json"
+        for attempt in range(2):
+            if self._conn is None:
+                self._conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=self.timeout)
+            try:
+                self._conn.request(method, path, body=body, headers=headers)
+                response = self._conn.getresponse()
+                return response.status, response.read()
+            except (http.client.HTTPException, ConnectionError):
+                # The server may close an idle keep-alive connection; reconnect once
+                self._conn.close()
+                self._conn = None
+                if attempt:
+                    raise
+
+    def json(self, method, path, body=None):
+        status, data = self.request(method, path, body)
+        if status >= 400:
+            raise RuntimeError(f"{method} {path} -> {status}: {data[:200]!r}")
+        return json.loads(data)
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize(latencies, errors, wall, payload_bytes=0):
+    latencies = sorted(latencies)
+    count = len(latencies)
+    return {
+        "requests": count,
+        "errors": errors,
+        "wall_sec": round(wall, 4),
+        "throughput_rps": round(count / wall, 2) if wall else None,
+        "latency_ms": {
+            "mean": round(sum(latencies) / count * 1000, 3) if count else None,
+            "p50": round(percentile(latencies, 0.50) * 1000, 3) if count else None,
+            "p95": round(percentile(latencies, 0.95) * 1000, 3) if count else None,
+            "p99": round(percentile(latencies, 0.99) * 1000, 3) if count else None,
+            "max": round(latencies[-1] * 1000, 3) if count else None,
+        },
+        "response_bytes": payload_bytes,
+    }
+
+
+def run_scenario(port, make_request, requests, concurrency, seed=0):
+    """Issue `requests` calls of make_request(client, rng) from `concurrency` threads.
+
+    make_request returns (status, body). Statuses >= 400 and exceptions are
+    counted as errors; their latencies are not included in the percentiles.
+    """
+    latencies = []
+    errors = [0]
+    payload = [0]
+    lock = threading.Lock()
+    remaining = iter(range(requests))
+
+    def worker(worker_index):
+        client = Client(port)
+        rng = random.Random(seed * 1000 + worker_index)
+        local_latencies = []
+        local_errors = 0
+        local_bytes = 0
+        try:
+            while True:
+                with lock:
+                    if next(remaining, None) is None:
+                        break
+                start = time.perf_counter()
+                try:
+                    status, body = make_request(client, rng)
+                except Exception:
+                    local_errors += 1
+                    continue
+                elapsed = time.perf_counter() - start
+                if status >= 400:
+                    local_errors += 1
+                else:
+                    local_latencies.append(elapsed)
+                    local_bytes += len(body)
+        finally:
+            client.close()
+            with lock:
+                latencies.extend(local_latencies)
+                errors[0] += local_errors
+                payload[0] += local_bytes
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(worker, range(concurrency)))
+    return summarize(latencies, errors[0], time.perf_counter() - start, payload[0])
+
+
+def upload_import(client, bank_path, poll_interval=0.2):
+    """POST a bank to /import as multipart, wait for the job and return (job, seconds)."""
+    boundary = uuid.uuid4().hex
+    head = (
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="file"; filename="{os.path.basename(bank_path)}"\r\n'
+        f"Content-Type: application/json\r\n\r\n"
+    ).encode()
+    tail = f"\r\n--{boundary}--\r\n".encode()
+
+    # The multipart body is spooled to disk so 500k-question banks are never held in memory
+    with tempfile.TemporaryFile() as body, open(bank_path, "rb") as bank:
+        body.write(head)
+        while True:
+            chunk = bank.read(1024 * 1024)
+            if not chunk:
+                break
+            body.write(chunk)
+        body.write(tail)
+        length = body.tell()
+        body.seek(0)
+
+        start = time.perf_counter()
+        status, data = client.request("POST", "/import?duplicates=keep", body=body, headers={
+            "Content-Type": f"multipart/form-data; boundary={boundary}",
+            "Content-Length": str(length),
+        })
+    if status != 202:
+        raise RuntimeError(f"/import -> {status}: {data[:200]!r}")
+    job_id = json.loads(data)["job_id"]
+    while True:
+        job = client.json("GET", f"/import/{job_id}")
+        if job["status"] in ("completed", "failed"):
+            return job, time.perf_counter() - start
+        time.sleep(poll_interval)
+
+
+def scenarios(test_bank_id, question_ids):
+    """Request factories for each measured endpoint, keyed by scenario name."""
+
+    def test_banks(client, rng):
+        return client.request("GET", "/test_banks")
+
+    def questions(client, rng):
+        return client.request("GET", f"/questions?test_bank_id={test_bank_id}")
+
+    def questions_shuffled(client, rng):
+        # A fresh seed per request defeats the response cache: the worst case
+        return client.request("GET", f"/questions?test_bank_id={test_bank_id}&shuffle=true&seed={rng.getrandbits(32)}")
+
+    def answer(client, rng):
+        return client.request("POST", "/answer", {
+            "question_id": rng.choice(question_ids),
+            "selected_answer": rng.choice("abcd"),
+            "shuffle": False,
+        })
+
+    def exam_results(client, rng):
+        total = 50
+        return client.request("POST", "/exam_results", {
+            "test_bank_id": test_bank_id,
+            "score": rng.randint(0, total),
+            "total_questions": total,
+        })
+
+    return {
+        "test_banks": test_banks,
+        "questions": questions,
+        "questions_shuffled": questions_shuffled,
+        "answer": answer,
+        "exam_results": exam_results,
+    }
@@ -0,0 +1,122 @@
+import http.client
+import os
+import resource
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _rss_kib(pid, field):
+    """Read VmRSS/VmHWM for a process from /proc (Linux only; None elsewhere)."""
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+    return None
+
+
+class Server:
+    """A uvicorn process serving main:app from a scratch working directory.
+
+    The working directory holds the server's test_engine.db and exams/
+    folder, so benchmark runs never touch a real database.
+    """
+
+    def __init__(self, workdir, port=None, workers=1, env=None):
+        self.workdir = workdir
+        self.port = port or free_port()
+        self.workers = workers
+        self.env = env or {}
+        self.process = None
+        self.peak_rss_kib = None
+        self._sampler = None
+        self._stop = threading.Event()
+
+    def start(self, timeout=60):
+        os.makedirs(self.workdir, exist_ok=True)
+        env = dict(os.environ)
+        env["PYTHONPATH"] = BACKEND_DIR + os.pathsep + env.get("PYTHONPATH", "")
+        env.setdefault("LOG_LEVEL", "WARNING")
+        # Multi-worker mode is switched on by WEB_CONCURRENCY, not by --workers
+        env["WEB_CONCURRENCY"] = str(self.workers)
+        env.update(self.env)
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1",
+             "--port", str(self.port), "--workers", str(self.workers), "--no-access-log"],
+            cwd=self.workdir, env=env,
+        )
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"uvicorn exited with code {self.process.returncode}")
+            try:
+                conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=1)
+                conn.request("GET", "/")
+                conn.getresponse().read()
+                conn.close()
+                break
+            except OSError:
+                time.sleep(0.1)
+        else:
+            self.stop()
+            raise RuntimeError("uvicorn did not start in time")
+        self._sampler = threading.Thread(target=self._sample_rss, daemon=True)
+        self._sampler.start()
+
+    def _pids(self):
+        pids = [self.process.pid]
+        try:
+            with open(f"/proc/{self.process.pid}/task/{self.process.pid}/children") as children:
+                pids.extend(int(pid) for pid in children.read().split())
+        except OSError:
+            pass
+        return pids
+
+    def _sample_rss(self):
+        # VmHWM is the kernel's own high-water mark; summed over uvicorn's worker processes
+        while not self._stop.wait(0.25):
+            values = [_rss_kib(pid, "VmHWM") for pid in self._pids()]
+            values = [value for value in values if value is not None]
+            if values:
+                self.peak_rss_kib = max(self.peak_rss_kib or 0, sum(values))
+
+    def rss_kib(self):
+        values = [_rss_kib(pid, "VmRSS") for pid in self._pids()]
+        values = [value for value in values if value is not None]
+        return sum(values) if values else None
+
+    def stop(self):
+        self._stop.set()
+        if self._sampler is not None:
+            self._sampler.join()
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        if self.peak_rss_kib is None:
+            # Not on Linux: fall back to the largest reaped child (kilobytes on Linux, bytes on macOS)
+            maxrss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+            self.peak_rss_kib = maxrss // 1024 if sys.platform == "darwin" else maxrss
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
@@ -0,0 +1,100 @@
+import json
+import os
+import random
+import struct
+import zlib
+
+# Synthetic banks in the /import JSON format. Generation is seeded, so the
+# same arguments always produce byte-identical files and runs on different
+# commits measure the same data.
+
+_SYLLABLES = (
+    "ka", "lo", "mi", "ne", "ru", "sa", "ti", "vo", "ze", "pa", "qui", "dor",
+    "fen", "gal", "hos", "jun", "mar", "nol", "pri", "sto", "tex", "ul", "vin", "wex",
+)
+
+
+def _vocabulary(rng, size=5000):
+    return [
+        "".join(rng.choice(_SYLLABLES) for _ in range(rng.randint(1, 4)))
+        for _ in range(size)
+    ]
+
+
+def _sentence(rng, vocabulary, low, high):
+    return " ".join(rng.choice(vocabulary) for _ in range(rng.randint(low, high)))
+
+
+def png_bytes(index, size=16):
+    """A valid, unique, tiny grayscale PNG."""
+    rng = random.Random(index)
+    raw = b"".join(b"\x00" + bytes(rng.randrange(256) for _ in range(size)) for _ in range(size))
+
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", struct.pack(">IIBBBBB", size, size, 8, 0, 0, 0, 0))
+        + chunk(b"IDAT", zlib.compress(raw))
+        + chunk(b"IEND", b"")
+    )
+
+
+def image_names(image_count):
+    return [f"img{index:05d}.png" for index in range(image_count)]
+
+
+def write_images(directory, image_count):
+    os.makedirs(directory, exist_ok=True)
+    for index, name in enumerate(image_names(image_count)):
+        path = os.path.join(directory, name)
+        if not os.path.exists(path):
+            with open(path, "wb") as out:
+                out.write(png_bytes(index))
+
+
+def iter_questions(question_count, seed=0, options=4, image_count=0, image_ratio=0.2):
+    rng = random.Random(seed)
+    vocabulary = _vocabulary(rng)
+    images = image_names(image_count)
+    for index in range(question_count):
+        multiple = rng.random() < 0.15
+        correct = set(rng.sample(range(options), 2 if multiple else 1))
+        question = {
+            # The index keeps every question distinct, so import-time dedup does not drop any
+            "question": f"{index}: {_sentence(rng, vocabulary, 8, 30)}?",
+            "explanation": _sentence(rng, vocabulary, 15, 60),
+            "options": [
+                {"text": _sentence(rng, vocabulary, 2, 10), "is_correct": i in correct}
+                for i in range(options)
+            ],
+        }
+        if images and rng.random() < image_ratio:
+            question["question_images"] = [rng.choice(images)]
+            question["explanation_images"] = [rng.choice(images)]
+            question["options"][0]["image"] = rng.choice(images)
+        yield question
+
+
+def write_bank(path, question_count, exam_code="BENCH", exam_name=None, seed=0, options=4, image_count=0):
+    """Stream a bank of question_count questions to path without holding it in memory."""
+    exam_name = exam_name or f"Benchmark {exam_code} ({question_count} questions)"
+    with open(path, "w", encoding="utf-8") as out:
+        out.write(json.dumps({"exam_name": exam_name, "exam_code": exam_code})[:-1])
+        out.write(', "questions": [\n')
+        for index, question in enumerate(iter_questions(question_count, seed, options, image_count)):
+            if index:
+                out.write(",\n")
+            out.write(json.dumps(question))
+        out.write("\n]}\n")
+    return {
+        "path": path,
+        "exam_name": exam_name,
+        "exam_code": exam_code,
+        "questions": question_count,
+        "options_per_question": options,
+        "images": image_count,
+        "seed": seed,
+        "bytes": os.path.getsize(path),
+    }
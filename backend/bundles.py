@@ -0,0 +1,151 @@
+import itertools
+import logging
+import os
+import posixpath
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# A bundle is a ZIP holding one questions JSON file (in the /import format)
+# and an images/ folder with the files its questions reference by name.
+# Images are streamed out of the archive into the image store by a small
+# thread pool while the questions are being inserted.
+
+IMAGE_FOLDER = "images"
+CHUNK_SIZE = 256 * 1024
+MAX_IMAGE_BYTES = 32 * 1024 * 1024
+MAX_REPORTED_MISSING = 100
+SNIFF_BYTES = 1024
+
+
+class BundleError(ValueError):
+    pass
+
+
+def is_bundle(path):
+    return path.lower().endswith(".zip")
+
+
+def sniff_image(head):
+    """Content type from an image's leading bytes, or None if it is not a supported image."""
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if head.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return "image/gif"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    text = head.lstrip(b"\xef\xbb\xbf \t\r\n")
+    if (text.startswith(b"<?xml") or text.startswith(b"<svg")) and b"<svg" in head:
+        return "image/svg+xml"
+    return None
+
+
+def referenced_images(question):
+    """File names an imported question refers to."""
+    for key in ("question_images", "explanation_images"):
+        names = question.get(key)
+        if isinstance(names, list):
+            yield from (name for name in names if isinstance(name, str) and name)
+    for option in question.get("options") or ():
+        if isinstance(option, dict) and isinstance(option.get("image"), str) and option["image"]:
+            yield option["image"]
+
+
+def _hidden(name):
+    return any(part.startswith(".") or part == "__MACOSX" for part in name.split("/"))
+
+
+class Bundle:
+    """An uploaded ZIP bundle, read in place from the (seekable) upload file."""
+
+    def __init__(self, path):
+        try:
+            self.zip = zipfile.ZipFile(path)
+        except zipfile.BadZipFile as e:
+            raise BundleError(f"Invalid ZIP bundle: {e}")
+        self._open_lock = threading.Lock()
+        self._pool = None
+        self.created = []
+
+        questions = []
+        self.images = {}
+        for info in self.zip.infolist():
+            name = info.filename
+            if info.is_dir() or _hidden(name):
+                continue
+            folder, base = posixpath.split(name)
+            if posixpath.basename(folder) == IMAGE_FOLDER:
+                if base in self.images:
+                    raise BundleError(f"Image {base} appears more than once in the bundle")
+                if info.file_size > MAX_IMAGE_BYTES:
+                    raise BundleError(f"Image {name} is larger than {MAX_IMAGE_BYTES} bytes")
+                self.images[base] = info
+            elif base.lower().endswith(".json"):
+                questions.append(info)
+        if not questions:
+            raise BundleError("The bundle contains no questions JSON file.")
+        depth = min(info.filename.count("/") for info in questions)
+        top = [info for info in questions if info.filename.count("/") == depth]
+        if len(top) > 1:
+            raise BundleError(f"The bundle contains more than one questions file: {', '.join(i.filename for i in top)}")
+        self.questions = top[0]
+
+    def _open(self, info):
+        # Members are read concurrently; ZipFile.open itself is not thread-safe
+        with self._open_lock:
+            return self.zip.open(info)
+
+    def open_questions(self):
+        """Seekable stream over the questions JSON, decompressed on the fly."""
+        return self._open(self.questions)
+
+    def _store_image(self, store, info):
+        with self._open(info) as src:
+            head = src.read(SNIFF_BYTES)
+            content_type = sniff_image(head)
+            if content_type is None:
+                raise BundleError(f"{info.filename} is not a PNG, JPEG, GIF, WebP or SVG image")
+            chunks = itertools.chain((head,), iter(lambda: src.read(CHUNK_SIZE), b""))
+            try:
+                digest, size, created = store.store_chunks(chunks, max_bytes=MAX_IMAGE_BYTES)
+            except zipfile.BadZipFile as e:
+                raise BundleError(f"{info.filename} is corrupt: {e}")
+        if created:
+            self.created.append(digest)
+        return digest, size, content_type
+
+    def store_images(self, store, workers=4):
+        """Start extracting, validating and hashing every image; returns {name: future}."""
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bundle")
+        return {name: self._pool.submit(self._store_image, store, info) for name, info in self.images.items()}
+
+    def register_images(self, cursor, store, exam_code, pending):
+        """Wait for the extracted images and map their names for exam_code; returns how many."""
+        for name, future in pending.items():
+            digest, size, content_type = future.result()
+            store.register(cursor, exam_code, name, digest, size, content_type=content_type)
+        return len(pending)
+
+    def close(self, store=None, discard=False):
+        """Stop the extraction pool; with discard, remove blobs this bundle added but never registered."""
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+        self.zip.close()
+        if discard and store is not None:
+            removed = sum(1 for digest in self.created if store.discard(digest))
+            if removed:
+                logger.info("Removed %d images from a failed bundle import", removed)
+
+
+def missing_images(cursor, exam_code, referenced, bundled, exams_root="exams"):
+    """Referenced names that are neither in the bundle, already stored, nor hand-copied; sorted."""
+    missing = set(referenced) - set(bundled)
+    if missing:
+        stored = {row[0] for row in cursor.execute("SELECT name FROM image_names WHERE exam_code = ?", (exam_code,))}
+        folder = os.path.join(exams_root, exam_code, IMAGE_FOLDER)
+        missing = {name for name in missing - stored if not os.path.isfile(os.path.join(folder, name))}
+    return sorted(missing)
@@ -0,0 +1,144 @@
+import logging
+import os
+import threading
+from contextlib import contextmanager
+
+from starlette.concurrency import run_in_threadpool
+
+try:
+    import fcntl
+except ImportError:  # optional: without it every worker runs start-up work itself
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# With several uvicorn workers (or the command-line tools writing next to a
+# running server) each process has its own caches. Writers bump
+# a shared generation counter (cache_generation) in the same transaction as
+# the change; every worker notices it through PRAGMA data_version, which only
+# moves when another connection has committed, and then re-checks the banks'
+# content versions.
+
+
+def bump_generation(cursor):
+    cursor.execute("UPDATE cache_generation SET generation = generation + 1 WHERE id = 1")
+
+
+def read_generation(conn):
+    row = conn.execute("SELECT generation FROM cache_generation WHERE id = 1").fetchone()
+    return row[0] if row else 0
+
+
+class ChangeMonitor:
+    """Invalidates this process's caches after other processes change banks.
+
+    check() is cheap enough to run on every request: one PRAGMA when nothing
+    was committed elsewhere, plus one primary-key read when something was.
+    Banks are only compared when the generation counter moved.
+    """
+
+    def __init__(self, database, on_bank_changed, on_change=None):
+        self.database = database
+        self.on_bank_changed = on_bank_changed
+        self.on_change = on_change
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._generation = None
+        self._versions = {}
+
+    def check(self):
+        conn = self.database.connection()
+        data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+        if getattr(self._local, "data_version", None) == data_version:
+            return False
+        self._local.data_version = data_version
+        generation = read_generation(conn)
+        if generation == self._generation:
+            return False
+        with self._lock:
+            if generation == self._generation:
+                return False
+            versions = dict(conn.execute(
+                "SELECT id, content_version FROM test_banks WHERE deleted_at IS NULL"
+            ).fetchall())
+            first = self._generation is None
+            # Banks created, changed or deleted since the last check
+            changed = [
+                bank_id for bank_id in self._versions.keys() | versions.keys()
+                if versions.get(bank_id) != self._versions.get(bank_id)
+            ]
+            self._versions = versions
+            self._generation = generation
+        if first:
+            return False
+        for bank_id in changed:
+            self.on_bank_changed(bank_id)
+        if self.on_change is not None:
+            self.on_change()
+        logger.debug("Generation %d: invalidated %d banks", generation, len(changed))
+        return True
+
+
+class CoherenceMiddleware:
+    """Runs ChangeMonitor.check() before each HTTP request.
+
+    The check queries SQLite, so it runs in the threadpool rather than
+    blocking the event loop.
+    """
+
+    def __init__(self, app, monitor):
+        self.app = app
+        self.monitor = monitor
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            await run_in_threadpool(self.monitor.check)
+        await self.app(scope, receive, send)
+
+
+_claims = []
+
+
+def claim(path, shared=False):
+    """Lock path for the life of the process; returns False if another process holds a conflicting lock.
+
+    A process that keeps its caches to itself claims the lock exclusively, and
+    workers running in multi-worker mode claim it shared, so a server started
+    with several workers but without multi-worker mode is caught by its
+    second worker. Where fcntl is unavailable the claim always succeeds.
+    """
+    if fcntl is None:
+        return True
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, (fcntl.LOCK_SH if shared else fcntl.LOCK_EX) | fcntl.LOCK_NB)
+    except BlockingIOError:
+        os.close(fd)
+        return False
+    _claims.append(fd)
+    return True
+
+
+@contextmanager
+def exclusive(path, blocking=True):
+    """Hold an advisory lock on path across processes; yields whether it was acquired.
+
+    Used so start-up work runs once per deployment rather than once per
+    worker. Where fcntl is unavailable the lock is always "acquired".
+    """
+    if fcntl is None:
+        yield True
+        return
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+    finally:
+        os.close(fd)
@@ -0,0 +1,187 @@
+import re
+import unicodedata
+import zlib
+from array import array
+from collections import Counter
+from itertools import groupby
+
+# Near-duplicate detection for imports. Each question is reduced to a set of
+# shingles (character 4-grams of its normalized question and option text), which is
+# summarised by a one-permutation MinHash signature: every shingle is hashed
+# once and the hash picks both a bin and a value, so signing is linear in the
+# text length. Signatures are cut into bands; questions sharing any band
+# bucket are candidates, and only candidates are compared, so checking an
+# incoming question costs O(bands) dict lookups instead of a bank scan.
+# A signature also carries a fingerprint of the correct answers, and two
+# questions only count as duplicates if those are identical: the same
+# question with a different answer key is a different question.
+
+SHINGLE_CHARS = 4
+NUM_BINS = 64
+BANDS = 16
+ROWS = NUM_BINS // BANDS
+DEFAULT_THRESHOLD = 0.8
+# Templated banks (e.g. every question answered "True"/"False") can pile
+# thousands of questions into one bucket; past this size a bucket stops
+# growing so lookups stay bounded instead of degrading to a bank scan
+MAX_BUCKET_SIZE = 64
+# Only questions sharing at least this many bands are compared, best first,
+# and at most MAX_CANDIDATES of them. At the default threshold a true match
+# shares about 6 of the 16 bands, so requiring 2 costs well under 1% recall.
+MIN_BAND_HITS = 2
+MAX_CANDIDATES = 8
+
+_VALUE_MASK = 0xFFFFFFFF
+_VALUE_SHIFT = 32 - (NUM_BINS.bit_length() - 1)
+_EMPTY = _VALUE_MASK + 1
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+
+def normalize(text):
+    text = unicodedata.normalize("NFKC", text or "").casefold()
+    return " ".join(_WORD.findall(text))
+
+
+def _grams(text):
+    return {text[i:i + SHINGLE_CHARS] for i in range(max(1, len(text) - SHINGLE_CHARS + 1))}
+
+
+def shingles(question_text, option_texts):
+    result = _grams(normalize(question_text))
+    # Option grams are kept apart from question grams and unordered, so
+    # reshuffled answers still match but a different answer set does not
+    for option in option_texts:
+        result.update("\x1f" + gram for gram in _grams(normalize(option)))
+    return result
+
+
+def answer_fingerprint(option_texts, is_correct):
+    """Order-independent hash of the normalized texts of the correct options."""
+    correct = sorted(normalize(text) for text, flag in zip(option_texts, is_correct) if flag)
+    return zlib.crc32("\x1f".join(correct).encode()) if correct else 0
+
+
+def signature(question_text, option_texts, is_correct):
+    """MinHash of the question and option text, followed by its answer fingerprint."""
+    answers = answer_fingerprint(option_texts, is_correct)
+    bins = [_EMPTY] * NUM_BINS
+    for shingle in shingles(question_text, option_texts):
+        # CRC32 scrambled by an odd multiplier: cheap, stable across processes,
+        # and its top bits pick the bin as in classic one-permutation hashing
+        h = zlib.crc32(shingle.encode()) * 0x9E3779B1 & _VALUE_MASK
+        index = h >> _VALUE_SHIFT
+        if h < bins[index]:
+            bins[index] = h
+    # Densify: an empty bin borrows from the next filled one, offset by the
+    # distance so that two texts only agree there if they agree on the source
+    if all(value == _EMPTY for value in bins):
+        return array("I", [0] * NUM_BINS + [answers])
+    original = list(bins)
+    for i in range(NUM_BINS):
+        if original[i] == _EMPTY:
+            distance = 1
+            while original[(i + distance) % NUM_BINS] == _EMPTY:
+                distance += 1
+            bins[i] = (original[(i + distance) % NUM_BINS] + distance * 0x9E3779B1) & _VALUE_MASK
+    return array("I", bins + [answers])
+
+
+def similarity(a, b):
+    """Estimated Jaccard similarity of the shingle sets behind two signatures."""
+    return sum(a[i] == b[i] for i in range(NUM_BINS)) / NUM_BINS
+
+
+class LSHIndex:
+    """Banded MinHash index of one bank's questions."""
+
+    def __init__(self, threshold=DEFAULT_THRESHOLD):
+        self.threshold = threshold
+        self._signatures = {}
+        self._buckets = [{} for _ in range(BANDS)]
+
+    def __len__(self):
+        return len(self._signatures)
+
+    @staticmethod
+    def _bands(sig):
+        for band in range(BANDS):
+            yield band, tuple(sig[band * ROWS:(band + 1) * ROWS])
+
+    def add(self, question_id, sig):
+        self._signatures[question_id] = sig
+        for band, key in self._bands(sig):
+            bucket = self._buckets[band].setdefault(key, [])
+            if len(bucket) < MAX_BUCKET_SIZE:
+                bucket.append(question_id)
+
+    def find(self, sig):
+        """Return (question_id, similarity) of the closest indexed question at or above the threshold."""
+        hits = Counter()
+        for band, key in self._bands(sig):
+            hits.update(self._buckets[band].get(key, ()))
+        best = None
+        for question_id, count in hits.most_common(MAX_CANDIDATES):
+            if count < MIN_BAND_HITS:
+                break
+            other = self._signatures[question_id]
+            if other[NUM_BINS] != sig[NUM_BINS]:
+                continue
+            score = similarity(sig, other)
+            if score >= self.threshold and (best is None or score > best[1]):
+                best = (question_id, score)
+        return best
+
+
+def store(cursor, rows):
+    """Persist (question_id, signature) rows so later imports need not re-sign the bank."""
+    cursor.executemany(
+        "INSERT OR REPLACE INTO question_signatures (question_id, signature) VALUES (?, ?)",
+        [(question_id, sig.tobytes()) for question_id, sig in rows]
+    )
+
+
+def delete_questions(cursor, question_ids):
+    cursor.executemany("DELETE FROM question_signatures WHERE question_id = ?", ((qid,) for qid in question_ids))
+
+
+def delete_orphans(cursor, limit):
+    """Drop up to ``limit`` signatures whose question no longer exists; returns how many."""
+    cursor.execute("""
+        DELETE FROM question_signatures WHERE question_id IN (
+            SELECT question_id FROM question_signatures s
+            WHERE NOT EXISTS (SELECT 1 FROM questions q WHERE q.id = s.question_id) LIMIT ?
+        )
+    """, (limit,))
+    return cursor.rowcount
+
+
+def load_index(cursor, test_bank_id, threshold=DEFAULT_THRESHOLD):
+    """Build the LSH index for a bank from stored signatures, signing any questions that lack one."""
+    index = LSHIndex(threshold)
+    cursor.execute("""
+        SELECT q.id, s.signature FROM questions q
+        JOIN question_signatures s ON s.question_id = q.id
+        WHERE q.test_bank_id = ?
+    """, (test_bank_id,))
+    for question_id, blob in cursor.fetchall():
+        sig = array("I")
+        sig.frombytes(blob)
+        index.add(question_id, sig)
+
+    # Questions written by the bulk loader or before signatures existed
+    cursor.execute("""
+        SELECT q.id, q.question_text, o.option_text, o.is_correct FROM questions q
+        LEFT JOIN options o ON o.question_id = q.id
+        WHERE q.test_bank_id = ?
+          AND NOT EXISTS (SELECT 1 FROM question_signatures s WHERE s.question_id = q.id)
+        ORDER BY q.id, o.id
+    """, (test_bank_id,))
+    missing = []
+    for (question_id, question_text), rows in groupby(cursor.fetchall(), key=lambda row: row[:2]):
+        options = [(text, correct) for _, _, text, correct in rows if text]
+        sig = signature(question_text, [text for text, _ in options], [correct for _, correct in options])
+        index.add(question_id, sig)
+        missing.append((question_id, sig))
+    if missing:
+        store(cursor, missing)
+    return index
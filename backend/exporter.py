@@ -0,0 +1,91 @@
+import json
+import zlib
+
+import http_cache
+
+# Banks are written back out in the /import JSON format, one question at a
+# time from a single cursor, so memory stays flat however large the bank is.
+
+CHUNK_BYTES = 64 * 1024
+
+
+def _image_list(value):
+    return json.loads(value) if value else []
+
+
+def _question(row, options):
+    question_text, explanation, question_images, explanation_images = row
+    return {
+        "question": question_text,
+        "question_images": _image_list(question_images),
+        "options": options,
+        "explanation": explanation,
+        "explanation_images": _image_list(explanation_images),
+    }
+
+
+def iter_questions(conn, test_bank_id):
+    """Yield a bank's questions as import-format dicts, in id order."""
+    rows = conn.execute("""
+        SELECT q.id, q.question_text, q.explanation, q.question_images, q.explanation_images,
+               o.option_text, o.is_correct, o.image
+        FROM questions q
+        LEFT JOIN options o ON o.question_id = q.id
+        WHERE q.test_bank_id = ?
+        ORDER BY q.id, o.id
+    """, (test_bank_id,))
+    current_id = None
+    current = None
+    options = []
+    for row in rows:
+        if row[0] != current_id:
+            if current is not None:
+                yield _question(current, options)
+            current_id, current, options = row[0], row[1:5], []
+        if row[5] is not None:
+            option = {"text": row[5], "is_correct": bool(row[6])}
+            if row[7]:
+                option["image"] = row[7]
+            options.append(option)
+    if current is not None:
+        yield _question(current, options)
+
+
+def iter_export(conn, test_bank_id, chunk_bytes=CHUNK_BYTES):
+    """Yield the bank as an /import-compatible JSON document in chunks of about chunk_bytes.
+
+    Everything is read inside one read transaction, so the export is a
+    consistent snapshot even while answers or imports are being written.
+    """
+    conn.execute("BEGIN")
+    try:
+        bank = conn.execute(
+            "SELECT name, exam_code FROM test_banks WHERE id = ? AND deleted_at IS NULL", (test_bank_id,)
+        ).fetchone()
+        if bank is None:
+            return
+        buffer = bytearray(b'{"exam_name":' + http_cache.dumps(bank[0]) + b',"exam_code":'
+                           + http_cache.dumps(bank[1]) + b',"questions":[')
+        first = True
+        for question in iter_questions(conn, test_bank_id):
+            if not first:
+                buffer += b",\n"
+            first = False
+            buffer += http_cache.dumps(question)
+            if len(buffer) >= chunk_bytes:
+                yield bytes(buffer)
+                buffer.clear()
+        buffer += b"]}\n"
+        yield bytes(buffer)
+    finally:
+        conn.rollback()
+
+
+def gzip_stream(chunks, level=6):
+    """Compress a stream of byte chunks into one gzip member as it goes."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
@@ -0,0 +1,174 @@
+import gzip
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+from starlette.responses import Response
+
+try:
+    import brotli
+except ImportError:  # optional: gzip is always available
+    brotli = None
+
+try:
+    import orjson
+except ImportError:  # optional: falls back to the stdlib encoder
+    orjson = None
+
+# Bodies smaller than this are sent uncompressed
+MIN_COMPRESS_BYTES = 1024
+
+
+def dumps(obj):
+    """Serialize plain JSON data straight to bytes, bypassing FastAPI's generic encoder."""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def content_etag(body):
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+def version_etag(*parts):
+    """Opaque strong ETag for a response identified by its inputs rather than its bytes."""
+    key = "|".join("" if part is None else str(part) for part in parts)
+    return '"' + hashlib.blake2b(key.encode("utf-8"), digest_size=12).hexdigest() + '"'
+
+
+def encoded_etag(etag, encoding):
+    """The ETag of one encoding of a response: each byte representation needs its own strong validator."""
+    return etag if not encoding else etag[:-1] + "-" + encoding + '"'
+
+
+def _base_etag(candidate):
+    if candidate.startswith("W/"):
+        candidate = candidate[2:]
+    for encoding in ("br", "gzip"):
+        suffix = "-" + encoding + '"'
+        if candidate.endswith(suffix):
+            return candidate[:-len(suffix)] + '"'
+    return candidate
+
+
+def matching_etag(request, etag):
+    """Return the If-None-Match tag naming a representation of ``etag`` (any encoding), or None."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return None
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return etag
+        if _base_etag(candidate) == etag:
+            return candidate[2:] if candidate.startswith("W/") else candidate
+    return None
+
+
+def etag_matches(request, etag):
+    return matching_etag(request, etag) is not None
+
+
+def choose_encoding(request, supported=("br", "gzip")):
+    accepted = {}
+    for part in request.headers.get("accept-encoding", "").split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if name:
+            accepted[name.lower()] = q
+    if brotli is not None and "br" in supported and accepted.get("br", 0) > 0:
+        return "br"
+    if "gzip" in supported and accepted.get("gzip", 0) > 0:
+        return "gzip"
+    return None
+
+
+def compress(body, encoding):
+    if encoding == "br":
+        return brotli.compress(body, quality=5)
+    return gzip.compress(body, compresslevel=6)
+
+
+class ResponseCache:
+    """LRU of encoded response bodies keyed by (test_bank_id, ...variant), bounded in bytes."""
+
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    @property
+    def size(self):
+        return self._size
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, body, encoding):
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= len(old[0])
+            self._entries[key] = (body, encoding)
+            self._size += len(body)
+            while self._size > self.max_bytes:
+                _, (evicted, _) = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+    def invalidate(self, test_bank_id=None):
+        with self._lock:
+            if test_bank_id is None:
+                self._entries.clear()
+                self._size = 0
+                return
+            for key in [key for key in self._entries if key[0] == test_bank_id]:
+                self._size -= len(self._entries.pop(key)[0])
+
+
+def json_response(request, etag, build, cache=None, cache_key=None):
+    """Conditional, compressed JSON response.
+
+    ``build`` returns the uncompressed body bytes and is only called when the
+    client's ETag is stale and no encoded body is cached for ``cache_key``.
+    The ETag sent carries the Content-Encoding as a suffix, which is ignored
+    when comparing If-None-Match.
+    """
+    headers = {"Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+    matched = matching_etag(request, etag)
+    if matched is not None:
+        # The client's copy is current, whichever encoding it holds
+        headers["ETag"] = matched
+        return Response(status_code=304, headers=headers)
+
+    encoding = choose_encoding(request)
+    key = None if cache is None else cache_key + (etag, encoding)
+    entry = cache.get(key) if key is not None else None
+    if entry is None:
+        body = build()
+        used_encoding = None
+        if encoding and len(body) >= MIN_COMPRESS_BYTES:
+            body = compress(body, encoding)
+            used_encoding = encoding
+        if key is not None:
+            cache.put(key, body, used_encoding)
+    else:
+        body, used_encoding = entry
+
+    headers["ETag"] = encoded_etag(etag, used_encoding)
+    if used_encoding:
+        headers["Content-Encoding"] = used_encoding
+    return Response(content=body, media_type="application/json", headers=headers)
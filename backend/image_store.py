@@ -0,0 +1,413 @@
+import argparse
+import hashlib
+import logging
+import mimetypes
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+
+from starlette.responses import FileResponse, Response
+
+import http_cache
+from bank_cache import bump_content_version, image_url as legacy_image_url
+
+try:
+    from PIL import Image
+except ImportError:  # optional: renditions are skipped without Pillow
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+# Content-addressed image blobs shared by every exam. A blob lives at
+# <root>/<first two hex digits>/<digest> and is never modified, so its URL
+# can be cached forever. image_names maps the (exam_code, file name) pairs
+# used in question data onto blobs; names that are not mapped yet keep their
+# legacy /exams/... URL.
+
+DIGEST_SIZE = 16
+CHUNK_SIZE = 1024 * 1024
+IMMUTABLE = "public, max-age=31536000, immutable"
+RENDITION_FORMATS = {"JPEG", "PNG", "WEBP"}
+# Uploaded SVGs may carry scripts; never let them run or be sniffed as HTML
+SAFE_HEADERS = {"X-Content-Type-Options": "nosniff", "Content-Security-Policy": "default-src 'none'; style-src 'unsafe-inline'; sandbox"}
+
+_FILENAME = re.compile(r"^([0-9a-f]{32})(\.[A-Za-z0-9]{1,8})?$")
+
+
+def parse_filename(filename):
+    """Return the digest from a /images/{digest}{ext} file name, or None."""
+    match = _FILENAME.match(filename)
+    return match.group(1) if match else None
+
+
+def parse_range(header, size):
+    """Parse a single "bytes=" range into inclusive (start, end); None if absent, unsupported or unsatisfiable."""
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    start, _, end = header[6:].strip().partition("-")
+    try:
+        if not start:
+            length = int(end)
+            if length <= 0:
+                return None
+            return max(0, size - length), size - 1
+        start = int(start)
+        end = int(end) if end else size - 1
+    except ValueError:
+        return None
+    if start >= size or end < start:
+        return None
+    return start, min(end, size - 1)
+
+
+class ImageStore:
+    def __init__(self, database, root, rendition_widths=()):
+        self.database = database
+        self.root = root
+        self.rendition_widths = tuple(sorted(rendition_widths))
+        self._urls = {}
+        self._lock = threading.Lock()
+
+    def blob_path(self, digest, width=None):
+        name = digest if width is None else f"{digest}-w{width}"
+        return os.path.join(self.root, digest[:2], name)
+
+    def _write_blob(self, digest, source_path):
+        path = self.blob_path(digest)
+        if os.path.exists(path):
+            return path
+        with open(source_path, "rb") as src:
+            chunks = iter(lambda: src.read(CHUNK_SIZE), b"")
+            fd, tmp = self._spool(chunks)
+        os.close(fd)
+        self._publish(digest, tmp)
+        return path
+
+    def _spool(self, chunks, digest=None, max_bytes=None):
+        """Write chunks to a temp file inside the store (so it can be renamed into place); returns (fd, path)."""
+        os.makedirs(self.root, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.root, prefix=".tmp-")
+        try:
+            size = 0
+            for chunk in chunks:
+                size += len(chunk)
+                if max_bytes is not None and size > max_bytes:
+                    raise ValueError(f"image is larger than {max_bytes} bytes")
+                if digest is not None:
+                    digest.update(chunk)
+                os.write(fd, chunk)
+        except BaseException:
+            os.close(fd)
+            os.remove(tmp)
+            raise
+        return fd, tmp
+
+    def _publish(self, digest, tmp):
+        """Move a spooled temp file into place as the blob for digest; returns whether it was new."""
+        path = self.blob_path(digest)
+        if os.path.exists(path):
+            os.remove(tmp)
+            return False
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Blobs are never modified in place; a changed image is a new blob
+            os.chmod(tmp, 0o444)
+            os.replace(tmp, path)
+        except BaseException:
+            os.remove(tmp)
+            raise
+        self._write_renditions(digest, path)
+        return True
+
+    def store_chunks(self, chunks, max_bytes=None):
+        """Hash and store a stream of byte chunks without an intermediate copy; returns (digest, size, created)."""
+        hasher = hashlib.blake2b(digest_size=DIGEST_SIZE)
+        fd, tmp = self._spool(chunks, hasher, max_bytes)
+        size = os.fstat(fd).st_size
+        os.close(fd)
+        digest = hasher.hexdigest()
+        return digest, size, self._publish(digest, tmp)
+
+    def discard(self, digest):
+        """Remove a blob and its renditions unless the images table references it."""
+        if self.database.connection().execute("SELECT 1 FROM images WHERE digest = ?", (digest,)).fetchone():
+            return False
+        for width in (None,) + self.rendition_widths:
+            try:
+                os.remove(self.blob_path(digest, width))
+            except FileNotFoundError:
+                pass
+        return True
+
+    def _write_renditions(self, digest, path):
+        if Image is None or not self.rendition_widths:
+            return
+        try:
+            with Image.open(path) as image:
+                if image.format not in RENDITION_FORMATS:
+                    return
+                for width in self.rendition_widths:
+                    if image.width <= width:
+                        break
+                    height = max(1, round(image.height * width / image.width))
+                    target = self.blob_path(digest, width)
+                    tmp = target + ".tmp"
+                    image.resize((width, height)).save(tmp, format=image.format)
+                    os.chmod(tmp, 0o444)
+                    os.replace(tmp, target)
+        except Exception:
+            logger.warning("Could not create renditions for %s", digest, exc_info=True)
+
+    @staticmethod
+    def hash_file(path):
+        digest = hashlib.blake2b(digest_size=DIGEST_SIZE)
+        with open(path, "rb") as src:
+            while True:
+                chunk = src.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def add_file(self, cursor, exam_code, name, path, digest=None):
+        """Store a copy of a file as a blob and map (exam_code, name) to it; returns the digest.
+
+        The original stays a private, writable file, so it can be edited or
+        copied over and the next sweep stores the new version as a new blob.
+        """
+        digest = digest or self.hash_file(path)
+        blob = self._write_blob(digest, path)
+        self.register(cursor, exam_code, name, digest, os.stat(blob).st_size, source_mtime=os.stat(path).st_mtime)
+        return digest
+
+    def _is_blob(self, stat, digest):
+        try:
+            blob = os.stat(self.blob_path(digest))
+        except FileNotFoundError:
+            return False
+        return (stat.st_dev, stat.st_ino) == (blob.st_dev, blob.st_ino)
+
+    @staticmethod
+    def _detach(path):
+        """Replace a file hard-linked to a blob (as earlier versions left them) with a private, writable copy."""
+        tmp = path + ".copy"
+        try:
+            shutil.copyfile(path, tmp)
+            os.replace(tmp, path)
+        except OSError:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+    def register(self, cursor, exam_code, name, digest, size, content_type=None, source_mtime=None):
+        """Map (exam_code, name) onto a stored blob."""
+        ext = os.path.splitext(name)[1].lower()
+        content_type = content_type or mimetypes.guess_type(name)[0] or "application/octet-stream"
+        cursor.execute("""
+            INSERT OR IGNORE INTO images (digest, ext, content_type, size, created_at)
+            VALUES (?, ?, ?, ?, ?)
+        """, (digest, ext, content_type, size, time.time()))
+        cursor.execute("""
+            INSERT OR REPLACE INTO image_names (exam_code, name, digest, source_mtime)
+            VALUES (?, ?, ?, ?)
+        """, (exam_code, name, digest, source_mtime))
+        with self._lock:
+            self._urls.pop((exam_code, name), None)
+
+    def release_exam(self, cursor, exam_code):
+        """Unmap every name for an exam code; returns digests no name refers to any more.
+
+        Their images rows are deleted too; call discard() for each after commit
+        to remove the files.
+        """
+        digests = [row[0] for row in cursor.execute(
+            "SELECT DISTINCT digest FROM image_names WHERE exam_code = ?", (exam_code,)
+        ).fetchall()]
+        cursor.execute("DELETE FROM image_names WHERE exam_code = ?", (exam_code,))
+        with self._lock:
+            for key in [key for key in self._urls if key[0] == exam_code]:
+                del self._urls[key]
+        return self._drop_unreferenced(cursor, digests)
+
+    def _drop_unreferenced(self, cursor, digests):
+        freed = [
+            digest for digest in digests
+            if cursor.execute("SELECT 1 FROM image_names WHERE digest = ? LIMIT 1", (digest,)).fetchone() is None
+        ]
+        cursor.executemany("DELETE FROM images WHERE digest = ?", ((digest,) for digest in freed))
+        return freed
+
+    def delete_orphans(self, cursor):
+        """Unmap names of exam codes no bank uses and drop unreferenced images; returns the freed digests."""
+        codes = [row[0] for row in cursor.execute("""
+            SELECT DISTINCT exam_code FROM image_names
+            WHERE exam_code NOT IN (SELECT exam_code FROM test_banks)
+        """).fetchall()]
+        freed = []
+        for exam_code in codes:
+            freed.extend(self.release_exam(cursor, exam_code))
+        unreferenced = [row[0] for row in cursor.execute(
+            "SELECT digest FROM images WHERE digest NOT IN (SELECT digest FROM image_names)"
+        ).fetchall()]
+        return freed + self._drop_unreferenced(cursor, unreferenced)
+
+    def delete_stray_files(self, min_age=3600):
+        """Remove blob files with no images row, e.g. left by a crash; returns how many.
+
+        Files younger than min_age are kept: an import may not have committed them yet.
+        """
+        known = {row[0] for row in self.database.connection().execute("SELECT digest FROM images")}
+        removed = 0
+        cutoff = time.time() - min_age
+        for folder, _, files in os.walk(self.root):
+            for name in files:
+                path = os.path.join(folder, name)
+                if name.split("-w", 1)[0] in known or os.path.getmtime(path) >= cutoff:
+                    continue
+                os.remove(path)
+                removed += 1
+        return removed
+
+    def ingest_directory(self, cursor, exam_code, directory):
+        """Add new or changed files from an exam's legacy images directory; returns how many."""
+        try:
+            entries = [entry for entry in os.scandir(directory) if entry.is_file() and not entry.name.startswith(".")]
+        except FileNotFoundError:
+            return 0
+        known = {name: (digest, mtime) for name, digest, mtime in cursor.execute(
+            "SELECT name, digest, source_mtime FROM image_names WHERE exam_code = ?", (exam_code,)
+        )}
+        added = 0
+        for entry in entries:
+            stat = entry.stat()
+            digest, known_mtime = known.get(entry.name, (None, None))
+            if digest and stat.st_nlink > 1 and self._is_blob(stat, digest):
+                self._detach(entry.path)
+                cursor.execute(
+                    "UPDATE image_names SET source_mtime = ? WHERE exam_code = ? AND name = ?",
+                    (os.stat(entry.path).st_mtime, exam_code, entry.name),
+                )
+                continue
+            if known_mtime == stat.st_mtime:
+                continue
+            self.add_file(cursor, exam_code, entry.name, entry.path)
+            added += 1
+        return added
+
+    def sweep(self, exams_root, on_change=None):
+        """Ingest every exams/<code>/images directory, one transaction per exam.
+
+        Banks whose images were (re)mapped get their content version bumped so
+        cached /questions bodies and ETags pick up the new URLs; on_change is
+        called with each such bank id after commit.
+        """
+        try:
+            exam_codes = sorted(entry.name for entry in os.scandir(exams_root) if entry.is_dir())
+        except FileNotFoundError:
+            return 0
+        total = 0
+        for exam_code in exam_codes:
+            with self.database.transaction() as conn:
+                cursor = conn.cursor()
+                added = self.ingest_directory(cursor, exam_code, os.path.join(exams_root, exam_code, "images"))
+                bank_ids = []
+                if added:
+                    bank_ids = [row[0] for row in cursor.execute(
+                        "SELECT id FROM test_banks WHERE exam_code = ?", (exam_code,)
+                    ).fetchall()]
+                    for bank_id in bank_ids:
+                        bump_content_version(cursor, bank_id)
+            if added:
+                logger.info("Stored %d images for exam %s", added, exam_code)
+                total += added
+                for bank_id in bank_ids:
+                    if on_change is not None:
+                        on_change(bank_id)
+        return total
+
+    def forget_urls(self):
+        """Drop memoized URLs, e.g. after another process remapped image names."""
+        with self._lock:
+            self._urls.clear()
+
+    def url_for(self, exam_code, name):
+        """Hashed URL for an image referenced by question data, or its legacy URL if not stored yet."""
+        if not name:
+            return None
+        key = (exam_code, name)
+        url = self._urls.get(key)
+        if url is not None:
+            return url
+        row = self.database.connection().execute("""
+            SELECT n.digest, i.ext FROM image_names n JOIN images i ON i.digest = n.digest
+            WHERE n.exam_code = ? AND n.name = ?
+        """, key).fetchone()
+        if row is None:
+            return legacy_image_url(exam_code, name)
+        url = f"/images/{row[0]}{row[1]}"
+        with self._lock:
+            self._urls[key] = url
+        return url
+
+    def response(self, request, digest, width=None):
+        """Serve a blob (or its closest rendition at least `width` wide) with immutable caching and ranges."""
+        row = self.database.connection().execute(
+            "SELECT content_type FROM images WHERE digest = ?", (digest,)
+        ).fetchone()
+        if row is None:
+            return None
+        path = self.blob_path(digest)
+        etag = f'"{digest}"'
+        if width is not None:
+            for candidate in self.rendition_widths:
+                if candidate >= width and os.path.exists(self.blob_path(digest, candidate)):
+                    path = self.blob_path(digest, candidate)
+                    etag = f'"{digest}-w{candidate}"'
+                    break
+        if not os.path.exists(path):
+            return None
+
+        headers = {"ETag": etag, "Cache-Control": IMMUTABLE, "Accept-Ranges": "bytes", **SAFE_HEADERS}
+        if http_cache.etag_matches(request, etag):
+            return Response(status_code=304, headers=headers)
+
+        size = os.path.getsize(path)
+        range_header = request.headers.get("range")
+        if range_header:
+            byte_range = parse_range(range_header, size)
+            if byte_range is None and range_header.startswith("bytes=") and "," not in range_header:
+                headers["Content-Range"] = f"bytes */{size}"
+                return Response(status_code=416, headers=headers)
+            if byte_range is not None:
+                start, end = byte_range
+                with open(path, "rb") as src:
+                    src.seek(start)
+                    body = src.read(end - start + 1)
+                headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+                return Response(content=body, status_code=206, media_type=row[0], headers=headers)
+        return FileResponse(path, media_type=row[0], headers=headers)
+
+
+def main():
+    from db import Database
+    from migrations import migrate
+
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
+    parser = argparse.ArgumentParser(description="Move exam images into the content-addressed image store.")
+    parser.add_argument("--db", default="test_engine.db", help="Path to SQLite database file (default: test_engine.db)")
+    parser.add_argument("--exams", default="exams", help="Legacy exams directory (default: exams)")
+    parser.add_argument("--store", default="image_store", help="Image store directory (default: image_store)")
+    args = parser.parse_args()
+
+    database = Database(args.db)
+    migrate(database)
+    count = ImageStore(database, args.store).sweep(args.exams)
+    logging.info(f"Stored {count} images")
+    database.close_all()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,138 +1,166 @@
-import sqlite3
-import json
 import argparse
 import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import bank_stats
+from bank_cache import bump_content_version
+from db import Database
+from importer import insert_batch, iter_questions, next_question_id, question_rows, read_header
+from migrations import migrate
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
 
-def init_db(db_path):
-    """Initialize the database if it doesn’t exist."""
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS test_banks (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT UNIQUE NOT NULL,
-            exam_code TEXT NOT NULL
-        )
-    """)
-
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS questions (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            test_bank_id INTEGER,
-            question TEXT NOT NULL,
-            correct_answer TEXT NOT NULL,
-            explanation TEXT,
-            FOREIGN KEY (test_bank_id) REFERENCES test_banks(id)
-        )
-    """)
-
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS question_options (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            question_id INTEGER,
-            option_letter TEXT NOT NULL,
-            option_text TEXT NOT NULL,
-            FOREIGN KEY (question_id) REFERENCES questions(id)
-        )
-    """)
-
-    conn.commit()
-    conn.close()
-    logging.info(f"Database initialized at {db_path}")
-
-def import_json(file_path, db_path):
-    """Import questions from a JSON file into the database."""
-    # Load JSON
-    with open(file_path, 'r') as f:
-        data = json.load(f)
-
-    exam_name = data.get('exam_name')
-    exam_code = data.get('exam_code')
-    questions = data.get('questions', [])
-
-    if not exam_name or not exam_code or not questions:
-        logging.error("Invalid JSON format. Must include exam_name, exam_code, and questions.")
-        return
-
-    # Connect to database
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-
-    # Check or create test bank
-    cursor.execute("SELECT id FROM test_banks WHERE name = ? OR exam_code = ?", (exam_name, exam_code))
+BULK_TABLES = ("questions", "options")
+
+
+def find_json_files(paths):
+    """Expand the given files and directories into a sorted list of .json files."""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                files.extend(os.path.join(root, name) for name in names if name.endswith(".json"))
+        else:
+            files.append(path)
+    return sorted(files)
+
+
+def parse_file(file_path):
+    """Parse and validate one exam file (runs in a worker process).
+
+    Returns (file_path, exam_name, exam_code, rows, errors) where rows are
+    ready-to-insert (question_row, option_rows) pairs without ids.
+    """
+    rows = []
+    errors = []
+    try:
+        with open(file_path, "rb") as fp:
+            header, _ = read_header(fp)
+            exam_name = header.get("exam_name")
+            exam_code = header.get("exam_code")
+            if not exam_name or not exam_code:
+                return file_path, None, None, [], ["Invalid JSON format. Must include exam_name, exam_code, and questions."]
+            for index, q in enumerate(iter_questions(fp), start=1):
+                try:
+                    rows.append(question_rows(q, index))
+                except Exception as e:
+                    errors.append(str(e))
+    except Exception as e:
+        return file_path, None, None, [], [str(e)]
+    if not rows and not errors:
+        errors.append("Invalid JSON format. Must include exam_name, exam_code, and questions.")
+    return file_path, exam_name, exam_code, rows, errors
+
+
+def drop_secondary_indexes(conn):
+    """Drop the indexes on the bulk-loaded tables and return their CREATE statements."""
+    placeholders = ", ".join("?" for _ in BULK_TABLES)
+    indexes = conn.execute(f"""
+        SELECT name, sql FROM sqlite_master
+        WHERE type = 'index' AND sql IS NOT NULL AND tbl_name IN ({placeholders})
+    """, BULK_TABLES).fetchall()
+    for name, _ in indexes:
+        conn.execute(f'DROP INDEX "{name}"')
+    return [sql for _, sql in indexes]
+
+
+def bank_id_for(cursor, exam_name, exam_code):
+    cursor.execute("SELECT id FROM test_banks WHERE (name = ? OR exam_code = ?) AND deleted_at IS NULL", (exam_name, exam_code))
     bank = cursor.fetchone()
-    if not bank:
-        logging.info(f"Creating new test bank: {exam_name} ({exam_code})")
-        cursor.execute("INSERT INTO test_banks (name, exam_code) VALUES (?, ?)", (exam_name, exam_code))
-        bank_id = cursor.lastrowid
-    else:
-        bank_id = bank[0]
-        logging.info(f"Using existing test bank ID {bank_id} for {exam_name}")
-
-    # Import questions
-    for i, q in enumerate(questions, 1):
-        try:
-            # Validate and prepare correct_answer
-            correct_answer = q.get("correct_answer")
-            if correct_answer is None:
-                raise ValueError("'correct_answer' is null or missing")
-            if isinstance(correct_answer, list):
-                correct_answer = ",".join(str(x) for x in correct_answer)
-            if not correct_answer:
-                raise ValueError("'correct_answer' is empty")
-
-            explanation = q.get("explanation")
-            if isinstance(explanation, list):
-                explanation = " ".join(str(e) for e in explanation) if explanation else None
-
-            # Insert into questions table
-            cursor.execute("""
-                INSERT INTO questions (test_bank_id, question, correct_answer, explanation)
-                VALUES (?, ?, ?, ?)
-            """, (bank_id, q["question"], correct_answer, explanation))
-            question_id = cursor.lastrowid
-
-            # Collect and insert options
-            options = []
-            for letter in 'ABCDEFGHIJ':
-                option_key = f"option_{letter.lower()}"
-                if option_key in q and q[option_key] is not None:
-                    options.append((letter, q[option_key]))
-
-            if not options:
-                raise ValueError("No valid options provided")
-
-            for option_letter, option_text in options:
-                cursor.execute("""
-                    INSERT INTO question_options (question_id, option_letter, option_text)
-                    VALUES (?, ?, ?)
-                """, (question_id, option_letter, option_text))
-
-            logging.info(f"Imported question {i} (#{q.get('question_number', 'N/A')}): {q['question']}")
-
-        except Exception as e:
-            logging.error(f"Failed on question {i} (#{q.get('question_number', 'N/A')}): {str(e)}")
-            logging.error(f"Problematic data: {json.dumps(q)}")
-            conn.rollback()
-            conn.close()
-            return
-
-    conn.commit()
-    conn.close()
-    logging.info(f"Successfully imported {len(questions)} questions into {exam_name} ({exam_code})")
+    if bank:
+        logging.info(f"Using existing test bank ID {bank[0]} for {exam_name}")
+        return bank[0]
+    logging.info(f"Creating new test bank: {exam_name} ({exam_code})")
+    cursor.execute("INSERT INTO test_banks (name, exam_code) VALUES (?, ?)", (exam_name, exam_code))
+    return cursor.lastrowid
+
+
+def load(database, files, workers=None, batch_size=5000, strict=False, keep_indexes=False):
+    """Parse files in a process pool and write them through a single transaction.
+
+    Returns a stats dict. With strict=True any invalid question aborts and
+    rolls back the whole load; otherwise invalid questions are skipped and
+    reported.
+    """
+    stats = {"files": 0, "failed_files": 0, "questions": 0, "options": 0, "skipped": 0}
+    start = time.perf_counter()
+    index_sql = []
+
+    with ProcessPoolExecutor(max_workers=workers) as pool, database.transaction() as conn:
+        cursor = conn.cursor()
+        if not keep_indexes:
+            index_sql = drop_secondary_indexes(conn)
+
+        next_id = next_question_id(cursor)
+        for file_path, exam_name, exam_code, rows, errors in pool.map(parse_file, files, chunksize=1):
+            for error in errors:
+                logging.error(f"{file_path}: {error}")
+            if errors and strict:
+                raise ValueError(f"{file_path}: {len(errors)} invalid question(s); nothing was imported")
+            if not exam_name or not rows:
+                stats["failed_files"] += 1
+                continue
+
+            bank_id = bank_id_for(cursor, exam_name, exam_code)
+            for offset in range(0, len(rows), batch_size):
+                batch = rows[offset:offset + batch_size]
+                next_id = insert_batch(cursor, bank_id, next_id, batch)
+                stats["options"] += sum(len(options) for _, options in batch)
+            bank_stats.add_questions(cursor, bank_id, len(rows))
+            bump_content_version(cursor, bank_id)
+            stats["files"] += 1
+            stats["questions"] += len(rows)
+            stats["skipped"] += len(errors)
+            logging.info(f"Loaded {len(rows)} questions from {file_path} into {exam_name} ({exam_code})")
+
+        if index_sql:
+            index_start = time.perf_counter()
+            for sql in index_sql:
+                conn.execute(sql)
+            stats["index_rebuild_sec"] = round(time.perf_counter() - index_start, 3)
+
+    elapsed = time.perf_counter() - start
+    stats["elapsed_sec"] = round(elapsed, 3)
+    stats["questions_per_sec"] = round(stats["questions"] / elapsed, 1) if elapsed else 0.0
+    stats["rows_per_sec"] = round((stats["questions"] + stats["options"]) / elapsed, 1) if elapsed else 0.0
+    return stats
+
 
 def main():
-    parser = argparse.ArgumentParser(description="Import JSON exam questions into SQLite database.")
-    parser.add_argument("json_file", help="Path to the JSON file to import")
+    parser = argparse.ArgumentParser(description="Bulk load JSON exam files into the ExamOMatic SQLite database.")
+    parser.add_argument("paths", nargs="+", help="JSON files or directories containing JSON files")
     parser.add_argument("--db", default="test_engine.db", help="Path to SQLite database file (default: test_engine.db)")
+    parser.add_argument("--workers", type=int, default=None, help="Parser processes (default: CPU count)")
+    parser.add_argument("--batch-size", type=int, default=5000, help="Questions per executemany batch (default: 5000)")
+    parser.add_argument("--strict", action="store_true", help="Abort and roll back everything on the first invalid question")
+    parser.add_argument("--keep-indexes", action="store_true", help="Do not drop and rebuild secondary indexes around the load")
     args = parser.parse_args()
 
-    init_db(args.db)
-    import_json(args.json_file, args.db)
+    files = find_json_files(args.paths)
+    if not files:
+        parser.error("no JSON files found")
+
+    database = Database(args.db)
+    try:
+        migrate(database)
+        stats = load(database, files, workers=args.workers, batch_size=args.batch_size,
+                     strict=args.strict, keep_indexes=args.keep_indexes)
+    except ValueError as e:
+        logging.error(str(e))
+        raise SystemExit(1)
+    finally:
+        database.close_all()
+
+    logging.info(
+        f"Imported {stats['questions']} questions ({stats['options']} options) from {stats['files']} file(s) "
+        f"in {stats['elapsed_sec']}s: {stats['questions_per_sec']} questions/s, {stats['rows_per_sec']} rows/s"
+    )
+    if stats["skipped"] or stats["failed_files"]:
+        logging.warning(f"Skipped {stats['skipped']} invalid question(s) and {stats['failed_files']} unreadable file(s)")
+
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
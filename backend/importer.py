@@ -0,0 +1,469 @@
+import codecs
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import nullcontext
+
+import bank_stats
+import bundles
+import coherence
+import dedup
+import search
+from bank_cache import bump_content_version
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+# A single question larger than this is treated as a malformed upload
+MAX_ITEM_BYTES = 16 * 1024 * 1024
+# How near-duplicates of questions already in the bank (or earlier in the
+# same file) are handled: imported and listed in the job, dropped, used to
+# fill gaps in the existing question, or imported without a report
+DUPLICATE_POLICIES = ("report", "skip", "merge", "keep")
+MAX_REPORTED_DUPLICATES = 100
+
+
+class ImportFormatError(ValueError):
+    pass
+
+
+class JsonStream:
+    """Pull-parser over a JSON document read from a binary file in chunks.
+
+    Only the structure around the top-level object is walked by hand; each
+    value inside it is decoded with ``json.JSONDecoder.raw_decode`` once its
+    bytes are buffered, so memory is bounded by the largest single question.
+    """
+
+    def __init__(self, fp, chunk_size=CHUNK_SIZE):
+        self.fp = fp
+        self.chunk_size = chunk_size
+        self._decoder = codecs.getincrementaldecoder("utf-8-sig")()
+        self._json = json.JSONDecoder()
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self):
+        if self.eof:
+            return False
+        if self.pos > self.chunk_size:
+            self.buf = self.buf[self.pos:]
+            self.pos = 0
+        chunk = self.fp.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            self.buf += self._decoder.decode(b"", final=True)
+            return False
+        self.buf += self._decoder.decode(chunk)
+        return True
+
+    def peek(self):
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in " \t\r\n":
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                raise ImportFormatError("Unexpected end of JSON document")
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ImportFormatError(f"Expected '{char}' at offset {self.pos} of the JSON document")
+        self.pos += 1
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self._json.raw_decode(self.buf, self.pos)
+                # A number at the end of the buffer may continue in the next chunk
+                if end < len(self.buf) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError as e:
+                if self.eof:
+                    raise ImportFormatError(f"Invalid JSON: {e}")
+            if len(self.buf) - self.pos > MAX_ITEM_BYTES:
+                raise ImportFormatError("JSON value is too large to import")
+            self._fill()
+
+    def members(self):
+        """Yield the keys of the top-level object, leaving the stream at each value."""
+        self.expect("{")
+        if self.peek() == "}":
+            self.pos += 1
+            return
+        while True:
+            key = self.value()
+            if not isinstance(key, str):
+                raise ImportFormatError("Invalid JSON: object keys must be strings")
+            self.expect(":")
+            yield key
+            separator = self.peek()
+            self.pos += 1
+            if separator == "}":
+                return
+            if separator != ",":
+                raise ImportFormatError(f"Expected ',' or '}}' at offset {self.pos - 1} of the JSON document")
+
+    def items(self):
+        """Yield the elements of the array at the current position one at a time."""
+        self.expect("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            separator = self.peek()
+            self.pos += 1
+            if separator == "]":
+                return
+            if separator != ",":
+                raise ImportFormatError(f"Expected ',' or ']' at offset {self.pos - 1} of the JSON document")
+
+
+def read_header(fp):
+    """Return the top-level fields other than 'questions', plus whether questions is non-empty."""
+    fp.seek(0)
+    stream = JsonStream(fp)
+    header = {}
+    has_questions = False
+    for key in stream.members():
+        if key == "questions":
+            for _ in stream.items():
+                has_questions = True
+                if "exam_name" in header and "exam_code" in header:
+                    return header, has_questions
+        else:
+            header[key] = stream.value()
+    return header, has_questions
+
+
+def iter_questions(fp):
+    fp.seek(0)
+    stream = JsonStream(fp)
+    for key in stream.members():
+        if key == "questions":
+            yield from stream.items()
+            return
+        stream.value()
+
+
+def question_rows(q, index):
+    """Validate one imported question and return (question_row, option_rows) without ids."""
+    if not isinstance(q, dict):
+        raise ValueError(f"question at position {index} is not an object")
+    question_text = q.get("question")
+    explanation = q.get("explanation")
+    question_images = q.get("question_images")
+    explanation_images = q.get("explanation_images")
+    if not question_text:
+        raise ValueError(f"'question' is empty or missing in question at position {index}")
+
+    # Convert lists to JSON strings for storage
+    question_images_json = json.dumps(question_images) if question_images else None
+    explanation_images_json = json.dumps(explanation_images) if explanation_images else None
+
+    options = []
+    for opt in q.get("options", []):
+        option_text = opt.get("text")
+        if option_text:
+            options.append((option_text, bool(opt.get("is_correct", False)), opt.get("image")))
+    return (question_text, explanation, question_images_json, explanation_images_json), options
+
+
+def next_question_id(cursor):
+    """First free questions.id; only valid while holding the write lock."""
+    cursor.execute("""
+        SELECT MAX(
+            COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'questions'), 0),
+            COALESCE((SELECT MAX(id) FROM questions), 0)
+        )
+    """)
+    return cursor.fetchone()[0] + 1
+
+
+def merge_question(cursor, question_id, question):
+    """Fill a missing explanation or images on an existing question; returns whether anything changed."""
+    _, explanation, question_images, explanation_images = question
+    cursor.execute("""
+        UPDATE questions SET
+            explanation = COALESCE(NULLIF(explanation, ''), ?),
+            question_images = COALESCE(question_images, ?),
+            explanation_images = COALESCE(explanation_images, ?)
+        WHERE id = ?
+          AND ((explanation IS NULL OR explanation = '') AND ? IS NOT NULL
+               OR question_images IS NULL AND ? IS NOT NULL
+               OR explanation_images IS NULL AND ? IS NOT NULL)
+    """, (explanation or None, question_images, explanation_images, question_id,
+          explanation or None, question_images, explanation_images))
+    if cursor.rowcount == 0:
+        return False
+    search.reindex_question(cursor, question_id)
+    return True
+
+
+def insert_batch(cursor, bank_id, first_id, batch):
+    """Insert a batch of (question_row, option_values) with explicit, consecutive question ids."""
+    question_values = []
+    option_values = []
+    search_values = []
+    for offset, (question, options) in enumerate(batch):
+        question_id = first_id + offset
+        question_values.append((question_id, bank_id) + question)
+        option_values.extend((question_id,) + option for option in options)
+        search_values.append((question_id, bank_id, question[0], question[1], [option[0] for option in options]))
+    cursor.executemany("""
+        INSERT INTO questions (id, test_bank_id, question_text, explanation, question_images, explanation_images)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, question_values)
+    cursor.executemany("""
+        INSERT INTO options (question_id, option_text, is_correct, image)
+        VALUES (?, ?, ?, ?)
+    """, option_values)
+    search.add_questions(cursor, search_values)
+    return first_id + len(batch)
+
+
+class ImportJob:
+    def __init__(self, filename):
+        self.id = uuid.uuid4().hex
+        self.filename = filename
+        self.status = "queued"
+        self.exam_name = None
+        self.exam_code = None
+        self.test_bank_id = None
+        self.questions_done = 0
+        self.options_done = 0
+        self.duplicates_skipped = 0
+        self.duplicates_merged = 0
+        # (position in file, existing question id, similarity), capped at MAX_REPORTED_DUPLICATES
+        self.duplicates = []
+        self.images_stored = 0
+        # Names referenced by questions but found nowhere, capped at bundles.MAX_REPORTED_MISSING
+        self.missing_images = []
+        self.missing_image_count = 0
+        self.errors = []
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    def to_dict(self):
+        end = self.finished_at or time.time()
+        elapsed = end - self.started_at if self.started_at else 0.0
+        return {
+            "job_id": self.id,
+            "filename": self.filename,
+            "status": self.status,
+            "exam_name": self.exam_name,
+            "exam_code": self.exam_code,
+            "test_bank_id": self.test_bank_id,
+            "questions_done": self.questions_done,
+            "options_done": self.options_done,
+            "duplicates_skipped": self.duplicates_skipped,
+            "duplicates_merged": self.duplicates_merged,
+            "duplicates": [
+                {"position": position, "duplicate_of": question_id, "similarity": round(score, 3)}
+                for position, question_id, score in self.duplicates
+            ],
+            "images_stored": self.images_stored,
+            "missing_image_count": self.missing_image_count,
+            "missing_images": self.missing_images,
+            "rows_per_sec": round((self.questions_done + self.options_done) / elapsed, 1) if elapsed else 0.0,
+            "elapsed_sec": round(elapsed, 3),
+            "errors": self.errors,
+        }
+
+
+class ImportJobs:
+    """Registry of background import jobs, keeping only the most recent ones.
+
+    With a ``database`` (several worker processes) each job's status is also
+    published to SQLite when it is queued and when it finishes, so whichever
+    worker a client polls can report it.
+    """
+
+    def __init__(self, max_jobs=100, database=None):
+        self.max_jobs = max_jobs
+        self.database = database
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def create(self, filename):
+        job = ImportJob(filename)
+        with self._lock:
+            self._jobs[job.id] = job
+            finished = [j for j in self._jobs.values() if j.finished_at]
+            for old in sorted(finished, key=lambda j: j.created_at)[:max(0, len(self._jobs) - self.max_jobs)]:
+                del self._jobs[old.id]
+        self.publish(job)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def publish(self, job):
+        if self.database is None:
+            return
+        with self.database.transaction() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO import_jobs (id, created_at, status) VALUES (?, ?, ?)",
+                (job.id, job.created_at, json.dumps(job.to_dict())),
+            )
+            conn.execute("""
+                DELETE FROM import_jobs WHERE id NOT IN (
+                    SELECT id FROM import_jobs ORDER BY created_at DESC LIMIT ?
+                )
+            """, (self.max_jobs,))
+
+    def status(self, job_id):
+        """A job's to_dict(), from this process or as last published by another; None if unknown."""
+        job = self.get(job_id)
+        if job is not None:
+            return job.to_dict()
+        if self.database is None:
+            return None
+        row = self.database.connection().execute("SELECT status FROM import_jobs WHERE id = ?", (job_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+
+def run_import(database, path, job, batch_size=500, on_commit=None,
+               duplicates="report", duplicate_threshold=dedup.DEFAULT_THRESHOLD,
+               image_store=None, image_workers=4, exams_lock=None):
+    """Stream questions from the JSON file (or ZIP bundle) at path into the database in one transaction.
+
+    The whole import is atomic: on the first invalid question or image
+    everything is rolled back and the job is marked failed. Near-duplicates
+    are handled according to ``duplicates`` (see DUPLICATE_POLICIES). A
+    bundle's images go into image_store, extracted in parallel with the
+    question inserts. The file lock at ``exams_lock`` is held from creating
+    exams/<code> until the bank row is committed, so the reaper does not
+    remove the folder of a bank that is still being imported.
+    """
+    job.status = "running"
+    job.started_at = time.time()
+    bundle = None
+    failed = True
+    created_dirs = []
+    try:
+        if bundles.is_bundle(path):
+            if image_store is None:
+                raise ImportFormatError("ZIP bundles need an image store.")
+            bundle = bundles.Bundle(path)
+            fp = bundle.open_questions()
+        else:
+            fp = open(path, "rb")
+        with fp:
+            header, has_questions = read_header(fp)
+            exam_name = header.get("exam_name")
+            exam_code = header.get("exam_code")
+            if not exam_name or not exam_code or not has_questions:
+                raise ImportFormatError("Invalid JSON format: 'exam_name', 'exam_code', or 'questions' missing.")
+            job.exam_name, job.exam_code = exam_name, exam_code
+            pending = bundle.store_images(image_store, image_workers) if bundle else {}
+            referenced = set()
+
+            with coherence.exclusive(exams_lock) if exams_lock else nullcontext(), database.transaction() as conn:
+                cursor = conn.cursor()
+                cursor.execute("SELECT id FROM test_banks WHERE (name = ? OR exam_code = ?) AND deleted_at IS NULL", (exam_name, exam_code))
+                bank = cursor.fetchone()
+                if not bank:
+                    cursor.execute("INSERT INTO test_banks (name, exam_code) VALUES (?, ?)", (exam_name, exam_code))
+                    bank_id = cursor.lastrowid
+                else:
+                    bank_id = bank[0]
+                job.test_bank_id = bank_id
+
+                created_dirs = [folder for folder in (f"exams/{exam_code}", f"exams/{exam_code}/images") if not os.path.isdir(folder)]
+                os.makedirs(f"exams/{exam_code}/images", exist_ok=True)
+
+                index = dedup.load_index(cursor, bank_id, duplicate_threshold)
+                next_id = next_question_id(cursor)
+                batch = []
+                signatures = []
+                merged = False
+                for position, q in enumerate(iter_questions(fp), start=1):
+                    try:
+                        row = question_rows(q, position)
+                    except Exception as e:
+                        raise ImportFormatError(
+                            f"Failed to process question at position {position}: {str(e)}. Problematic data: {json.dumps(q)}"
+                        )
+                    question, options = row
+                    sig = dedup.signature(question[0], [option[0] for option in options], [option[1] for option in options])
+                    match = index.find(sig)
+                    if match is not None and duplicates != "keep":
+                        if len(job.duplicates) < MAX_REPORTED_DUPLICATES:
+                            job.duplicates.append((position, match[0], match[1]))
+                    if match is not None and duplicates in ("skip", "merge"):
+                        if duplicates == "merge" and merge_question(cursor, match[0], question):
+                            job.duplicates_merged += 1
+                            merged = True
+                            referenced.update(bundles.referenced_images(q))
+                        else:
+                            job.duplicates_skipped += 1
+                        continue
+
+                    referenced.update(bundles.referenced_images(q))
+                    # Ids are assigned consecutively, so the new question's id is known already
+                    question_id = next_id + len(batch)
+                    index.add(question_id, sig)
+                    signatures.append((question_id, sig))
+                    batch.append(row)
+                    if len(batch) >= batch_size:
+                        next_id = insert_batch(cursor, bank_id, next_id, batch)
+                        dedup.store(cursor, signatures)
+                        job.questions_done += len(batch)
+                        job.options_done += sum(len(options) for _, options in batch)
+                        batch = []
+                        signatures = []
+                if batch:
+                    insert_batch(cursor, bank_id, next_id, batch)
+                    dedup.store(cursor, signatures)
+                    job.questions_done += len(batch)
+                    job.options_done += sum(len(options) for _, options in batch)
+                bank_stats.add_questions(cursor, bank_id, job.questions_done)
+                if bundle:
+                    job.images_stored = bundle.register_images(cursor, image_store, exam_code, pending)
+                    missing = bundles.missing_images(cursor, exam_code, referenced, pending)
+                    job.missing_image_count = len(missing)
+                    job.missing_images = missing[:bundles.MAX_REPORTED_MISSING]
+                if job.questions_done or merged or job.images_stored:
+                    bump_content_version(cursor, bank_id)
+        failed = False
+
+        if on_commit is not None:
+            on_commit(bank_id)
+        job.status = "completed"
+        logger.info(
+            "Import %s finished: %d questions into %s (%s), %d duplicates skipped, %d merged, %d images",
+            job.id, job.questions_done, exam_name, exam_code, job.duplicates_skipped, job.duplicates_merged,
+            job.images_stored
+        )
+        if job.missing_image_count:
+            logger.warning("Import %s references %d missing images", job.id, job.missing_image_count)
+    except Exception as e:
+        job.status = "failed"
+        job.errors.append(str(e))
+        logger.warning("Import %s failed: %s", job.id, e)
+    finally:
+        if bundle is not None:
+            bundle.close(image_store, discard=failed)
+        if failed and created_dirs:
+            # Leave no trace of a bank the import was creating, unless another import has
+            # since committed one with the same code; anything put there since is kept
+            with coherence.exclusive(exams_lock) if exams_lock else nullcontext():
+                reused = database.connection().execute(
+                    "SELECT 1 FROM test_banks WHERE exam_code = ? LIMIT 1", (job.exam_code,)
+                ).fetchone()
+                for folder in reversed(created_dirs) if reused is None else ():
+                    try:
+                        os.rmdir(folder)
+                    except OSError:
+                        pass
+        job.finished_at = time.time()
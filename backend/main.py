@@ -1,20 +1,43 @@
-from fastapi import FastAPI, HTTPException, Query, UploadFile
+from fastapi import FastAPI, HTTPException, Query, Request, UploadFile
 from pydantic import BaseModel
 from typing import List, Optional, Dict
 import sqlite3
-import json
-import random
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 import os
+import logging
+import random
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+import answer_events
+from answer_events import AnswerEventLog
+from answer_keys import AnswerKey, AnswerKeyIndex, is_correct, mask_to_answer, parse_selection, stored_mask
+import bank_stats
+import coherence
+import dedup
+import exporter
+import http_cache
+import image_store as images
+import logs
+import metrics
+import practice
+import reaper
+import search
+import snapshots
+from bank_cache import BankCache, bank_header, fetch_by_ids, fetch_page, sample_ids
+from question_api import LEAN_FIELDS, Answer, AnswerBatch, grade, parse_fields, question_items
+from sessions import SessionStore
+from db import Database
+from importer import CHUNK_SIZE as IMPORT_CHUNK_SIZE, DUPLICATE_POLICIES, ImportJobs, run_import
+from migrations import migrate
+
+# LOG_LEVEL=OFF silences application logging; LOG_FORMAT=json emits one JSON object per line
+logs.configure(os.environ.get("LOG_LEVEL", "INFO"), os.environ.get("LOG_FORMAT", "text"))
 
 app = FastAPI()
-
-# Create exams directory if it doesn't exist
-os.makedirs("exams", exist_ok=True)
-
-# Mount the exams directory to serve static files (images)
-app.mount("/exams", StaticFiles(directory="exams"), name="exams")
+logger = logging.getLogger(__name__)
 
 app.add_middleware(
     CORSMiddleware,
@@ -24,62 +47,130 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Remove the database deletion logic
-SQLITE_DB = "test_engine.db"
+# Per-route latency and SQL counters for GET /metrics; METRICS_ENABLED=0 turns the hooks off
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "1") != "0"
+SLOW_REQUEST_SECONDS = float(os.environ.get("SLOW_REQUEST_SECONDS", "1.0"))
+if METRICS_ENABLED:
+    app.add_middleware(metrics.MetricsMiddleware, slow_request_seconds=SLOW_REQUEST_SECONDS)
 
-def init_db():
-    conn = sqlite3.connect(SQLITE_DB)
-    cursor = conn.cursor()
+# Set WEB_CONCURRENCY (uvicorn's default for --workers) to run several worker processes.
+# Sessions are then read and written through SQLite, and each worker revalidates its caches
+# when another one changes a bank.
+WORKERS = int(os.environ.get("WEB_CONCURRENCY", "1"))
+MULTI_WORKER = WORKERS > 1
 
-    # Create tables if they don't exist (safe for existing databases)
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS test_banks (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT UNIQUE NOT NULL,
-            exam_code TEXT NOT NULL
-        )
-    """)
+# Remove the database deletion logic
+SQLITE_DB = "test_engine.db"
+db = Database(SQLITE_DB, factory=metrics.TracedConnection if METRICS_ENABLED else sqlite3.Connection)
+
+# Content-addressed images shared by all exams, served from /images with immutable caching.
+# IMAGE_RENDITION_WIDTHS (e.g. "320,640") pre-generates downscaled copies when Pillow is installed.
+IMAGE_STORE_DIR = os.environ.get("IMAGE_STORE_DIR", "image_store")
+IMAGE_RENDITION_WIDTHS = tuple(int(w) for w in os.environ.get("IMAGE_RENDITION_WIDTHS", "").split(",") if w.strip())
+image_store = images.ImageStore(db, IMAGE_STORE_DIR, rendition_widths=IMAGE_RENDITION_WIDTHS)
+
+# Compiled question banks served by /questions; invalidated on import and delete
+QUESTION_CACHE_MAX_BANKS = int(os.environ.get("QUESTION_CACHE_MAX_BANKS", "32"))
+QUESTION_CACHE_MAX_QUESTIONS = int(os.environ.get("QUESTION_CACHE_MAX_QUESTIONS", "200000"))
+# SNAPSHOT_DIR points at bank snapshots built by snapshots.py; one that matches a bank's
+# content version is memory-mapped instead of compiled, so cold starts skip the SQLite read
+SNAPSHOT_DIR = os.environ.get("SNAPSHOT_DIR")
+bank_cache = BankCache(
+    max_banks=QUESTION_CACHE_MAX_BANKS, max_questions=QUESTION_CACHE_MAX_QUESTIONS, image_urls=image_store.url_for,
+    snapshots=snapshots.SnapshotStore(SNAPSHOT_DIR) if SNAPSHOT_DIR else None,
+)
+# Correct-letter masks for /answer, so grading never has to query SQLite
+answer_keys = AnswerKeyIndex()
+# Encoded /questions bodies per (bank, shuffle, seed, encoding) variant
+RESPONSE_CACHE_MAX_BYTES = int(os.environ.get("RESPONSE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+response_cache = http_cache.ResponseCache(max_bytes=RESPONSE_CACHE_MAX_BYTES)
+
+# Adaptive practice queues (due times and ease factors per question) for /practice/next
+PRACTICE_MAX_BANKS = int(os.environ.get("PRACTICE_MAX_BANKS", "32"))
+practice_scheduler = practice.PracticeScheduler(max_banks=PRACTICE_MAX_BANKS)
+
+# Paged and streamed /questions read straight from SQLite in keyset chunks
+DEFAULT_PAGE_SIZE = 100
+STREAM_CHUNK_SIZE = 500
+
+# Raw /exam_history pages and the number of day/week buckets returned by default
+DEFAULT_HISTORY_PAGE = 100
+DEFAULT_HISTORY_BUCKETS = 90
+
+# Server-side exam sessions, checkpointed to SQLite in batches
+SESSION_CHECKPOINT_SECONDS = float(os.environ.get("SESSION_CHECKPOINT_SECONDS", "2"))
+SESSION_MAX_IN_MEMORY = int(os.environ.get("SESSION_MAX_IN_MEMORY", "10000"))
+# Sessions untouched for this long expire and are deleted by the reaper; 0 keeps them forever
+SESSION_TTL_SECONDS = float(os.environ.get("SESSION_TTL_SECONDS", str(7 * 24 * 3600)))
+session_store = SessionStore(
+    db, max_in_memory=SESSION_MAX_IN_MEMORY, checkpoint_interval=SESSION_CHECKPOINT_SECONDS, shared=MULTI_WORKER,
+    ttl=SESSION_TTL_SECONDS,
+)
 
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS questions (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            test_bank_id INTEGER,
-            question_text TEXT NOT NULL,
-            explanation TEXT,
-            question_images TEXT,
-            explanation_images TEXT,
-            FOREIGN KEY (test_bank_id) REFERENCES test_banks(id)
-        )
-    """)
+# Graded answers are logged by a single writer thread in batched transactions
+ANSWER_EVENT_BATCH_SIZE = int(os.environ.get("ANSWER_EVENT_BATCH_SIZE", "1000"))
+ANSWER_EVENT_FLUSH_SECONDS = float(os.environ.get("ANSWER_EVENT_FLUSH_SECONDS", "0.5"))
+answer_log = AnswerEventLog(
+    db, max_batch=ANSWER_EVENT_BATCH_SIZE, flush_interval=ANSWER_EVENT_FLUSH_SECONDS,
+    on_written=practice_scheduler.written,
+)
 
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS options (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            question_id INTEGER,
-            option_text TEXT NOT NULL,
-            is_correct BOOLEAN NOT NULL DEFAULT FALSE,
-            image TEXT,
-            FOREIGN KEY (question_id) REFERENCES questions(id)
-        )
-    """)
+# Imports run one at a time in the background; progress is polled via GET /import/{job_id}
+IMPORT_BATCH_SIZE = int(os.environ.get("IMPORT_BATCH_SIZE", "500"))
+# Estimated Jaccard similarity above which an imported question counts as a near-duplicate
+DUPLICATE_THRESHOLD = float(os.environ.get("DUPLICATE_THRESHOLD", str(dedup.DEFAULT_THRESHOLD)))
+# Threads extracting a ZIP bundle's images while its questions are inserted
+IMPORT_IMAGE_WORKERS = int(os.environ.get("IMPORT_IMAGE_WORKERS", "4"))
+import_jobs = ImportJobs(database=db if MULTI_WORKER else None)
+# Serialises creating exams/<code> folders (imports) against removing them (reaper)
+EXAMS_LOCK = SQLITE_DB + ".exams.lock"
+# Deleted banks are hidden at once and purged by a background reaper in small transactions
+REAPER_INTERVAL_SECONDS = float(os.environ.get("REAPER_INTERVAL_SECONDS", "60"))
+REAPER_CHUNK_SIZE = int(os.environ.get("REAPER_CHUNK_SIZE", "500"))
+bank_reaper = reaper.Reaper(
+    db, image_store, chunk_size=REAPER_CHUNK_SIZE, interval=REAPER_INTERVAL_SECONDS,
+    lock_path=SQLITE_DB + ".reaper.lock" if MULTI_WORKER else None, session_ttl=SESSION_TTL_SECONDS,
+    exams_lock=EXAMS_LOCK,
+)
+import_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="import")
 
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS exam_results (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            test_bank_id INTEGER NOT NULL,
-            score INTEGER NOT NULL,
-            total_questions INTEGER NOT NULL,
-            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (test_bank_id) REFERENCES test_banks(id)
-        )
-    """)
+metrics.registry.gauge("bank_cache_banks", "Compiled banks held in memory.", lambda: len(bank_cache))
+metrics.registry.gauge("bank_cache_questions", "Questions held by compiled banks.", lambda: bank_cache.question_count)
+metrics.registry.gauge("response_cache_bytes", "Encoded /questions bodies held in memory.", lambda: response_cache.size)
+metrics.registry.gauge("practice_queue_banks", "Banks with a practice queue in memory.", lambda: len(practice_scheduler))
+metrics.registry.gauge("exam_sessions_in_memory", "Exam sessions held in memory.", lambda: len(session_store))
+metrics.registry.gauge("answer_events_queued", "Graded answers waiting for the writer thread.", lambda: answer_log.queued)
+metrics.registry.gauge("answer_events_dropped", "Graded answers dropped because the queue was full.", lambda: answer_log.dropped)
+metrics.registry.gauge("test_banks_pending_purge", "Deleted test banks the reaper has not removed yet.", bank_reaper.pending)
 
-    conn.commit()
-    conn.close()
+def init_db():
+    # Creates the schema on a fresh database and upgrades existing ones in place. Every worker
+    # process runs this; the first to take the lock does the work and the rest find it done.
+    with coherence.exclusive(SQLITE_DB + ".init.lock"):
+        os.makedirs("exams", exist_ok=True)
+        migrate(db)
 
 # Call init_db without deleting the database
 init_db()
 
+# Caches, sessions and import jobs are only shared between processes in multi-worker mode,
+# so refuse to run alongside another server on the same database otherwise
+if not coherence.claim(SQLITE_DB + ".server.lock", shared=MULTI_WORKER):
+    raise RuntimeError(
+        f"Another server process is using {SQLITE_DB}. Set WEB_CONCURRENCY to the number of "
+        "workers (uvicorn --workers reads it too) so that they share their state."
+    )
+
+# Mount the exams directory to serve static files (images)
+app.mount("/exams", StaticFiles(directory="exams"), name="exams")
+
+# Installed even with a single worker: import_questions.py and reaper.py change banks from
+# other processes too, and a check that finds nothing committed elsewhere is one PRAGMA
+change_monitor = coherence.ChangeMonitor(
+    db, on_bank_changed=lambda test_bank_id: _invalidate_bank(test_bank_id), on_change=image_store.forget_urls
+)
+app.add_middleware(coherence.CoherenceMiddleware, monitor=change_monitor)
+
 class ExamResultRequest(BaseModel):
     test_bank_id: int
     score: int
@@ -92,372 +183,491 @@ class Question(BaseModel):
     question_images: Optional[List[str]]
     explanation_images: Optional[List[str]]
 
-class Answer(BaseModel):
-    question_id: int
+class SessionRequest(BaseModel):
+    test_bank_id: int
+    shuffle: bool = True
+    # Practice a random subset instead of the whole bank
+    sample: Optional[int] = None
+
+class SessionAnswer(BaseModel):
     selected_answer: str
+    # Defaults to the session's current question
+    question_id: Optional[int] = None
 
 @app.get("/")
 def read_root():
     return {"message": "Welcome to the Exam API. Visit /docs for API documentation."}
 
+@app.on_event("startup")
+def start_background_workers():
+    session_store.start()
+    answer_log.start()
+    bank_reaper.start()
+    # Images copied into exams/<code>/images by hand are moved into the image store;
+    # queued behind imports so both never write the same bank at once
+    import_executor.submit(_sweep_images)
+
+@app.on_event("shutdown")
+def close_db():
+    import_executor.shutdown(wait=True)
+    bank_reaper.stop()
+    session_store.stop()
+    answer_log.stop()
+    db.close_all()
+
+@app.get("/metrics")
+def get_metrics():
+    return Response(content=metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
 @app.get("/test_banks")
-def get_test_banks():
-    conn = sqlite3.connect(SQLITE_DB)
-    cursor = conn.cursor()
-    
+def get_test_banks(request: Request):
+    cursor = db.connection().cursor()
     cursor.execute("""
-        SELECT tb.id, tb.name, tb.exam_code, COUNT(q.id) as question_count 
-        FROM test_banks tb 
-        LEFT JOIN questions q ON tb.id = q.test_bank_id 
-        GROUP BY tb.id, tb.name, tb.exam_code
+        SELECT tb.id, tb.name, tb.exam_code,
+               s.question_count, s.last_scores, s.attempt_count, s.percentage_sum, s.best_percentage
+        FROM test_banks tb
+        LEFT JOIN bank_stats s ON s.test_bank_id = tb.id
+        WHERE tb.deleted_at IS NULL
+        ORDER BY tb.id
     """)
-    banks = cursor.fetchall()
-    
+
     result = []
-    for id, name, exam_code, count in banks:
-        cursor.execute("""
-            SELECT score, total_questions 
-            FROM exam_results 
-            WHERE test_bank_id = ? 
-            ORDER BY timestamp DESC 
-            LIMIT 3
-        """, (id,))
-        last_results = cursor.fetchall()
-        
-        last_three_scores = [
-            (score / total_questions * 100) if total_questions > 0 else 0
-            for score, total_questions in last_results
-        ]
-        while len(last_three_scores) < 3:
-            last_three_scores.append(None)
-        
-        result.append({
-            "id": id,
-            "name": name,
-            "exam_code": exam_code,
-            "question_count": count,
-            "last_three_scores": last_three_scores
-        })
-    
-    conn.close()
-    return {"test_banks": result}
+    for id, name, exam_code, *stats in cursor.fetchall():
+        bank = {"id": id, "name": name, "exam_code": exam_code}
+        bank.update(bank_stats.row_to_summary(*stats))
+        result.append(bank)
+
+    # The list is small but changes with every result, so its ETag is a hash of the body
+    body = http_cache.dumps({"test_banks": result})
+    return http_cache.json_response(request, http_cache.content_etag(body), lambda: body)
 
 @app.post("/test_banks")
 def add_test_bank(name: str, exam_code: str):
-    conn = sqlite3.connect(SQLITE_DB)
-    cursor = conn.cursor()
     try:
-        cursor.execute("INSERT INTO test_banks (name, exam_code) VALUES (?, ?)", (name, exam_code))
-        conn.commit()
+        with db.transaction() as conn:
+            cursor = conn.cursor()
+            cursor.execute("INSERT INTO test_banks (name, exam_code) VALUES (?, ?)", (name, exam_code))
+            bank_stats.ensure_bank(cursor, cursor.lastrowid)
     except sqlite3.IntegrityError:
-        conn.close()
         raise HTTPException(status_code=400, detail="Test bank already exists.")
-    conn.close()
     return {"message": "Test bank added."}
 
+def _stream_questions(test_bank_id, exam_code, after_id, shuffle, seed, fields):
+    # Each chunk is a complete keyset query, so no cursor stays open between
+    # yields (Starlette may resume the generator on a different thread)
+    while True:
+        with db.transaction(immediate=False) as conn:
+            questions, last_id = fetch_page(
+                conn, test_bank_id, exam_code, after_id, STREAM_CHUNK_SIZE, image_store.url_for
+            )
+        if last_id is None:
+            return
+        for item in question_items(questions, shuffle, seed, fields):
+            yield http_cache.dumps(item) + b"\n"
+        after_id = last_id
+
 @app.get("/questions")
-def get_questions(test_bank_id: int, shuffle: bool = Query(False)):
+def get_questions(
+    request: Request,
+    test_bank_id: int,
+    shuffle: bool = Query(False),
+    seed: Optional[str] = Query(None),
+    fields: Optional[str] = Query(None, description="Comma-separated question fields to return"),
+    mode: str = Query("full", description="'lean' returns only what is needed to render the exam"),
+    after_id: Optional[int] = Query(None, description="Keyset cursor: return questions with a higher id"),
+    limit: Optional[int] = Query(None, ge=1, le=1000, description="Page size for keyset pagination"),
+    format: str = Query("json", description="'ndjson' streams one question per line"),
+    sample: Optional[int] = Query(None, ge=1, le=1000, description="Return this many random questions"),
+):
+    selected_fields = parse_fields(fields, mode)
+    if format not in ("json", "ndjson"):
+        raise HTTPException(status_code=400, detail="format must be 'json' or 'ndjson'.")
     try:
-        conn = sqlite3.connect(SQLITE_DB)
-        cursor = conn.cursor()
-        
-        cursor.execute("SELECT id, exam_code FROM test_banks WHERE id = ?", (test_bank_id,))
-        test_bank = cursor.fetchone()
-        if not test_bank:
-            conn.close()
-            raise HTTPException(status_code=404, detail="Test bank not found.")
-        exam_code = test_bank[1]
-        
-        cursor.execute("SELECT id, question_text, explanation, question_images, explanation_images FROM questions WHERE test_bank_id = ?", (test_bank_id,))
-        questions = cursor.fetchall()
-        
-        questions_list = []
-        for q_id, question_text, explanation, question_images, explanation_images in questions:
-            cursor.execute("SELECT id, option_text, is_correct, image FROM options WHERE question_id = ? ORDER BY id", (q_id,))
-            options = cursor.fetchall()
-            if not options:
-                continue
-            
-            fixed_letters = [chr(97 + i) for i in range(len(options))]
-            option_dict = {fixed_letters[i]: text for i, (opt_id, text, _, _) in enumerate(options)}
-            option_images = {fixed_letters[i]: image for i, (opt_id, _, _, image) in enumerate(options)}
-            is_correct_list = [bool(is_correct) for _, _, is_correct, _ in options]
-            
-            # Check if this is a true/false question
-            is_true_false = (
-                len(options) == 2 and
-                {opt[1].lower() for opt in options} == {"true", "false"}
+        if sample is not None:
+            with db.transaction(immediate=False) as conn:
+                header = bank_header(conn, test_bank_id)
+                if not header:
+                    raise HTTPException(status_code=404, detail="Test bank not found.")
+                question_ids = sample_ids(conn, test_bank_id, sample, random.Random())
+                questions = fetch_by_ids(conn, header[0], question_ids, image_store.url_for)
+            random.Random().shuffle(questions)
+            items = question_items(questions, shuffle, seed, selected_fields)
+            return Response(content=http_cache.dumps({"questions": items}), media_type="application/json")
+
+        if format == "ndjson" or after_id is not None or limit is not None:
+            header = bank_header(db.connection(), test_bank_id)
+            if not header:
+                raise HTTPException(status_code=404, detail="Test bank not found.")
+            exam_code, version = header
+            if format == "ndjson":
+                return StreamingResponse(
+                    _stream_questions(test_bank_id, exam_code, after_id or 0, shuffle, seed, selected_fields),
+                    media_type="application/x-ndjson",
+                )
+
+            page_limit = limit or DEFAULT_PAGE_SIZE
+
+            def build_page():
+                with db.transaction(immediate=False) as conn:
+                    questions, last_id = fetch_page(
+                        conn, test_bank_id, exam_code, after_id or 0, page_limit, image_store.url_for
+                    )
+                return http_cache.dumps({
+                    "questions": question_items(questions, shuffle, seed, selected_fields),
+                    "next_after_id": last_id,
+                })
+
+            etag = http_cache.version_etag(
+                "questions-page", test_bank_id, version, shuffle, seed, ",".join(selected_fields), after_id, page_limit
             )
-            
-            # Shuffle options if requested, unless it's a true/false question
-            if shuffle and not is_true_false:
-                indices = list(range(len(options)))
-                random.seed(str(q_id))  # Use question_id as seed for consistent shuffling
-                random.shuffle(indices)
-                shuffled_options = {fixed_letters[i]: options[indices[i]][1] for i in range(len(options))}
-                shuffled_option_images = {fixed_letters[i]: options[indices[i]][3] for i in range(len(options))}
-                shuffled_is_correct = [is_correct_list[indices[i]] for i in range(len(options))]
-            else:
-                shuffled_options = option_dict
-                shuffled_option_images = option_images
-                shuffled_is_correct = is_correct_list
-            
-            correct_answers = [fixed_letters[i] for i, is_correct in enumerate(shuffled_is_correct) if is_correct]
-            correct_answer = ",".join(correct_answers) if correct_answers else ""
-            
-            # Parse question_images and construct URLs
-            question_images_list = json.loads(question_images) if question_images else []
-            question_images_urls = [f"/exams/{exam_code}/images/{img}" if img else None for img in question_images_list]
-            
-            # Parse explanation_images and construct URLs
-            explanation_images_list = json.loads(explanation_images) if explanation_images else []
-            explanation_images_urls = [f"/exams/{exam_code}/images/{img}" if img else None for img in explanation_images_list]
-            
-            # Construct option image URLs
-            option_images_urls = {key: f"/exams/{exam_code}/images/{img}" if img else None for key, img in shuffled_option_images.items()}
-            
-            questions_list.append({
-                "id": q_id,
-                "question": question_text,
-                "options": shuffled_options,
-                "option_images": option_images_urls,
-                "correct_answer": correct_answer,
-                "explanation": explanation or "",
-                "question_images": question_images_urls,
-                "explanation_images": explanation_images_urls
-            })
-        
-        conn.close()
-        return {"questions": questions_list}
+            return http_cache.json_response(request, etag, build_page)
+
+        with db.transaction(immediate=False) as conn:
+            bank = bank_cache.get(conn, test_bank_id)
+        if bank is None:
+            raise HTTPException(status_code=404, detail="Test bank not found.")
+
+        # Identified by the bank's content version, so a revalidation never rebuilds the body
+        field_key = ",".join(selected_fields)
+        etag = http_cache.version_etag("questions", bank.id, bank.version, shuffle, seed, field_key)
+        return http_cache.json_response(
+            request, etag,
+            lambda: http_cache.dumps({"questions": question_items(bank.questions, shuffle, seed, selected_fields)}),
+            cache=response_cache, cache_key=(bank.id, shuffle, seed, field_key),
+        )
+    except HTTPException:
+        raise
     except sqlite3.Error as e:
-        conn.close()
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
     except Exception as e:
-        conn.close()
         raise HTTPException(status_code=500, detail=f"Server error: {str(e)}")
-    
-@app.post("/answer")
-def check_answer(answer: Answer):
-    conn = sqlite3.connect(SQLITE_DB)
-    cursor = conn.cursor()
-    
-    # Fetch question details
-    cursor.execute("SELECT id, test_bank_id, question_text, explanation, explanation_images FROM questions WHERE id = ?", (answer.question_id,))
-    question = cursor.fetchone()
-    if not question:
-        conn.close()
+
+@app.get("/questions/{question_id}/explanation")
+def get_question_explanation(request: Request, question_id: int):
+    key = _answer_key(question_id)
+    bank = bank_cache.get(db.connection(), key.test_bank_id)
+    question = bank.question(question_id) if bank else None
+    if question is None:
         raise HTTPException(status_code=404, detail="Question not found.")
-    
-    question_id, test_bank_id, question_text, explanation, explanation_images = question
-    print(f"Question {question_id}: {question_text}")
-    
-    # Fetch options
-    cursor.execute("SELECT id, option_text, is_correct FROM options WHERE question_id = ? ORDER BY id", (question_id,))
-    options = cursor.fetchall()
-    if not options:
-        conn.close()
+    etag = http_cache.version_etag("explanation", question_id, bank.version)
+    return http_cache.json_response(request, etag, lambda: http_cache.dumps({
+        "id": question_id,
+        "explanation": question.explanation,
+        "explanation_images": list(question.explanation_images)
+    }))
+
+@app.get("/search")
+def search_questions(
+    q: str = Query(..., min_length=1),
+    test_bank_id: Optional[int] = None,
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    raw: bool = False,
+):
+    # Plain text by default; raw=true passes FTS5 query syntax (phrases, OR, NEAR, column:term) through
+    query = q if raw else search.match_expression(q)
+    if not query:
+        return {"results": [], "has_more": False}
+    try:
+        results = search.search(db.connection(), query, test_bank_id, limit, offset)
+    except sqlite3.OperationalError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid search query: {e}")
+    return {"results": results[:limit], "has_more": len(results) > limit}
+
+def _answer_key(question_id):
+    key = answer_keys.lookup(question_id)
+    if key is not None:
+        return key
+    if answer_keys.is_missing(question_id):
         raise HTTPException(status_code=404, detail="No options found for question.")
-    
-    # Map options to letters (a, b, c, ...)
-    fixed_letters = [chr(97 + i) for i in range(len(options))]
-    option_details = [(opt[1], opt[2], fixed_letters[i], opt[0]) for i, opt in enumerate(options)]
-    print(f"Original options (text, is_correct, letter, option_id): {option_details}")
-    
-    # Check if this is a true/false question (to skip shuffling)
-    is_true_false = (
-        len(options) == 2 and
-        {opt[1].lower() for opt in options} == {"true", "false"}
-    )
-    
-    # Apply the same shuffling logic as /questions
-    is_correct_list = [bool(opt[2]) for opt in options]
-    if not is_true_false:  # Shuffle for multiple-choice questions
-        indices = list(range(len(options)))
-        random.seed(str(question_id))  # Use question_id as seed for consistent shuffling
-        random.shuffle(indices)
-        shuffled_options = [(options[indices[i]][1], is_correct_list[indices[i]], fixed_letters[i], options[indices[i]][0]) for i in range(len(options))]
+
+    # First answer for this bank: compile it once and index every question's key
+    generation = answer_keys.generation
+    with db.transaction(immediate=False) as conn:
+        row = conn.execute("SELECT test_bank_id FROM questions WHERE id = ?", (question_id,)).fetchone()
+        if not row:
+            raise HTTPException(status_code=404, detail="Question not found.")
+        bank = bank_cache.get(conn, row[0])
+    if bank is None:
+        raise HTTPException(status_code=404, detail="Test bank not found.")
+    if not answer_keys.add_bank(bank, generation):
+        # Invalidated while compiling: grade against this copy without indexing it
+        question = bank.question(question_id)
+        if question is None:
+            raise HTTPException(status_code=404, detail="No options found for question.")
+        return AnswerKey(bank.id, len(question.options), question.is_true_false, stored_mask(question))
+
+    key = answer_keys.lookup(question_id)
+    if key is None:
+        answer_keys.add_missing(bank.id, question_id, generation)
+        raise HTTPException(status_code=404, detail="No options found for question.")
+    return key
+
+def _log_answer(key, question_id, selected_mask, correct, shuffle, seed, session_id=None):
+    if selected_mask <= 0:
+        return
+    stored = key.stored_selection(question_id, selected_mask, shuffle, seed)
+    event = answer_log.record(key.test_bank_id, question_id, stored, correct, session_id)
+    # Reschedule right away so the next /practice/next does not repeat it before the log is written
+    if event is None:
+        practice_scheduler.record(key.test_bank_id, question_id, correct, pending=False)
     else:
-        shuffled_options = option_details
-    
-    print(f"Shuffled options (text, is_correct, letter, option_id): {shuffled_options}")
-    
-    # Get correct answer letters based on shuffled order
-    correct_indices = [fixed_letters[i] for i in range(len(shuffled_options)) if shuffled_options[i][1]]
-    correct_answer = ",".join(correct_indices) if correct_indices else ""
-    print(f"Correct answer letters (shuffled): {correct_answer}")
-    
-    # Fetch exam code for image URLs
-    cursor.execute("SELECT exam_code FROM test_banks WHERE id = ?", (test_bank_id,))
-    exam_code_result = cursor.fetchone()
-    if not exam_code_result:
+        practice_scheduler.record(key.test_bank_id, question_id, correct, now=event.created_at)
+
+@app.post("/answer")
+def check_answer(answer: Answer):
+    key = _answer_key(answer.question_id)
+    selected_mask, key_mask, correct = grade(key, answer)
+    logger.debug("Graded question %d: selected=%r correct=%s", answer.question_id, answer.selected_answer, correct)
+    _log_answer(key, answer.question_id, selected_mask, correct, answer.shuffle, answer.seed)
+
+    # Explanations come from the compiled bank, which is normally already in memory
+    bank = bank_cache.get(db.connection(), key.test_bank_id)
+    question = bank.question(answer.question_id) if bank else None
+    if question is None:
+        raise HTTPException(status_code=404, detail="Question not found.")
+
+    return {
+        "correct": correct,
+        "correct_answer": mask_to_answer(key_mask),
+        "explanation": question.explanation,
+        "explanation_images": list(question.explanation_images)
+    }
+
+@app.post("/answers/batch")
+def check_answers_batch(batch: AnswerBatch):
+    keys = {}
+    missing = []
+    for answer in batch.answers:
+        try:
+            keys[answer.question_id] = _answer_key(answer.question_id)
+        except HTTPException:
+            missing.append(answer.question_id)
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Questions not found: {missing}")
+
+    results = []
+    score = 0
+    for answer in batch.answers:
+        key = keys[answer.question_id]
+        selected_mask, key_mask, correct = grade(key, answer)
+        _log_answer(key, answer.question_id, selected_mask, correct, answer.shuffle, answer.seed)
+        score += correct
+        results.append({
+            "question_id": answer.question_id,
+            "correct": correct,
+            "correct_answer": mask_to_answer(key_mask)
+        })
+    return {"results": results, "score": score, "total_questions": len(results)}
+
+@app.get("/test_banks/{test_bank_id}/question_stats")
+def get_question_stats(
+    test_bank_id: int,
+    sort: str = Query("id", pattern="^(id|hardest|easiest|attempts)$"),
+    limit: Optional[int] = Query(None, ge=1),
+):
+    # Served from the rollup tables; answers still queued for the writer are not counted yet
+    with db.transaction(immediate=False) as conn:
+        bank = bank_cache.get(conn, test_bank_id)
+        if bank is None:
+            raise HTTPException(status_code=404, detail="Test bank not found.")
+        stats = answer_events.read_bank_stats(conn, test_bank_id)
+
+    items = []
+    for question_id, (attempts, correct_count, picks) in stats.items():
+        question = bank.question(question_id)
+        if question is None:
+            continue
+        options = [
+            {
+                "option": chr(97 + index),
+                "text": text,
+                "is_correct": question.is_correct[index],
+                "picks": picks.get(index, 0),
+            }
+            for index, text in enumerate(question.options)
+        ]
+        distractors = [o for o in options if not o["is_correct"] and o["picks"]]
+        items.append({
+            "question_id": question_id,
+            "attempts": attempts,
+            "correct": correct_count,
+            "percent_correct": bank_stats.percentage(correct_count, attempts),
+            "most_chosen_distractor": max(distractors, key=lambda o: o["picks"]) if distractors else None,
+            "options": options,
+        })
+
+    if sort == "hardest":
+        items.sort(key=lambda item: (item["percent_correct"], -item["attempts"]))
+    elif sort == "easiest":
+        items.sort(key=lambda item: (-item["percent_correct"], -item["attempts"]))
+    elif sort == "attempts":
+        items.sort(key=lambda item: -item["attempts"])
+    if limit is not None:
+        items = items[:limit]
+    return {"test_bank_id": test_bank_id, "questions": items}
+
+@app.get("/test_banks/{test_bank_id}/practice/next")
+def get_practice_next(
+    test_bank_id: int,
+    n: int = Query(20, ge=1, le=500),
+    shuffle: bool = Query(False),
+    seed: Optional[str] = Query(None),
+    fields: Optional[str] = Query(None, description="Comma-separated question fields to return"),
+    mode: str = Query("lean", description="'full' also returns answers and explanations"),
+):
+    # Questions due for review come first (most overdue first), then ones never answered,
+    # then the soonest upcoming reviews. Answer them through /answer with the same shuffle and seed.
+    selected_fields = parse_fields(fields, mode)
+    with db.transaction(immediate=False) as conn:
+        bank = bank_cache.get(conn, test_bank_id)
+        if bank is None:
+            raise HTTPException(status_code=404, detail="Test bank not found.")
+        picked = practice_scheduler.next(conn, bank, n)
+
+    questions = [bank.question(question_id) for question_id, _, _ in picked]
+    items = question_items(questions, shuffle, seed, selected_fields)
+    for item, (_, reason, state) in zip(items, picked):
+        item["practice"] = {
+            "reason": reason,
+            "due_at": state.due_at if state else None,
+            "lapses": state.lapses if state else 0,
+        }
+    return {"test_bank_id": test_bank_id, "questions": items}
+
+def _export_chunks(test_bank_id, encoding):
+    conn = db.connect()
+    try:
+        chunks = exporter.iter_export(conn, test_bank_id)
+        if encoding == "gzip":
+            chunks = exporter.gzip_stream(chunks)
+        yield from chunks
+    finally:
         conn.close()
+
+@app.get("/test_banks/{test_bank_id}/export")
+def export_test_bank(request: Request, test_bank_id: int):
+    header = bank_header(db.connection(), test_bank_id)
+    if not header:
         raise HTTPException(status_code=404, detail="Test bank not found.")
-    exam_code = exam_code_result[0]
-    
-    # Parse explanation images
-    explanation_images_list = json.loads(explanation_images) if explanation_images else []
-    explanation_images_urls = [f"/exams/{exam_code}/images/{img}" if img else None for img in explanation_images_list]
-    
-    # Handle selected answer
-    selected = answer.selected_answer.strip() if answer.selected_answer else ""
-    print(f"Received selected_answer: '{selected}'")
-    
-    # Convert selected answer to lowercase set
-    selected_letters = set(selected.lower().split(",")) if selected else set()
-    correct_answers = set(correct_answer.split(",")) if correct_answer else set()
-    
-    # Remove empty strings
-    selected_letters.discard("")
-    print(f"Processed selected letters: {selected_letters}")
-    print(f"Correct answers: {correct_answers}")
-    
-    # Check if selected letters match correct answers exactly
-    is_correct = selected_letters == correct_answers and selected_letters != set()
-    print(f"Is correct: {is_correct}")
-    
-    response = {
-        "correct": is_correct,
-        "correct_answer": correct_answer,
-        "explanation": explanation or "",
-        "explanation_images": explanation_images_urls
-    }
-    print(f"Response: {response}")
-    
-    conn.close()
-    return response
+    # Streamed from its own connection and cursor; gzip is the only encoding compressed on the fly
+    encoding = http_cache.choose_encoding(request, supported=("gzip",))
+    filename = header[0].replace('"', "")
+    headers = {"Content-Disposition": f'attachment; filename="{filename}.json"', "Vary": "Accept-Encoding"}
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return StreamingResponse(
+        _export_chunks(test_bank_id, encoding), media_type="application/json", headers=headers
+    )
+
+def _invalidate_bank(test_bank_id):
+    bank_cache.invalidate(test_bank_id)
+    answer_keys.invalidate(test_bank_id)
+    response_cache.invalidate(test_bank_id)
+    practice_scheduler.invalidate(test_bank_id)
 
-@app.post("/import")
-async def import_questions(file: UploadFile):
-    conn = sqlite3.connect(SQLITE_DB)
-    cursor = conn.cursor()
+def _sweep_images():
     try:
-        content = await file.read()
-        if file.filename.endswith('.json'):
-            data = json.loads(content)
-            exam_name = data.get('exam_name')
-            exam_code = data.get('exam_code')
-            questions = data.get('questions', [])
-            if not exam_name or not exam_code or not questions:
-                raise HTTPException(status_code=400, detail="Invalid JSON format: 'exam_name', 'exam_code', or 'questions' missing.")
-
-            cursor.execute("SELECT id FROM test_banks WHERE name = ? OR exam_code = ?", (exam_name, exam_code))
-            bank = cursor.fetchone()
-            if not bank:
-                cursor.execute("INSERT INTO test_banks (name, exam_code) VALUES (?, ?)", (exam_name, exam_code))
-                bank_id = cursor.lastrowid
-            else:
-                bank_id = bank[0]
-
-            exam_image_dir = f"exams/{exam_code}/images"
-            os.makedirs(exam_image_dir, exist_ok=True)
-
-            for index, q in enumerate(questions, start=1):
-                try:
-                    question_text = q.get("question")
-                    explanation = q.get("explanation")
-                    question_images = q.get("question_images")
-                    explanation_images = q.get("explanation_images")
-                    if not question_text:
-                        raise ValueError(f"'question' is empty or missing in question at position {index}")
-
-                    # Convert lists to JSON strings for storage
-                    question_images_json = json.dumps(question_images) if question_images else None
-                    explanation_images_json = json.dumps(explanation_images) if explanation_images else None
-
-                    cursor.execute("""
-                        INSERT INTO questions (test_bank_id, question_text, explanation, question_images, explanation_images)
-                        VALUES (?, ?, ?, ?, ?)
-                    """, (bank_id, question_text, explanation, question_images_json, explanation_images_json))
-                    question_id = cursor.lastrowid
-
-                    options = q.get("options", [])
-                    for opt in options:
-                        option_text = opt.get("text")
-                        is_correct = bool(opt.get("is_correct", False))
-                        option_image = opt.get("image")
-                        if option_text:
-                            cursor.execute("""
-                                INSERT INTO options (question_id, option_text, is_correct, image)
-                                VALUES (?, ?, ?, ?)
-                            """, (question_id, option_text, is_correct, option_image))
-
-                except Exception as e:
-                    conn.rollback()
-                    raise HTTPException(
-                        status_code=400,
-                        detail=f"Failed to process question at position {index}: {str(e)}. Problematic data: {json.dumps(q)}"
-                    )
+        # One worker sweeps; the others pick up the new URLs through the cache generation
+        with coherence.exclusive(SQLITE_DB + ".sweep.lock", blocking=False) as acquired:
+            if acquired:
+                image_store.sweep("exams", on_change=_invalidate_bank)
+    except Exception:
+        logger.exception("Image sweep failed")
+
+@app.get("/images/{filename}")
+def get_image(request: Request, filename: str, w: Optional[int] = Query(None, ge=1)):
+    digest = images.parse_filename(filename)
+    response = image_store.response(request, digest, w) if digest else None
+    if response is None:
+        raise HTTPException(status_code=404, detail="Image not found.")
+    return response
 
-            conn.commit()
-            conn.close()
-            return {"message": f"Successfully imported questions into {exam_name} ({exam_code})"}
-        else:
-            raise HTTPException(status_code=400, detail="Unsupported file type. Please upload a JSON file.")
+def _run_import_job(path, job, batch_size, duplicates):
+    try:
+        run_import(
+            db, path, job, batch_size=batch_size, on_commit=_invalidate_bank,
+            duplicates=duplicates, duplicate_threshold=DUPLICATE_THRESHOLD,
+            image_store=image_store, image_workers=IMPORT_IMAGE_WORKERS, exams_lock=EXAMS_LOCK
+        )
+    finally:
+        os.remove(path)
+        import_jobs.publish(job)
+
+@app.post("/import", status_code=202)
+async def import_questions(
+    file: UploadFile,
+    batch_size: int = Query(IMPORT_BATCH_SIZE, ge=1, le=50000),
+    duplicates: str = "report",
+):
+    suffix = os.path.splitext(file.filename or "")[1].lower()
+    if suffix not in ('.json', '.zip'):
+        raise HTTPException(status_code=400, detail="Unsupported file type. Please upload a JSON file or a ZIP bundle.")
+    if duplicates not in DUPLICATE_POLICIES:
+        raise HTTPException(status_code=400, detail=f"duplicates must be one of: {', '.join(DUPLICATE_POLICIES)}")
+
+    # The upload's spooled file is closed with the request, so the job gets its own copy
+    fd, path = tempfile.mkstemp(prefix="import-", suffix=suffix)
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = await file.read(IMPORT_CHUNK_SIZE)
+                if not chunk:
+                    break
+                out.write(chunk)
     except Exception as e:
-        conn.close()
+        os.remove(path)
         raise HTTPException(status_code=400, detail=f"Failed to process file: {str(e)}")
 
+    job = import_jobs.create(file.filename)
+    import_executor.submit(_run_import_job, path, job, batch_size, duplicates)
+    return {"job_id": job.id, "status": job.status, "message": f"Import of {file.filename} started"}
+
+@app.get("/import/{job_id}")
+def get_import_job(job_id: str):
+    status = import_jobs.status(job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Import job not found.")
+    return status
+
 @app.delete("/test_banks/{test_bank_id}")
 def delete_test_bank(test_bank_id: int):
-    conn = sqlite3.connect(SQLITE_DB)
-    cursor = conn.cursor()
     try:
-        cursor.execute("DELETE FROM questions WHERE test_bank_id = ?", (test_bank_id,))
-        cursor.execute("DELETE FROM test_banks WHERE id = ?", (test_bank_id,))
-        if cursor.rowcount == 0:
-            raise HTTPException(status_code=404, detail="Test bank not found")
-        conn.commit()
+        with db.transaction() as conn:
+            if not reaper.soft_delete(conn.cursor(), test_bank_id):
+                raise HTTPException(status_code=404, detail="Test bank not found")
+        session_store.forget_bank(test_bank_id)
+        _invalidate_bank(test_bank_id)
+        # Questions, options, results and images are removed in the background
+        bank_reaper.wake()
         return {"message": "Test bank and associated questions deleted successfully"}
+    except HTTPException:
+        raise
     except Exception as e:
-        conn.rollback()
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        conn.close()
+
+def _save_result(cursor, test_bank_id, score, total_questions):
+    # Same format as CURRENT_TIMESTAMP, chosen here so the rollup buckets match the stored row
+    timestamp = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime())
+    cursor.execute(
+        "INSERT INTO exam_results (test_bank_id, score, total_questions, timestamp) VALUES (?, ?, ?, ?)",
+        (test_bank_id, score, total_questions, timestamp)
+    )
+    bank_stats.record_result(cursor, test_bank_id, score, total_questions, timestamp)
+    return cursor.lastrowid
 
 @app.post("/exam_results")
 def save_exam_result(request: ExamResultRequest):
-    conn = sqlite3.connect(SQLITE_DB)
-    cursor = conn.cursor()
     try:
-        cursor.execute(
-            "INSERT INTO exam_results (test_bank_id, score, total_questions) VALUES (?, ?, ?)",
-            (request.test_bank_id, request.score, request.total_questions)
-        )
-
-        cursor.execute(
-            "SELECT COUNT(*) FROM exam_results WHERE test_bank_id = ?",
-            (request.test_bank_id,)
-        )
-        result_count = cursor.fetchone()[0]
-
-        if result_count > 3:
-            to_delete = result_count - 3
-            cursor.execute(
-                """
-                DELETE FROM exam_results
-                WHERE id IN (
-                    SELECT id FROM exam_results
-                    WHERE test_bank_id = ?
-                    ORDER BY timestamp ASC
-                    LIMIT ?
-                )
-                """,
-                (request.test_bank_id, to_delete)
-            )
-
-        conn.commit()
-        result_id = cursor.lastrowid
-        conn.close()
+        with db.transaction() as conn:
+            result_id = _save_result(conn.cursor(), request.test_bank_id, request.score, request.total_questions)
         return {"id": result_id, "message": "Result saved successfully"}
     except sqlite3.Error as e:
-        conn.rollback()
-        conn.close()
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/exam_results/{test_bank_id}")
 def get_exam_results(test_bank_id: int):
-    conn = sqlite3.connect(SQLITE_DB)
-    cursor = conn.cursor()
+    cursor = db.connection().cursor()
     cursor.execute("""
         SELECT score, total_questions, timestamp 
         FROM exam_results 
@@ -466,7 +676,6 @@ def get_exam_results(test_bank_id: int):
         LIMIT 10
     """, (test_bank_id,))
     results = cursor.fetchall()
-    conn.close()
     return {
         "results": [
             {
@@ -480,25 +689,138 @@ def get_exam_results(test_bank_id: int):
     }
 
 @app.get("/exam_history/{test_bank_id}")
-def get_exam_history(test_bank_id: int):
-    conn = sqlite3.connect(SQLITE_DB)
-    cursor = conn.cursor()
-    cursor.execute("""
-        SELECT score, total_questions, timestamp 
-        FROM exam_results 
-        WHERE test_bank_id = ? 
-        ORDER BY timestamp DESC
-    """, (test_bank_id,))
-    results = cursor.fetchall()
-    conn.close()
+def get_exam_history(
+    test_bank_id: int,
+    bucket: Optional[str] = Query(None, pattern="^(day|week)$", description="Aggregate attempts per day or week"),
+    window: int = Query(7, ge=1, le=365, description="Buckets in the moving average"),
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    before_id: Optional[int] = Query(None, description="Keyset cursor: attempts older than this result id"),
+):
+    conn = db.connection()
+    if bucket is not None:
+        return {
+            "bucket": bucket,
+            "window": window,
+            "buckets": bank_stats.read_rollups(conn, test_bank_id, bucket, limit or DEFAULT_HISTORY_BUCKETS, window),
+        }
+
+    page_limit = limit or DEFAULT_HISTORY_PAGE
+    results = conn.execute("""
+        SELECT id, score, total_questions, timestamp
+        FROM exam_results
+        WHERE test_bank_id = ? AND id < ?
+        ORDER BY id DESC
+        LIMIT ?
+    """, (test_bank_id, before_id if before_id is not None else 2 ** 63 - 1, page_limit)).fetchall()
     return {
         "history": [
             {
-                "score": r[0],
-                "total_questions": r[1],
-                "timestamp": str(r[2]),
-                "percentage": (r[0] / r[1] * 100) if r[1] > 0 else 0
+                "id": r[0],
+                "score": r[1],
+                "total_questions": r[2],
+                "timestamp": str(r[3]),
+                "percentage": (r[1] / r[2] * 100) if r[2] > 0 else 0
             }
             for r in results
-        ]
-    }
\ No newline at end of file
+        ],
+        "next_before_id": results[-1][0] if len(results) == page_limit else None,
+    }
+
+def _get_session(session_id):
+    session = session_store.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Session not found.")
+    return session
+
+def _session_question(session, index):
+    bank = bank_cache.get(db.connection(), session.test_bank_id)
+    question = bank.question(session.question_ids[index]) if bank else None
+    if question is None:
+        raise HTTPException(status_code=409, detail="The test bank changed since this session started.")
+    return question
+
+@app.post("/sessions")
+def create_session(request: SessionRequest):
+    with db.transaction(immediate=False) as conn:
+        bank = bank_cache.get(conn, request.test_bank_id)
+    if bank is None:
+        raise HTTPException(status_code=404, detail="Test bank not found.")
+    question_ids = [q.id for q in bank.questions]
+    if not question_ids:
+        raise HTTPException(status_code=400, detail="Test bank has no questions.")
+    if request.sample:
+        question_ids = random.Random().sample(question_ids, min(request.sample, len(question_ids)))
+
+    session = session_store.create(request.test_bank_id, question_ids, request.shuffle)
+    return {"session_id": session.id, "test_bank_id": session.test_bank_id, "total_questions": session.total}
+
+@app.get("/sessions/{session_id}/next")
+def get_session_next(session_id: str):
+    session = _get_session(session_id)
+    if session.finished_at is not None or session.position >= session.total:
+        return {"done": True, "answered": session.answered(), "total_questions": session.total}
+
+    index = session.position
+    question = _session_question(session, index)
+    item = question_items([question], session.shuffle, session.seed, LEAN_FIELDS)[0]
+    return {"done": False, "index": index, "total_questions": session.total, "question": item}
+
+@app.post("/sessions/{session_id}/answer")
+def answer_session_question(session_id: str, answer: SessionAnswer):
+    session = _get_session(session_id)
+    if session.finished_at is not None:
+        raise HTTPException(status_code=409, detail="Session is already finished.")
+    if answer.question_id is None:
+        index = session.position
+        if index >= session.total:
+            raise HTTPException(status_code=409, detail="All questions have been answered.")
+    else:
+        try:
+            index = session.question_ids.index(answer.question_id)
+        except ValueError:
+            raise HTTPException(status_code=404, detail="Question is not part of this session.")
+
+    question_id = session.question_ids[index]
+    selected_mask = parse_selection(answer.selected_answer or "")
+    if selected_mask <= 0:
+        raise HTTPException(status_code=400, detail="selected_answer must be one or more option letters.")
+    key = _answer_key(question_id)
+    key_mask = key.displayed_mask(question_id, session.shuffle, session.seed)
+    correct = is_correct(selected_mask, key_mask)
+    if not session_store.record(session, index, selected_mask, correct):
+        raise HTTPException(status_code=409, detail="Question was already answered.")
+    _log_answer(key, question_id, selected_mask, correct, session.shuffle, session.seed, session.id)
+
+    question = _session_question(session, index)
+    return {
+        "question_id": question_id,
+        "correct": correct,
+        "correct_answer": mask_to_answer(key_mask),
+        "explanation": question.explanation,
+        "explanation_images": list(question.explanation_images),
+        "answered": session.answered(),
+        "total_questions": session.total
+    }
+
+@app.post("/sessions/{session_id}/finish")
+def finish_session(session_id: str):
+    session = _get_session(session_id)
+    try:
+        with db.transaction() as conn:
+            if not session_store.mark_finished(session, conn):
+                raise HTTPException(status_code=409, detail="Session is already finished.")
+            # The score is computed from graded answers, never taken from the client
+            score = session.score()
+            result_id = _save_result(conn.cursor(), session.test_bank_id, score, session.total)
+            session_store.save(conn, session)
+    except sqlite3.Error as e:
+        session.finished_at = None
+        session.dirty = True
+        raise HTTPException(status_code=500, detail=str(e))
+
+    return {
+        "id": result_id,
+        "score": score,
+        "total_questions": session.total,
+        "percentage": bank_stats.percentage(score, session.total)
+    }
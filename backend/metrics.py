@@ -0,0 +1,262 @@
+import bisect
+import contextvars
+import logging
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Per-route request latency and SQL activity, exposed in the Prometheus text
+# format. Everything is kept in process memory; under several workers each
+# process reports its own series.
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 500)
+
+
+class Histogram:
+    def __init__(self, name, help, labels, buckets):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = [(key, list(counts), total, count) for key, (counts, total, count) in self._series.items()]
+        for label_values, counts, total, count in sorted(series):
+            labels = _labels(self.labels, label_values)
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{self.name}_bucket{_labels(self.labels + ('le',), label_values + (le,))} {cumulative}")
+            lines.append(f"{self.name}_sum{labels} {total}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def render(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter", f"{self.name} {self.value}"]
+
+
+class Gauge:
+    """Value read from a callback at scrape time."""
+
+    def __init__(self, name, help, read):
+        self.name = name
+        self.help = help
+        self.read = read
+
+    def render(self):
+        try:
+            value = self.read()
+        except Exception:
+            logger.exception("Failed to read gauge %s", self.name)
+            return []
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge", f"{self.name} {value}"]
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def gauge(self, name, help, read):
+        return self.register(Gauge(name, help, read))
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+request_duration = registry.register(Histogram(
+    "http_request_duration_seconds", "Request latency by route template.",
+    ("method", "route", "status"), LATENCY_BUCKETS,
+))
+request_queries = registry.register(Histogram(
+    "http_request_sql_queries", "SQL statements executed per request.",
+    ("method", "route"), QUERY_COUNT_BUCKETS,
+))
+request_sql_time = registry.register(Histogram(
+    "http_request_sql_seconds", "Time spent in SQLite per request.",
+    ("method", "route"), LATENCY_BUCKETS,
+))
+sql_statements = registry.register(Counter("sqlite_statements_total", "SQL statements executed by any thread."))
+sql_seconds = registry.register(Counter("sqlite_statement_seconds_total", "Time spent executing SQL statements."))
+
+
+class RequestStats:
+    __slots__ = ("queries", "sql_seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_seconds = 0.0
+
+
+# Set by the middleware; sync routes see it too because the threadpool copies the context
+current_request = contextvars.ContextVar("current_request", default=None)
+
+
+def _record(elapsed):
+    sql_statements.inc()
+    sql_seconds.inc(elapsed)
+    stats = current_request.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.sql_seconds += elapsed
+
+
+class TracedCursor(sqlite3.Cursor):
+    """Cursor that counts and times statements.
+
+    Timing covers execute() and the fetch*() calls; rows pulled by iterating
+    the cursor directly are not timed, to keep streaming loops cheap.
+    """
+
+    def execute(self, *args):
+        start = time.perf_counter()
+        try:
+            return super().execute(*args)
+        finally:
+            _record(time.perf_counter() - start)
+
+    def executemany(self, *args):
+        start = time.perf_counter()
+        try:
+            return super().executemany(*args)
+        finally:
+            _record(time.perf_counter() - start)
+
+    def _timed_fetch(self, fetch, *args):
+        start = time.perf_counter()
+        try:
+            return fetch(*args)
+        finally:
+            elapsed = time.perf_counter() - start
+            sql_seconds.inc(elapsed)
+            stats = current_request.get()
+            if stats is not None:
+                stats.sql_seconds += elapsed
+
+    def fetchone(self):
+        return self._timed_fetch(super().fetchone)
+
+    def fetchmany(self, *args):
+        return self._timed_fetch(super().fetchmany, *args)
+
+    def fetchall(self):
+        return self._timed_fetch(super().fetchall)
+
+
+class TracedConnection(sqlite3.Connection):
+    """Connection factory for Database that routes every statement through TracedCursor."""
+
+    def cursor(self, factory=TracedCursor):
+        return super().cursor(factory)
+
+    def execute(self, *args):
+        return self.cursor().execute(*args)
+
+    def executemany(self, *args):
+        return self.cursor().executemany(*args)
+
+
+def route_label(scope):
+    route = scope.get("route")
+    return getattr(route, "path", None) or "other"
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording per-route latency and SQL activity.
+
+    Written as plain ASGI rather than BaseHTTPMiddleware so streamed
+    responses are timed to their last chunk and are not buffered.
+    """
+
+    def __init__(self, app, slow_request_seconds=1.0):
+        self.app = app
+        self.slow_request_seconds = slow_request_seconds
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = current_request.set(stats)
+        status = 500
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            current_request.reset(token)
+            method = scope["method"]
+            route = route_label(scope)
+            request_duration.observe(elapsed, method, route, str(status))
+            request_queries.observe(stats.queries, method, route)
+            request_sql_time.observe(stats.sql_seconds, method, route)
+
+            level = logging.WARNING if elapsed >= self.slow_request_seconds else logging.DEBUG
+            if logger.isEnabledFor(level):
+                logger.log(level, "%s %s %d in %.1f ms", method, scope["path"], status, elapsed * 1000, extra={
+                    "method": method,
+                    "route": route,
+                    "status": status,
+                    "duration_ms": round(elapsed * 1000, 3),
+                    "sql_queries": stats.queries,
+                    "sql_ms": round(stats.sql_seconds * 1000, 3),
+                })
@@ -0,0 +1,304 @@
+import logging
+
+import bank_stats
+import practice
+import search
+
+logger = logging.getLogger(__name__)
+
+
+def _base_schema(cursor):
+    # Create tables if they don't exist (safe for existing databases)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS test_banks (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT UNIQUE NOT NULL,
+            exam_code TEXT NOT NULL
+        )
+    """)
+
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS questions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            test_bank_id INTEGER,
+            question_text TEXT NOT NULL,
+            explanation TEXT,
+            question_images TEXT,
+            explanation_images TEXT,
+            FOREIGN KEY (test_bank_id) REFERENCES test_banks(id)
+        )
+    """)
+
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS options (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            question_id INTEGER,
+            option_text TEXT NOT NULL,
+            is_correct BOOLEAN NOT NULL DEFAULT FALSE,
+            image TEXT,
+            FOREIGN KEY (question_id) REFERENCES questions(id)
+        )
+    """)
+
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS exam_results (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            test_bank_id INTEGER NOT NULL,
+            score INTEGER NOT NULL,
+            total_questions INTEGER NOT NULL,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (test_bank_id) REFERENCES test_banks(id)
+        )
+    """)
+
+
+def _foreign_key_indexes(cursor):
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_questions_bank ON questions (test_bank_id, id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_options_question ON options (question_id, id)")
+    # Covers the "last N results" reads, so they never touch the table itself
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_exam_results_bank_time
+        ON exam_results (test_bank_id, timestamp DESC, score, total_questions)
+    """)
+    cursor.execute("ANALYZE")
+
+
+def _bank_stats(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS bank_stats (
+            test_bank_id INTEGER PRIMARY KEY,
+            question_count INTEGER NOT NULL DEFAULT 0,
+            attempt_count INTEGER NOT NULL DEFAULT 0,
+            percentage_sum REAL NOT NULL DEFAULT 0,
+            best_percentage REAL,
+            last_scores TEXT NOT NULL DEFAULT '[]'
+        )
+    """)
+    bank_stats.rebuild(cursor)
+
+
+def _content_versions(cursor):
+    cursor.execute("ALTER TABLE test_banks ADD COLUMN content_version INTEGER NOT NULL DEFAULT 1")
+
+
+def _exam_sessions(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS exam_sessions (
+            id TEXT PRIMARY KEY,
+            test_bank_id INTEGER NOT NULL,
+            seed TEXT NOT NULL,
+            shuffle BOOLEAN NOT NULL,
+            question_ids BLOB NOT NULL,
+            responses BLOB NOT NULL,
+            correct BLOB NOT NULL,
+            position INTEGER NOT NULL DEFAULT 0,
+            created_at REAL NOT NULL,
+            updated_at REAL NOT NULL,
+            finished_at REAL
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_exam_sessions_bank ON exam_sessions (test_bank_id)")
+
+
+def _answer_events(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS answer_events (
+            id INTEGER PRIMARY KEY,
+            test_bank_id INTEGER NOT NULL,
+            question_id INTEGER NOT NULL,
+            session_id TEXT,
+            selected_mask INTEGER NOT NULL,
+            correct BOOLEAN NOT NULL,
+            created_at REAL NOT NULL
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_answer_events_bank ON answer_events (test_bank_id, question_id)")
+    # Rollups are clustered by bank so question_stats reads are a single range scan
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS question_stats (
+            test_bank_id INTEGER NOT NULL,
+            question_id INTEGER NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            correct_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (test_bank_id, question_id)
+        ) WITHOUT ROWID
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS option_stats (
+            test_bank_id INTEGER NOT NULL,
+            question_id INTEGER NOT NULL,
+            option_index INTEGER NOT NULL,
+            picks INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (test_bank_id, question_id, option_index)
+        ) WITHOUT ROWID
+    """)
+
+
+def _question_search(cursor):
+    search.create(cursor)
+    search.rebuild(cursor)
+
+
+def _question_signatures(cursor):
+    # MinHash signatures for import-time dedup; missing rows are computed lazily
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS question_signatures (
+            question_id INTEGER PRIMARY KEY,
+            signature BLOB NOT NULL
+        )
+    """)
+
+
+def _image_store(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS images (
+            digest TEXT PRIMARY KEY,
+            ext TEXT NOT NULL,
+            content_type TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            created_at REAL NOT NULL
+        ) WITHOUT ROWID
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS image_names (
+            exam_code TEXT NOT NULL,
+            name TEXT NOT NULL,
+            digest TEXT NOT NULL,
+            source_mtime REAL,
+            PRIMARY KEY (exam_code, name)
+        ) WITHOUT ROWID
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_image_names_digest ON image_names (digest)")
+
+
+def _soft_delete(cursor):
+    # Deleted banks stay hidden until the reaper has removed their rows
+    cursor.execute("ALTER TABLE test_banks ADD COLUMN deleted_at REAL")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_test_banks_deleted ON test_banks (deleted_at) WHERE deleted_at IS NOT NULL")
+
+
+def _result_rollups(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS result_rollups (
+            test_bank_id INTEGER NOT NULL,
+            bucket TEXT NOT NULL,
+            period_start TEXT NOT NULL,
+            attempts INTEGER NOT NULL,
+            percentage_sum REAL NOT NULL,
+            best_percentage REAL NOT NULL,
+            PRIMARY KEY (test_bank_id, bucket, period_start)
+        ) WITHOUT ROWID
+    """)
+    # Keyset pages of a bank's raw history, newest first, without touching the table
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_exam_results_bank_id
+        ON exam_results (test_bank_id, id, score, total_questions, timestamp)
+    """)
+    bank_stats.rebuild_rollups(cursor)
+
+
+def _cache_generation(cursor):
+    # Single-row counter bumped whenever cached bank data changes, so other worker processes notice
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS cache_generation (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            generation INTEGER NOT NULL
+        )
+    """)
+    cursor.execute("INSERT OR IGNORE INTO cache_generation (id, generation) VALUES (1, 0)")
+
+
+def _import_jobs(cursor):
+    # Import job status as published for workers other than the one running the job
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS import_jobs (
+            id TEXT PRIMARY KEY,
+            created_at REAL NOT NULL,
+            status TEXT NOT NULL
+        )
+    """)
+
+
+def _practice_schedule(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS practice_schedule (
+            test_bank_id INTEGER NOT NULL,
+            question_id INTEGER NOT NULL,
+            due_at REAL NOT NULL,
+            ease REAL NOT NULL,
+            interval REAL NOT NULL,
+            reps INTEGER NOT NULL,
+            lapses INTEGER NOT NULL,
+            updated_seq INTEGER NOT NULL,
+            PRIMARY KEY (test_bank_id, question_id)
+        ) WITHOUT ROWID
+    """)
+    # Lets each process fetch only the rows written since it last looked
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_practice_schedule_seq ON practice_schedule (test_bank_id, updated_seq)
+    """)
+    practice.rebuild(cursor)
+
+
+def _answer_aware_signatures(cursor):
+    # Signatures now end with an answer fingerprint; load_index re-signs lazily
+    cursor.execute("DELETE FROM question_signatures")
+
+
+def _session_expiry(cursor):
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_exam_sessions_updated ON exam_sessions (updated_at)")
+
+
+# Ordered (version, description, step) list. Steps run inside one write
+# transaction each; append new steps, never edit or reorder shipped ones.
+MIGRATIONS = [
+    (1, "base schema", _base_schema),
+    (2, "foreign key and history indexes", _foreign_key_indexes),
+    (3, "bank summary table", _bank_stats),
+    (4, "per-bank content versions", _content_versions),
+    (5, "server-side exam sessions", _exam_sessions),
+    (6, "answer event log and per-question rollups", _answer_events),
+    (7, "full-text search index", _question_search),
+    (8, "near-duplicate signatures", _question_signatures),
+    (9, "content-addressed image store", _image_store),
+    (10, "soft-deleted test banks", _soft_delete),
+    (11, "daily and weekly result rollups", _result_rollups),
+    (12, "cross-process cache generation", _cache_generation),
+    (13, "shared import job status", _import_jobs),
+    (14, "adaptive practice schedule", _practice_schedule),
+    (15, "answer-aware duplicate signatures", _answer_aware_signatures),
+    (16, "exam session expiry index", _session_expiry),
+]
+
+
+def current_version(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT NOT NULL,
+            applied_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    return conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()[0]
+
+
+def migrate(database):
+    """Bring the database up to the latest schema version, upgrading in place."""
+    latest = MIGRATIONS[-1][0]
+    with database.transaction(immediate=False) as conn:
+        # Already current (e.g. another worker migrated it): no write lock needed
+        if current_version(conn) >= latest:
+            return latest
+    for version, description, step in MIGRATIONS:
+        with database.transaction() as conn:
+            # Re-checked under the write lock so concurrent starters apply each step once
+            if current_version(conn) >= version:
+                continue
+            logger.info("Applying schema migration %d: %s", version, description)
+            step(conn.cursor())
+            conn.execute(
+                "INSERT INTO schema_version (version, description) VALUES (?, ?)",
+                (version, description)
+            )
+    with database.transaction(immediate=False) as conn:
+        return current_version(conn)
@@ -0,0 +1,261 @@
+import heapq
+import threading
+import time
+from collections import OrderedDict
+from typing import NamedTuple
+
+# Adaptive practice (a simplified SM-2). Every answered question has a due
+# time and an ease factor: a wrong answer brings it back within minutes and
+# makes its later intervals grow more slowly, a right one pushes it further
+# out. Rows are written by the answer-event writer, in the same batched
+# transactions as the per-question stats; each bank's order is kept in
+# memory as heaps so picking the next k questions costs O(k log n).
+
+DEFAULT_EASE = 2.5
+MIN_EASE = 1.3
+MAX_EASE = 3.0
+EASE_PENALTY = 0.2
+EASE_BONUS = 0.05
+RELEARN_SECONDS = 10 * 60
+FIRST_INTERVAL_SECONDS = 24 * 3600
+MAX_INTERVAL_SECONDS = 365 * 24 * 3600
+
+# Why a question was picked: overdue for review, never answered, or
+# reviewed early because nothing else is left
+DUE, NEW, AHEAD = "due", "new", "ahead"
+
+
+class Schedule(NamedTuple):
+    due_at: float
+    ease: float
+    interval: float
+    # Correct answers in a row
+    reps: int
+    lapses: int
+
+
+def review(state, correct, now):
+    """Schedule after one answer; state is None for a question never answered."""
+    if state is None:
+        state = Schedule(0.0, DEFAULT_EASE, 0.0, 0, 0)
+    if not correct:
+        ease = max(MIN_EASE, state.ease - EASE_PENALTY)
+        return Schedule(now + RELEARN_SECONDS, ease, RELEARN_SECONDS, 0, state.lapses + 1)
+    ease = min(MAX_EASE, state.ease + EASE_BONUS)
+    interval = FIRST_INTERVAL_SECONDS if state.reps == 0 else min(MAX_INTERVAL_SECONDS, state.interval * ease)
+    return Schedule(now + interval, ease, interval, state.reps + 1, state.lapses)
+
+
+SCHEDULE_COLUMNS = "question_id, due_at, ease, interval, reps, lapses"
+
+
+def _read(cursor, test_bank_id, question_ids):
+    placeholders = ", ".join("?" for _ in question_ids)
+    return {
+        row[0]: Schedule(*row[1:])
+        for row in cursor.execute(f"""
+            SELECT {SCHEDULE_COLUMNS} FROM practice_schedule
+            WHERE test_bank_id = ? AND question_id IN ({placeholders})
+        """, (test_bank_id, *question_ids))
+    }
+
+
+def _write(cursor, test_bank_id, states):
+    # Every row a batch touches gets the bank's next sequence number, which
+    # is how other processes find what changed since they last looked
+    seq = cursor.execute(
+        "SELECT COALESCE(MAX(updated_seq), 0) + 1 FROM practice_schedule WHERE test_bank_id = ?", (test_bank_id,)
+    ).fetchone()[0]
+    cursor.executemany(f"""
+        INSERT OR REPLACE INTO practice_schedule (test_bank_id, {SCHEDULE_COLUMNS}, updated_seq)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    """, [(test_bank_id, question_id, *state, seq) for question_id, state in states.items()])
+
+
+def apply_answers(cursor, events):
+    """Fold graded answers, in order, into practice_schedule."""
+    by_bank = {}
+    for event in events:
+        by_bank.setdefault(event.test_bank_id, []).append(event)
+    for test_bank_id, bank_events in by_bank.items():
+        states = _read(cursor, test_bank_id, sorted({e.question_id for e in bank_events}))
+        for e in bank_events:
+            states[e.question_id] = review(states.get(e.question_id), e.correct, e.created_at)
+        _write(cursor, test_bank_id, states)
+
+
+def rebuild(cursor):
+    """Replay the answer log into practice_schedule (used when the table is first created)."""
+    cursor.execute("DELETE FROM practice_schedule")
+    banks = {}
+    for test_bank_id, question_id, correct, created_at in cursor.execute("""
+        SELECT e.test_bank_id, e.question_id, e.correct, e.created_at
+        FROM answer_events e
+        JOIN questions q ON q.id = e.question_id AND q.test_bank_id = e.test_bank_id
+        ORDER BY e.id
+    """).fetchall():
+        states = banks.setdefault(test_bank_id, {})
+        states[question_id] = review(states.get(question_id), bool(correct), created_at)
+    for test_bank_id, states in banks.items():
+        _write(cursor, test_bank_id, states)
+
+
+def delete_questions(cursor, test_bank_id, question_ids):
+    cursor.executemany(
+        "DELETE FROM practice_schedule WHERE test_bank_id = ? AND question_id = ?",
+        ((test_bank_id, qid) for qid in question_ids),
+    )
+
+
+def delete_bank(cursor, test_bank_id):
+    cursor.execute("DELETE FROM practice_schedule WHERE test_bank_id = ?", (test_bank_id,))
+
+
+class PracticeQueue:
+    """One bank's practice order.
+
+    Answered questions sit in a min-heap on due time, unanswered ones in a
+    min-heap on id. Entries are never removed in place: a question that is
+    rescheduled is pushed again, and the old entry is skipped (and dropped)
+    when it reaches the top.
+    """
+
+    def __init__(self, version, question_ids, states, seq):
+        self.version = version
+        self.seq = seq
+        self.states = {}
+        self.reviews = []
+        # Ids come in ascending order, which is already a valid heap
+        self.new = [qid for qid in question_ids if qid not in states]
+        self._members = set(question_ids)
+        for question_id, state in states.items():
+            self.update(question_id, state)
+
+    def __len__(self):
+        return len(self._members)
+
+    def update(self, question_id, state):
+        if question_id not in self._members:
+            return
+        self.states[question_id] = state
+        heapq.heappush(self.reviews, (state.due_at, question_id))
+        if len(self.reviews) > 2 * len(self.states) + 64:
+            self.reviews = [(s.due_at, qid) for qid, s in self.states.items()]
+            heapq.heapify(self.reviews)
+
+    def _pop_review(self, until):
+        while self.reviews and self.reviews[0][0] <= until:
+            entry = heapq.heappop(self.reviews)
+            state = self.states.get(entry[1])
+            if state is not None and state.due_at == entry[0]:
+                return entry
+        return None
+
+    def take(self, n, now):
+        """The next n questions as (question_id, reason, Schedule or None), without consuming them."""
+        picked = []
+        reviews = []
+        new = []
+        for reason, until in ((DUE, now), (NEW, None), (AHEAD, float("inf"))):
+            while len(picked) < n:
+                if reason == NEW:
+                    if not self.new:
+                        break
+                    question_id = heapq.heappop(self.new)
+                    if question_id in self.states:
+                        continue
+                    new.append(question_id)
+                else:
+                    entry = self._pop_review(until)
+                    if entry is None:
+                        break
+                    reviews.append(entry)
+                    question_id = entry[1]
+                picked.append((question_id, reason, self.states.get(question_id)))
+        for entry in reviews:
+            heapq.heappush(self.reviews, entry)
+        for question_id in new:
+            heapq.heappush(self.new, question_id)
+        return picked
+
+
+class PracticeScheduler:
+    """Per-bank practice queues, loaded on first use and kept in step with practice_schedule.
+
+    Answers graded by this process are applied to the queue at once (before
+    the event writer has stored them); rows written by other processes are
+    picked up through their sequence numbers on the next call. Answers the
+    writer has not stored yet are also kept per bank and replayed onto a
+    queue loaded in the meantime, since practice_schedule does not have them.
+    """
+
+    def __init__(self, max_banks=32):
+        self.max_banks = max_banks
+        self._queues = OrderedDict()
+        # {test_bank_id: {(question_id, answered_at): correct}} in answer order
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._queues)
+
+    def _load(self, conn, bank):
+        rows = conn.execute(
+            f"SELECT {SCHEDULE_COLUMNS}, updated_seq FROM practice_schedule WHERE test_bank_id = ?", (bank.id,)
+        ).fetchall()
+        states = {row[0]: Schedule(*row[1:6]) for row in rows}
+        seq = max((row[6] for row in rows), default=0)
+        return PracticeQueue(bank.version, [q.id for q in bank.questions], states, seq)
+
+    def next(self, conn, bank, n, now=None):
+        """Pick up to n questions of a compiled bank, most overdue first; see PracticeQueue.take."""
+        now = time.time() if now is None else now
+        with self._lock:
+            queue = self._queues.get(bank.id)
+            if queue is not None:
+                self._queues.move_to_end(bank.id)
+        if queue is None or queue.version != bank.version:
+            queue = self._load(conn, bank)
+            with self._lock:
+                for (question_id, answered_at), correct in self._pending.get(bank.id, {}).items():
+                    queue.update(question_id, review(queue.states.get(question_id), correct, answered_at))
+                self._queues[bank.id] = queue
+                while len(self._queues) > self.max_banks:
+                    self._queues.popitem(last=False)
+        changed = conn.execute(f"""
+            SELECT {SCHEDULE_COLUMNS}, updated_seq FROM practice_schedule
+            WHERE test_bank_id = ? AND updated_seq > ?
+        """, (bank.id, queue.seq)).fetchall()
+        with self._lock:
+            for row in changed:
+                queue.update(row[0], Schedule(*row[1:6]))
+                queue.seq = max(queue.seq, row[6])
+            return queue.take(n, now)
+
+    def record(self, test_bank_id, question_id, correct, now=None, pending=True):
+        """Apply a graded answer to the bank's queue, if it is loaded.
+
+        With ``pending`` the answer is also kept until written() reports it
+        stored; pass False for answers that will never be written.
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            if pending:
+                self._pending.setdefault(test_bank_id, {})[question_id, now] = correct
+            queue = self._queues.get(test_bank_id)
+            if queue is not None:
+                queue.update(question_id, review(queue.states.get(question_id), correct, now))
+
+    def written(self, events):
+        """Forget pending answers now in practice_schedule (AnswerEventLog's on_written hook)."""
+        with self._lock:
+            for event in events:
+                pending = self._pending.get(event.test_bank_id)
+                if pending is not None:
+                    pending.pop((event.question_id, event.created_at), None)
+                    if not pending:
+                        del self._pending[event.test_bank_id]
+
+    def invalidate(self, test_bank_id):
+        with self._lock:
+            self._queues.pop(test_bank_id, None)
@@ -0,0 +1,84 @@
+from typing import List, Optional
+
+from fastapi import HTTPException
+from pydantic import BaseModel
+
+from answer_keys import is_correct, parse_selection
+from shuffle import bank_orders
+
+# Request models and response builders for the question endpoints, shared by
+# the main server and the read-only snapshot replica.
+
+
+class Answer(BaseModel):
+    question_id: int
+    selected_answer: str
+    # Must match the /questions request the answer was given against
+    shuffle: bool = True
+    seed: Optional[str] = None
+
+
+class AnswerBatch(BaseModel):
+    answers: List[Answer]
+
+
+QUESTION_FIELDS = (
+    "question", "options", "option_images", "correct_answer", "explanation",
+    "question_images", "explanation_images", "multiple_answers",
+)
+# Just enough to render an exam; explanations are fetched per question on demand
+LEAN_FIELDS = ("question", "options", "option_images", "question_images", "multiple_answers")
+DEFAULT_FIELDS = QUESTION_FIELDS[:-1]
+
+
+def parse_fields(fields, mode):
+    if mode == "lean":
+        return LEAN_FIELDS
+    if mode != "full":
+        raise HTTPException(status_code=400, detail="mode must be 'full' or 'lean'.")
+    if not fields:
+        return DEFAULT_FIELDS
+    requested = {name.strip() for name in fields.split(",") if name.strip()}
+    unknown = requested - set(QUESTION_FIELDS) - {"id"}
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+    return tuple(name for name in QUESTION_FIELDS if name in requested)
+
+
+def question_items(questions, shuffle, seed, fields):
+    # Snapshot banks decode their questions while being iterated, so go over them only once
+    questions = list(questions)
+    # Shuffle options if requested, unless it's a true/false question
+    orders = bank_orders(questions, shuffle, seed)
+    wanted = set(fields)
+
+    questions_list = []
+    for q, indices in zip(questions, orders):
+        fixed_letters = [chr(97 + i) for i in range(len(indices))]
+        item = {"id": q.id}
+        if "question" in wanted:
+            item["question"] = q.question_text
+        if "options" in wanted:
+            item["options"] = {fixed_letters[i]: q.options[j] for i, j in enumerate(indices)}
+        if "option_images" in wanted:
+            item["option_images"] = {fixed_letters[i]: q.option_images[j] for i, j in enumerate(indices)}
+        if "correct_answer" in wanted:
+            item["correct_answer"] = ",".join(fixed_letters[i] for i, j in enumerate(indices) if q.is_correct[j])
+        if "explanation" in wanted:
+            item["explanation"] = q.explanation
+        if "question_images" in wanted:
+            item["question_images"] = list(q.question_images)
+        if "explanation_images" in wanted:
+            item["explanation_images"] = list(q.explanation_images)
+        if "multiple_answers" in wanted:
+            item["multiple_answers"] = sum(q.is_correct) > 1
+        questions_list.append(item)
+
+    return questions_list
+
+
+def grade(key, answer):
+    """Grade an Answer against its AnswerKey; returns (selected_mask, key_mask, correct)."""
+    key_mask = key.displayed_mask(answer.question_id, answer.shuffle, answer.seed)
+    selected_mask = parse_selection(answer.selected_answer or "")
+    return selected_mask, key_mask, is_correct(selected_mask, key_mask)
@@ -0,0 +1,317 @@
+import argparse
+import logging
+import os
+import shutil
+import threading
+import time
+from contextlib import nullcontext
+
+import answer_events
+import bank_stats
+import coherence
+import dedup
+import search
+import sessions
+
+logger = logging.getLogger(__name__)
+
+# DELETE /test_banks only marks a bank deleted. The reaper then removes its
+# rows a chunk at a time, each chunk in its own short write transaction, and
+# hands the freed pages back to the filesystem with incremental_vacuum, so a
+# large bank never holds the write lock for long.
+
+CHUNK_SIZE = 500
+VACUUM_PAGES = 1024
+
+
+def soft_delete(cursor, test_bank_id):
+    """Hide a bank; returns False if it does not exist or is already deleted.
+
+    The name gets a suffix so a bank with the same name can be imported
+    again before the reaper has finished.
+    """
+    cursor.execute("""
+        UPDATE test_banks SET deleted_at = ?, name = name || ' [deleted ' || id || ']'
+        WHERE id = ? AND deleted_at IS NULL
+    """, (time.time(), test_bank_id))
+    if cursor.rowcount == 0:
+        return False
+    coherence.bump_generation(cursor)
+    return True
+
+
+def _delete_chunk(cursor, table, test_bank_id, limit):
+    cursor.execute(f"""
+        DELETE FROM {table} WHERE id IN (SELECT id FROM {table} WHERE test_bank_id = ? LIMIT ?)
+    """, (test_bank_id, limit))
+    return cursor.rowcount
+
+
+def reap_step(cursor, test_bank_id, limit=CHUNK_SIZE):
+    """Delete up to ``limit`` rows of a deleted bank.
+
+    Returns None while there is more to do. Once the bank row itself is gone,
+    returns (exam_code, whether no bank uses that exam code any more).
+    """
+    question_ids = [row[0] for row in cursor.execute(
+        "SELECT id FROM questions WHERE test_bank_id = ? ORDER BY id LIMIT ?", (test_bank_id, limit)
+    ).fetchall()]
+    if question_ids:
+        # Index rows first: they are found through the questions
+        search.delete_questions(cursor, question_ids)
+        dedup.delete_questions(cursor, question_ids)
+        answer_events.delete_questions(cursor, test_bank_id, question_ids)
+        cursor.executemany("DELETE FROM options WHERE question_id = ?", ((qid,) for qid in question_ids))
+        cursor.executemany("DELETE FROM questions WHERE id = ?", ((qid,) for qid in question_ids))
+        return None
+    for table in ("exam_results", "exam_sessions", "answer_events"):
+        if _delete_chunk(cursor, table, test_bank_id, limit):
+            return None
+
+    row = cursor.execute("SELECT exam_code FROM test_banks WHERE id = ?", (test_bank_id,)).fetchone()
+    # Rollups of answers that were still queued when the bank was deleted
+    answer_events.delete_bank(cursor, test_bank_id)
+    bank_stats.delete_bank(cursor, test_bank_id)
+    cursor.execute("DELETE FROM test_banks WHERE id = ?", (test_bank_id,))
+    if row is None:
+        return None, False
+    unused = cursor.execute("SELECT 1 FROM test_banks WHERE exam_code = ? LIMIT 1", (row[0],)).fetchone() is None
+    return row[0], unused
+
+
+def incremental_vacuum(conn, pages=VACUUM_PAGES):
+    """Return up to ``pages`` free pages to the filesystem (a no-op unless auto_vacuum is INCREMENTAL)."""
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+        return
+    # execute() steps the pragma once, which frees a single page; executescript runs it to completion
+    conn.executescript(f"PRAGMA incremental_vacuum({int(pages)})")
+
+
+class Reaper:
+    """Background thread that purges soft-deleted banks (and expired exam sessions) in small transactions."""
+
+    def __init__(self, database, image_store=None, exams_root="exams", chunk_size=CHUNK_SIZE,
+                 interval=60.0, pause=0.01, vacuum_pages=VACUUM_PAGES, lock_path=None, session_ttl=None,
+                 exams_lock=None):
+        self.database = database
+        self.image_store = image_store
+        self.exams_root = exams_root
+        self.chunk_size = chunk_size
+        self.interval = interval
+        self.pause = pause
+        self.vacuum_pages = vacuum_pages
+        # With several worker processes only the one holding this lock purges
+        self.lock_path = lock_path
+        # Exam sessions untouched for this many seconds are deleted; None keeps them
+        self.session_ttl = session_ttl
+        # Held by imports while they create a bank's exams/<code> folder (see importer.run_import)
+        self.exams_lock = exams_lock
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def pending(self):
+        """Number of deleted banks not purged yet."""
+        return self.database.connection().execute(
+            "SELECT COUNT(*) FROM test_banks WHERE deleted_at IS NOT NULL"
+        ).fetchone()[0]
+
+    def wake(self):
+        self._wake.set()
+
+    def purge(self, test_bank_id):
+        """Remove a deleted bank chunk by chunk; returns False if stopped before finishing."""
+        while not self._stop.is_set():
+            with self.database.transaction() as conn:
+                done = reap_step(conn.cursor(), test_bank_id, self.chunk_size)
+                freed = []
+                if done is not None:
+                    exam_code, unused = done
+                    if unused and self.image_store is not None:
+                        freed = self.image_store.release_exam(conn.cursor(), exam_code)
+            incremental_vacuum(self.database.connection(), self.vacuum_pages)
+            if done is not None:
+                self._release_files(exam_code, freed, unused)
+                return True
+            # Let request writers in between chunks
+            self._stop.wait(self.pause)
+        return False
+
+    def _release_files(self, exam_code, freed, unused):
+        if self.image_store is not None:
+            for digest in freed:
+                self.image_store.discard(digest)
+        if unused and exam_code and self.exams_root:
+            folder = os.path.join(self.exams_root, exam_code)
+            # Exam codes come from uploads; never follow one out of the exams root
+            root = os.path.realpath(self.exams_root)
+            if os.path.dirname(os.path.realpath(folder)) != root:
+                return
+            with coherence.exclusive(self.exams_lock) if self.exams_lock else nullcontext():
+                # An import may have reused the code since the purge committed
+                reused = self.database.connection().execute(
+                    "SELECT 1 FROM test_banks WHERE exam_code = ? LIMIT 1", (exam_code,)
+                ).fetchone()
+                if reused is None:
+                    shutil.rmtree(folder, ignore_errors=True)
+
+    def expire_sessions(self):
+        """Delete exam sessions older than session_ttl, a chunk at a time; returns how many."""
+        if not self.session_ttl:
+            return 0
+        cutoff = time.time() - self.session_ttl
+        total = 0
+        while not self._stop.is_set():
+            with self.database.transaction() as conn:
+                removed = sessions.delete_expired(conn.cursor(), cutoff, self.chunk_size)
+            total += removed
+            if removed < self.chunk_size:
+                break
+            self._stop.wait(self.pause)
+        if total:
+            incremental_vacuum(self.database.connection(), self.vacuum_pages)
+            logger.info("Deleted %d expired exam sessions", total)
+        return total
+
+    def run_once(self):
+        """Purge every bank currently marked deleted; returns how many were finished."""
+        purged = 0
+        while not self._stop.is_set():
+            row = self.database.connection().execute(
+                "SELECT id FROM test_banks WHERE deleted_at IS NOT NULL ORDER BY deleted_at LIMIT 1"
+            ).fetchone()
+            if row is None:
+                break
+            started = time.perf_counter()
+            if not self.purge(row[0]):
+                break
+            purged += 1
+            logger.info("Purged deleted test bank %d in %.2fs", row[0], time.perf_counter() - started)
+        return purged
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._wake.set()
+        self._thread = threading.Thread(target=self._run, name="bank-reaper", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            try:
+                if self.lock_path is None:
+                    self.run_once()
+                    self.expire_sessions()
+                    continue
+                with coherence.exclusive(self.lock_path, blocking=False) as acquired:
+                    if acquired:
+                        self.run_once()
+                        self.expire_sessions()
+            except Exception:
+                logger.exception("Purging deleted test banks failed")
+
+
+# Correlated NOT EXISTS probes the parent's primary key per row instead of
+# materialising every parent id on each chunk
+_NO_BANK = "NOT EXISTS (SELECT 1 FROM test_banks b WHERE b.id = {table}.test_bank_id)"
+ORPHAN_CHECKS = (
+    ("questions", _NO_BANK),
+    ("options", "NOT EXISTS (SELECT 1 FROM questions q WHERE q.id = options.question_id)"),
+    ("exam_results", _NO_BANK),
+    ("answer_events", _NO_BANK),
+)
+
+
+def delete_orphans(database, image_store=None, chunk_size=CHUNK_SIZE, vacuum_pages=VACUUM_PAGES):
+    """Remove rows that reference banks or questions which no longer exist; returns counts per table.
+
+    Rows left behind by deletes before soft deletion existed are removed in
+    chunks, like the reaper does.
+    """
+    counts = {}
+
+    def drain(name, step):
+        total = 0
+        while True:
+            with database.transaction() as conn:
+                removed = step(conn.cursor())
+            incremental_vacuum(database.connection(), vacuum_pages)
+            if not removed:
+                break
+            total += removed
+        counts[name] = total
+
+    for table, condition in ORPHAN_CHECKS:
+        def step(cursor, table=table, condition=condition):
+            cursor.execute(f"""
+                DELETE FROM {table} WHERE id IN (SELECT id FROM {table} WHERE {condition.format(table=table)} LIMIT ?)
+            """, (chunk_size,))
+            return cursor.rowcount
+        drain(table, step)
+    drain("question_search", lambda cursor: search.delete_orphans(cursor, chunk_size))
+    drain("question_signatures", lambda cursor: dedup.delete_orphans(cursor, chunk_size))
+
+    with database.transaction() as conn:
+        cursor = conn.cursor()
+        for table in (
+            "exam_sessions", "question_stats", "option_stats", "bank_stats", "result_rollups", "practice_schedule",
+        ):
+            cursor.execute(f"DELETE FROM {table} WHERE {_NO_BANK.format(table=table)}")
+            counts[table] = cursor.rowcount
+        freed = image_store.delete_orphans(cursor) if image_store is not None else []
+    counts["images"] = len(freed)
+    if image_store is not None:
+        for digest in freed:
+            image_store.discard(digest)
+        counts["image_files"] = image_store.delete_stray_files()
+    incremental_vacuum(database.connection(), pages=0)
+    return counts
+
+
+def main():
+    from db import Database
+    from image_store import ImageStore
+    from migrations import migrate
+
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
+    parser = argparse.ArgumentParser(
+        description="Purge deleted test banks and rows orphaned by earlier deletes, then reclaim disk space."
+    )
+    parser.add_argument("--db", default="test_engine.db", help="Path to SQLite database file (default: test_engine.db)")
+    parser.add_argument("--exams", default="exams", help="Legacy exams directory (default: exams)")
+    parser.add_argument("--store", default="image_store", help="Image store directory (default: image_store)")
+    parser.add_argument(
+        "--vacuum", action="store_true",
+        help="Switch the database to incremental auto-vacuum and rebuild it (needs exclusive access)",
+    )
+    args = parser.parse_args()
+
+    database = Database(args.db)
+    migrate(database)
+    store = ImageStore(database, args.store)
+    purged = Reaper(database, store, args.exams, exams_lock=args.db + ".exams.lock").run_once()
+    logging.info(f"Purged {purged} deleted test banks")
+    for table, count in delete_orphans(database, store).items():
+        if count:
+            logging.info(f"Removed {count} orphaned rows from {table}")
+    if args.vacuum:
+        conn = database.connection()
+        before = os.path.getsize(args.db)
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+        logging.info(f"Database rebuilt: {before} -> {os.path.getsize(args.db)} bytes")
+    database.close_all()
+
+
+if __name__ == "__main__":
+    main()
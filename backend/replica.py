@@ -0,0 +1,138 @@
+import logging
+import os
+from typing import Optional
+
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.middleware.cors import CORSMiddleware
+
+import http_cache
+import logs
+from answer_keys import AnswerKey, mask_to_answer, stored_mask
+from question_api import Answer, AnswerBatch, grade, parse_fields, question_items
+from snapshots import SnapshotStore
+
+# Read-only server for edge boxes: serves /test_banks, /questions and
+# /answer straight from bank snapshots, with no database. Run it with
+#
+#     SNAPSHOT_DIR=snapshots uvicorn replica:app
+#
+# Answers are graded but not recorded, and snapshots are loaded at start-up,
+# so restart (or add workers one by one) after shipping new ones.
+
+logs.configure(os.environ.get("LOG_LEVEL", "INFO"), os.environ.get("LOG_FORMAT", "text"))
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_DIR = os.environ.get("SNAPSHOT_DIR", "snapshots")
+RESPONSE_CACHE_MAX_BYTES = int(os.environ.get("RESPONSE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+app = FastAPI()
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
+banks = SnapshotStore(SNAPSHOT_DIR).load_all()
+response_cache = http_cache.ResponseCache(max_bytes=RESPONSE_CACHE_MAX_BYTES)
+logger.info("Serving %d test banks from %s", len(banks), SNAPSHOT_DIR)
+
+
+def _find_question(question_id):
+    # Question ids are unique across banks; each snapshot is a binary search
+    for bank in banks.values():
+        question = bank.question(question_id)
+        if question is not None:
+            return bank, question
+    raise HTTPException(status_code=404, detail="Question not found.")
+
+
+def _answer_key(bank, question):
+    return AnswerKey(bank.id, len(question.options), question.is_true_false, stored_mask(question))
+
+
+@app.get("/")
+def read_root():
+    return {"message": "Read-only exam replica. Visit /docs for API documentation."}
+
+
+@app.get("/test_banks")
+def get_test_banks(request: Request):
+    result = [
+        {"id": bank.id, "name": bank.name, "exam_code": bank.exam_code, "question_count": len(bank.questions)}
+        for bank in sorted(banks.values(), key=lambda bank: bank.id)
+    ]
+    body = http_cache.dumps({"test_banks": result})
+    return http_cache.json_response(request, http_cache.content_etag(body), lambda: body)
+
+
+@app.get("/questions")
+def get_questions(
+    request: Request,
+    test_bank_id: int,
+    shuffle: bool = Query(False),
+    seed: Optional[str] = Query(None),
+    fields: Optional[str] = Query(None, description="Comma-separated question fields to return"),
+    mode: str = Query("full", description="'lean' returns only what is needed to render the exam"),
+):
+    selected_fields = parse_fields(fields, mode)
+    bank = banks.get(test_bank_id)
+    if bank is None:
+        raise HTTPException(status_code=404, detail="Test bank not found.")
+    field_key = ",".join(selected_fields)
+    # Same inputs as the main server's ETag, so a client can move between them and still revalidate
+    etag = http_cache.version_etag("questions", bank.id, bank.version, shuffle, seed, field_key)
+    return http_cache.json_response(
+        request, etag,
+        lambda: http_cache.dumps({"questions": question_items(bank.questions, shuffle, seed, selected_fields)}),
+        cache=response_cache, cache_key=(bank.id, shuffle, seed, field_key),
+    )
+
+
+@app.get("/questions/{question_id}/explanation")
+def get_question_explanation(request: Request, question_id: int):
+    bank, question = _find_question(question_id)
+    etag = http_cache.version_etag("explanation", question_id, bank.version)
+    return http_cache.json_response(request, etag, lambda: http_cache.dumps({
+        "id": question_id,
+        "explanation": question.explanation,
+        "explanation_images": list(question.explanation_images)
+    }))
+
+
+@app.post("/answer")
+def check_answer(answer: Answer):
+    bank, question = _find_question(answer.question_id)
+    _, key_mask, correct = grade(_answer_key(bank, question), answer)
+    return {
+        "correct": correct,
+        "correct_answer": mask_to_answer(key_mask),
+        "explanation": question.explanation,
+        "explanation_images": list(question.explanation_images)
+    }
+
+
+@app.post("/answers/batch")
+def check_answers_batch(batch: AnswerBatch):
+    found = {}
+    missing = []
+    for answer in batch.answers:
+        try:
+            found[answer.question_id] = _find_question(answer.question_id)
+        except HTTPException:
+            missing.append(answer.question_id)
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Questions not found: {missing}")
+
+    results = []
+    score = 0
+    for answer in batch.answers:
+        _, key_mask, correct = grade(_answer_key(*found[answer.question_id]), answer)
+        score += correct
+        results.append({
+            "question_id": answer.question_id,
+            "correct": correct,
+            "correct_answer": mask_to_answer(key_mask)
+        })
+    return {"results": results, "score": score, "total_questions": len(results)}
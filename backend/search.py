@@ -0,0 +1,113 @@
+import re
+
+# Full-text index over question text, explanations and option text. The
+# rowid is the question id; options are indexed as one newline-joined column
+# so a question is a single FTS row. Rows are written by the same
+# transactions that insert or delete questions.
+
+TABLE = "question_search"
+# Column weights for bm25: question text, explanation, options
+RANK = "bm25(10.0, 2.0, 4.0)"
+HIGHLIGHT_OPEN = "<mark>"
+HIGHLIGHT_CLOSE = "</mark>"
+SNIPPET_TOKENS = 16
+
+_INDEX_FROM_TABLES = f"""
+        INSERT INTO {TABLE} (rowid, question_text, explanation, options, test_bank_id)
+        SELECT q.id, q.question_text, COALESCE(q.explanation, ''),
+               COALESCE((SELECT group_concat(o.option_text, char(10)) FROM options o WHERE o.question_id = q.id), ''),
+               q.test_bank_id
+        FROM questions q
+"""
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+
+def create(cursor):
+    cursor.execute(f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS {TABLE} USING fts5(
+            question_text, explanation, options, test_bank_id UNINDEXED,
+            tokenize = 'unicode61 remove_diacritics 2',
+            prefix = '2 3'
+        )
+    """)
+    cursor.execute(f"INSERT INTO {TABLE} ({TABLE}, rank) VALUES ('rank', ?)", (RANK,))
+
+
+def rebuild(cursor):
+    """Re-index every question from the base tables."""
+    cursor.execute(f"DELETE FROM {TABLE}")
+    cursor.execute(_INDEX_FROM_TABLES)
+    cursor.execute(f"INSERT INTO {TABLE} ({TABLE}) VALUES ('optimize')")
+
+
+def reindex_question(cursor, question_id):
+    cursor.execute(f"DELETE FROM {TABLE} WHERE rowid = ?", (question_id,))
+    cursor.execute(_INDEX_FROM_TABLES + " WHERE q.id = ?", (question_id,))
+
+
+def add_questions(cursor, rows):
+    """Index (question_id, test_bank_id, question_text, explanation, option_texts) rows."""
+    cursor.executemany(f"""
+        INSERT INTO {TABLE} (rowid, question_text, explanation, options, test_bank_id)
+        VALUES (?, ?, ?, ?, ?)
+    """, [
+        (question_id, question_text, explanation or "", "\n".join(option_texts), test_bank_id)
+        for question_id, test_bank_id, question_text, explanation, option_texts in rows
+    ])
+
+
+def delete_questions(cursor, question_ids):
+    cursor.executemany(f"DELETE FROM {TABLE} WHERE rowid = ?", ((qid,) for qid in question_ids))
+
+
+def delete_orphans(cursor, limit):
+    """Drop up to ``limit`` index rows whose question no longer exists; returns how many."""
+    cursor.execute(f"""
+        DELETE FROM {TABLE} WHERE rowid IN (
+            SELECT rowid FROM {TABLE} s WHERE NOT EXISTS (SELECT 1 FROM questions q WHERE q.id = s.rowid) LIMIT ?
+        )
+    """, (limit,))
+    return cursor.rowcount
+
+
+def match_expression(text):
+    """Turn free text into an FTS5 query: every word must match, the last one as a prefix."""
+    words = _WORD.findall(text)
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += "*"
+    return " ".join(terms)
+
+
+def search(conn, query, test_bank_id=None, limit=20, offset=0):
+    """Ranked matches as dicts; fetches one extra row so callers can tell if there are more."""
+    bank_filter = "AND test_bank_id = ?" if test_bank_id is not None else ""
+    params = (HIGHLIGHT_OPEN, HIGHLIGHT_CLOSE,
+              HIGHLIGHT_OPEN, HIGHLIGHT_CLOSE, SNIPPET_TOKENS,
+              HIGHLIGHT_OPEN, HIGHLIGHT_CLOSE, SNIPPET_TOKENS,
+              query)
+    if test_bank_id is not None:
+        params += (test_bank_id,)
+    rows = conn.execute(f"""
+        SELECT rowid, test_bank_id, rank,
+               highlight({TABLE}, 0, ?, ?),
+               snippet({TABLE}, 1, ?, ?, '…', ?),
+               snippet({TABLE}, 2, ?, ?, '…', ?)
+        FROM {TABLE}
+        WHERE {TABLE} MATCH ? {bank_filter}
+          AND test_bank_id NOT IN (SELECT id FROM test_banks WHERE deleted_at IS NOT NULL)
+        ORDER BY rank
+        LIMIT ? OFFSET ?
+    """, params + (limit + 1, offset)).fetchall()
+    return [
+        {
+            "question_id": question_id,
+            "test_bank_id": int(bank_id),
+            "score": -rank,
+            "question": question,
+            "explanation": explanation or None,
+            "options": options or None,
+        }
+        for question_id, bank_id, rank, question, explanation, options in rows
+    ]
@@ -0,0 +1,311 @@
+import logging
+import secrets
+import threading
+import time
+from array import array
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class ExamSession:
+    """One candidate's exam, stored as flat arrays rather than per-question dicts.
+
+    Option orders are not stored at all: they are re-derived from the
+    session seed by the shuffle engine. Per question the session keeps an
+    8-byte id, a 4-byte selected-letters mask (0 = unanswered) and one bit
+    of correctness.
+    """
+
+    __slots__ = (
+        "id", "test_bank_id", "seed", "shuffle", "question_ids", "responses", "correct",
+        "position", "created_at", "updated_at", "finished_at", "dirty",
+    )
+
+    def __init__(self, id, test_bank_id, seed, shuffle, question_ids, responses=None, correct=None,
+                 position=0, created_at=None, updated_at=None, finished_at=None):
+        self.id = id
+        self.test_bank_id = test_bank_id
+        self.seed = seed
+        self.shuffle = shuffle
+        self.question_ids = question_ids
+        self.responses = responses if responses is not None else array("I", bytes(array("I").itemsize * len(question_ids)))
+        self.correct = correct if correct is not None else bytearray((len(question_ids) + 7) // 8)
+        self.position = position
+        self.created_at = created_at or time.time()
+        self.updated_at = updated_at or self.created_at
+        self.finished_at = finished_at
+        self.dirty = True
+
+    @property
+    def total(self):
+        return len(self.question_ids)
+
+    def is_answered(self, index):
+        return self.responses[index] != 0
+
+    def is_correct(self, index):
+        return bool(self.correct[index >> 3] >> (index & 7) & 1)
+
+    def record(self, index, selected_mask, correct):
+        self.responses[index] = selected_mask
+        if correct:
+            self.correct[index >> 3] |= 1 << (index & 7)
+        while self.position < self.total and self.is_answered(self.position):
+            self.position += 1
+        self.updated_at = time.time()
+        self.dirty = True
+
+    def score(self):
+        return sum(bin(byte).count("1") for byte in self.correct)
+
+    def answered(self):
+        return sum(1 for mask in self.responses if mask)
+
+    def to_row(self):
+        return (
+            self.id, self.test_bank_id, self.seed, int(self.shuffle),
+            self.question_ids.tobytes(), self.responses.tobytes(), bytes(self.correct),
+            self.position, self.created_at, self.updated_at, self.finished_at,
+        )
+
+    @classmethod
+    def from_row(cls, row):
+        (id, test_bank_id, seed, shuffle, question_ids, responses, correct,
+         position, created_at, updated_at, finished_at) = row
+        ids = array("q")
+        ids.frombytes(question_ids)
+        masks = array("I")
+        masks.frombytes(responses)
+        session = cls(id, test_bank_id, seed, bool(shuffle), ids, masks, bytearray(correct),
+                      position, created_at, updated_at, finished_at)
+        session.dirty = False
+        return session
+
+    def update_from(self, other):
+        for name in self.__slots__:
+            setattr(self, name, getattr(other, name))
+
+
+SESSION_COLUMNS = """
+    id, test_bank_id, seed, shuffle, question_ids, responses, correct,
+    position, created_at, updated_at, finished_at
+"""
+
+
+def delete_expired(cursor, cutoff, limit):
+    """Delete up to ``limit`` sessions last touched before ``cutoff``; returns how many."""
+    cursor.execute("""
+        DELETE FROM exam_sessions WHERE id IN (SELECT id FROM exam_sessions WHERE updated_at < ? LIMIT ?)
+    """, (cutoff, limit))
+    return cursor.rowcount
+
+
+class SessionStore:
+    """In-memory session table with write-behind checkpoints to SQLite.
+
+    Changed sessions are written in one batched transaction every
+    ``checkpoint_interval`` seconds (and on shutdown). Clean sessions beyond
+    ``max_in_memory`` are dropped from memory and reloaded on demand, which
+    is also how sessions resume after a restart.
+
+    With ``shared`` (several worker processes serving the same database)
+    nothing is kept in memory: every read goes to SQLite and every change is
+    a read-check-write under the write lock, so workers never act on stale
+    copies.
+
+    A session untouched for ``ttl`` seconds is expired: it is no longer
+    returned, it is dropped from memory at the next checkpoint, and its row
+    is deleted by the reaper (see delete_expired).
+    """
+
+    def __init__(self, database, max_in_memory=10000, checkpoint_interval=2.0, shared=False, ttl=None):
+        self.database = database
+        self.shared = shared
+        self.ttl = ttl
+        self.max_in_memory = max_in_memory
+        self.checkpoint_interval = checkpoint_interval
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def create(self, test_bank_id, question_ids, shuffle):
+        session = ExamSession(
+            id=secrets.token_hex(16),
+            test_bank_id=test_bank_id,
+            seed=secrets.token_hex(8),
+            shuffle=shuffle,
+            question_ids=array("q", question_ids),
+        )
+        if self.shared:
+            with self.database.transaction() as conn:
+                self._write(conn, [session.to_row()])
+            session.dirty = False
+            return session
+        with self._lock:
+            self._sessions[session.id] = session
+        return session
+
+    @staticmethod
+    def _load(conn, session_id):
+        row = conn.execute(f"SELECT {SESSION_COLUMNS} FROM exam_sessions WHERE id = ?", (session_id,)).fetchone()
+        return ExamSession.from_row(row) if row else None
+
+    def _expired(self, session, now=None):
+        return bool(self.ttl) and session.updated_at < (time.time() if now is None else now) - self.ttl
+
+    def get(self, session_id):
+        if self.shared:
+            session = self._load(self.database.connection(), session_id)
+            return None if session is None or self._expired(session) else session
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None:
+                if self._expired(session):
+                    return None
+                self._sessions.move_to_end(session_id)
+                return session
+        loaded = self._load(self.database.connection(), session_id)
+        if loaded is None or self._expired(loaded):
+            return None
+        with self._lock:
+            # Another request may have loaded it meanwhile; keep a single instance
+            session = self._sessions.setdefault(session_id, loaded)
+            self._sessions.move_to_end(session_id)
+        return session
+
+    def record(self, session, index, selected_mask, correct):
+        """Record an answer unless the question was already answered; returns whether it was."""
+        if self.shared:
+            with self.database.transaction() as conn:
+                fresh = self._load(conn, session.id)
+                if fresh is None or fresh.finished_at is not None or fresh.is_answered(index):
+                    return False
+                fresh.record(index, selected_mask, correct)
+                self._write(conn, [fresh.to_row()])
+            fresh.dirty = False
+            session.update_from(fresh)
+            return True
+        with self._lock:
+            self._track(session)
+            if session.finished_at is not None or session.is_answered(index):
+                return False
+            session.record(index, selected_mask, correct)
+            return True
+
+    def mark_finished(self, session, conn=None):
+        """Atomically mark a session finished; returns False if it already was.
+
+        In shared mode ``conn`` must be the write transaction that saves the
+        result, which serialises concurrent finishes across processes.
+        """
+        if self.shared:
+            fresh = self._load(conn, session.id)
+            if fresh is None or fresh.finished_at is not None:
+                return False
+            session.update_from(fresh)
+        with self._lock:
+            if not self.shared:
+                self._track(session)
+            if session.finished_at is not None:
+                return False
+            session.finished_at = time.time()
+            session.updated_at = session.finished_at
+            session.dirty = True
+            return True
+
+    def _track(self, session):
+        """Make the caller's copy of a session the tracked one before changing it; call with the lock held.
+
+        A clean session can be evicted while a request still holds it, and
+        another request may have reloaded it since. The caller's copy catches
+        up with any such copy and replaces it, so its changes are checkpointed.
+        """
+        current = self._sessions.get(session.id)
+        if current is not session:
+            if current is not None:
+                session.update_from(current)
+            self._sessions[session.id] = session
+        return session
+
+    def save(self, conn, session):
+        """Write one session inside the caller's transaction (e.g. together with its result)."""
+        with self._lock:
+            row = session.to_row()
+            session.dirty = False
+        self._write(conn, [row])
+
+    def checkpoint(self):
+        """Write every changed session to SQLite in one batch."""
+        self._drop_expired()
+        with self._lock:
+            dirty = [s for s in self._sessions.values() if s.dirty]
+            rows = [s.to_row() for s in dirty]
+            for session in dirty:
+                session.dirty = False
+        if rows:
+            try:
+                with self.database.transaction() as conn:
+                    self._write(conn, rows)
+            except Exception:
+                with self._lock:
+                    for session in dirty:
+                        session.dirty = True
+                raise
+        self._evict()
+        return len(rows)
+
+    @staticmethod
+    def _write(conn, rows):
+        conn.executemany("""
+            INSERT OR REPLACE INTO exam_sessions (
+                id, test_bank_id, seed, shuffle, question_ids, responses, correct,
+                position, created_at, updated_at, finished_at
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, rows)
+
+    def forget_bank(self, test_bank_id):
+        with self._lock:
+            for session_id in [s.id for s in self._sessions.values() if s.test_bank_id == test_bank_id]:
+                del self._sessions[session_id]
+
+    def _drop_expired(self):
+        if not self.ttl:
+            return
+        now = time.time()
+        with self._lock:
+            for session_id in [s.id for s in self._sessions.values() if self._expired(s, now)]:
+                del self._sessions[session_id]
+
+    def _evict(self):
+        with self._lock:
+            excess = len(self._sessions) - self.max_in_memory
+            if excess <= 0:
+                return
+            for session_id in [s.id for s in self._sessions.values() if not s.dirty][:excess]:
+                del self._sessions[session_id]
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="session-checkpoint", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.checkpoint()
+
+    def _run(self):
+        while not self._stop.wait(self.checkpoint_interval):
+            try:
+                self.checkpoint()
+            except Exception:
+                logger.exception("Session checkpoint failed")
@@ -0,0 +1,81 @@
+import hashlib
+import random
+from functools import lru_cache
+from itertools import permutations
+
+# Option counts up to this size pick from a cached table of all permutations
+TABLE_MAX_OPTIONS = 7
+
+_HASH_KEY = b"examomatic-shuffle-v1"
+
+
+def _digest(question_id, seed):
+    data = f"{question_id}:{seed}" if seed is not None else str(question_id)
+    return int.from_bytes(
+        hashlib.blake2b(data.encode(), digest_size=8, key=_HASH_KEY).digest(), "big"
+    )
+
+
+@lru_cache(maxsize=TABLE_MAX_OPTIONS + 1)
+def _permutation_table(option_count):
+    return tuple(permutations(range(option_count)))
+
+
+def permutation(question_id, option_count, seed=None):
+    """Deterministic option order for a question, derived only from its id and the seed.
+
+    Uses no shared RNG state, so it is safe to call from any number of
+    threads at once and always gives /questions and /answer the same order.
+    """
+    h = _digest(question_id, seed)
+    if option_count <= TABLE_MAX_OPTIONS:
+        table = _permutation_table(option_count)
+        return table[h % len(table)]
+    indices = list(range(option_count))
+    random.Random(h).shuffle(indices)
+    return tuple(indices)
+
+
+def option_order(question_id, option_count, is_true_false, shuffle=True, seed=None):
+    """Order options are displayed and graded in; true/false questions are never shuffled."""
+    if not shuffle or is_true_false:
+        return tuple(range(option_count))
+    return permutation(question_id, option_count, seed)
+
+
+def bank_orders(questions, shuffle=True, seed=None):
+    """Option orders for a whole compiled bank in one pass."""
+    if not shuffle:
+        return [tuple(range(len(q.options))) for q in questions]
+    tables = {}
+    orders = []
+    for q in questions:
+        option_count = len(q.options)
+        if q.is_true_false:
+            orders.append(tuple(range(option_count)))
+        elif option_count <= TABLE_MAX_OPTIONS:
+            table = tables.get(option_count)
+            if table is None:
+                table = tables[option_count] = _permutation_table(option_count)
+            orders.append(table[_digest(q.id, seed) % len(table)])
+        else:
+            orders.append(permutation(q.id, option_count, seed))
+    return orders
+
+
+def permute_mask(mask, order):
+    """Map a bitmask over stored option positions onto displayed letter positions."""
+    displayed = 0
+    for position, index in enumerate(order):
+        if mask >> index & 1:
+            displayed |= 1 << position
+    return displayed
+
+
+def unpermute_mask(mask, order):
+    """Inverse of permute_mask: map displayed letter positions back onto stored options."""
+    stored = 0
+    for position, index in enumerate(order):
+        if mask >> position & 1:
+            stored |= 1 << index
+    return stored
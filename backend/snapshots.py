@@ -0,0 +1,467 @@
+import argparse
+import bisect
+import logging
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import zlib
+from array import array
+from collections.abc import Sequence
+
+from bank_cache import CompiledQuestion, compile_bank
+
+logger = logging.getLogger(__name__)
+
+# A snapshot is one compiled bank in a single file that is mmap'd rather
+# than parsed: fixed-width little-endian columns (question ids, string
+# indexes, option and image offsets) followed by one string table holding
+# every text and finished image URL. Opening one reads only the header;
+# questions are decoded from the mapping when they are served.
+
+MAGIC = b"EXOSNAP\x00"
+FORMAT_VERSION = 1
+SUFFIX = ".snap"
+NO_STRING = 0xFFFFFFFF
+FLAG_TRUE_FALSE = 1
+
+# magic, format version, test bank id, content version, name and exam code
+# string indexes, CRC-32 of everything after the section table
+HEADER = struct.Struct("<8sIqqIII")
+
+# Column name, array typecode, and the count its length is derived from
+# (Q questions, O options, R image references, S strings, B string bytes)
+SECTIONS = (
+    ("ids", "q", "Q"),
+    ("question_text", "I", "Q"),
+    ("explanation", "I", "Q"),
+    ("flags", "B", "Q"),
+    ("option_start", "I", "Q+1"),
+    ("question_image_start", "I", "Q+1"),
+    ("explanation_image_start", "I", "Q+1"),
+    ("option_text", "I", "O"),
+    ("option_image", "I", "O"),
+    ("option_correct", "B", "O"),
+    ("image_refs", "I", "R"),
+    ("string_offsets", "Q", "S+1"),
+    ("strings", "B", "B"),
+)
+SECTION = struct.Struct("<QQ")
+ALIGN = 8
+
+
+class SnapshotError(ValueError):
+    pass
+
+
+def path_for(directory, test_bank_id):
+    return os.path.join(directory, f"bank-{test_bank_id}{SUFFIX}")
+
+
+class _Strings:
+    def __init__(self):
+        self.index = {}
+        self.offsets = array("Q", [0])
+        self.data = bytearray()
+
+    def add(self, value):
+        if value is None:
+            return NO_STRING
+        position = self.index.get(value)
+        if position is None:
+            position = self.index[value] = len(self.offsets) - 1
+            self.data += value.encode("utf-8")
+            self.offsets.append(len(self.data))
+        return position
+
+
+def _with_base(url, image_base):
+    return image_base + url if url and image_base and url.startswith("/") else url
+
+
+def _little_endian(column):
+    if sys.byteorder != "little":
+        column = array(column.typecode, column)
+        column.byteswap()
+    return column.tobytes()
+
+
+def write_snapshot(path, bank, name, image_base=""):
+    """Write a compiled bank to path (atomically); image_base is prefixed to root-relative image URLs."""
+    strings = _Strings()
+    columns = {
+        "ids": array("q"),
+        "question_text": array("I"),
+        "explanation": array("I"),
+        "flags": array("B"),
+        "option_start": array("I", [0]),
+        "question_image_start": array("I", [0]),
+        "explanation_image_start": array("I", [0]),
+        "option_text": array("I"),
+        "option_image": array("I"),
+        "option_correct": array("B"),
+        "image_refs": array("I"),
+    }
+    for q in bank.questions:
+        columns["ids"].append(q.id)
+        columns["question_text"].append(strings.add(q.question_text))
+        columns["explanation"].append(strings.add(q.explanation))
+        columns["flags"].append(FLAG_TRUE_FALSE if q.is_true_false else 0)
+        for text, image, correct in zip(q.options, q.option_images, q.is_correct):
+            columns["option_text"].append(strings.add(text))
+            columns["option_image"].append(strings.add(_with_base(image, image_base)))
+            columns["option_correct"].append(1 if correct else 0)
+        columns["option_start"].append(len(columns["option_text"]))
+        columns["image_refs"].extend(strings.add(_with_base(url, image_base)) for url in q.question_images)
+        columns["question_image_start"].append(len(columns["image_refs"]))
+        columns["image_refs"].extend(strings.add(_with_base(url, image_base)) for url in q.explanation_images)
+        columns["explanation_image_start"].append(len(columns["image_refs"]))
+    name_index = strings.add(name)
+    exam_code_index = strings.add(bank.exam_code)
+    columns["string_offsets"] = strings.offsets
+    if len(strings.offsets) - 1 >= NO_STRING or len(columns["option_text"]) >= NO_STRING:
+        raise SnapshotError("Bank is too large for a snapshot")
+
+    payload = bytearray()
+    table = []
+    for section, _, _ in SECTIONS:
+        data = bytes(strings.data) if section == "strings" else _little_endian(columns[section])
+        payload += b"\0" * (-len(payload) % ALIGN)
+        table.append((len(payload), len(data)))
+        payload += data
+    start = HEADER.size + SECTION.size * len(SECTIONS)
+    start += -start % ALIGN
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, bank.id, bank.version, name_index, exam_code_index,
+                         zlib.crc32(payload))
+    section_table = b"".join(SECTION.pack(start + offset, size) for offset, size in table)
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp = tempfile.mkstemp(prefix=".snapshot-", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as out:
+            out.write(header + section_table)
+            out.write(b"\0" * (start - HEADER.size - len(section_table)))
+            out.write(payload)
+        os.replace(temp, path)
+    except BaseException:
+        os.remove(temp)
+        raise
+
+
+def _column(view, typecode):
+    if sys.byteorder == "little":
+        return view.cast(typecode)
+    column = array(typecode, bytes(view))
+    column.byteswap()
+    return column
+
+
+class _Questions(Sequence):
+    """The snapshot's questions as CompiledQuestions, decoded on access."""
+
+    def __init__(self, snapshot):
+        self._snapshot = snapshot
+
+    def __len__(self):
+        return len(self._snapshot.ids)
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return [self[i] for i in range(*position.indices(len(self)))]
+        return self._snapshot.question_at(position)
+
+    def __iter__(self):
+        return self._snapshot.iter_questions()
+
+
+class BankSnapshot:
+    """A memory-mapped bank snapshot, usable wherever a CompiledBank is."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            try:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise SnapshotError(f"{path} is empty")
+        view = memoryview(self._map)
+        if len(view) < HEADER.size + SECTION.size * len(SECTIONS):
+            raise SnapshotError(f"{path} is truncated")
+        magic, version, self.id, self.version, name_index, exam_code_index, self.checksum = \
+            HEADER.unpack_from(view)
+        if magic != MAGIC:
+            raise SnapshotError(f"{path} is not a bank snapshot")
+        if version != FORMAT_VERSION:
+            raise SnapshotError(f"{path} has snapshot format {version}, expected {FORMAT_VERSION}")
+
+        self._sections = []
+        for i, (section, typecode, _) in enumerate(SECTIONS):
+            offset, size = SECTION.unpack_from(view, HEADER.size + i * SECTION.size)
+            if offset + size > len(view) or size % array(typecode).itemsize:
+                raise SnapshotError(f"{path} is truncated or corrupt ({section})")
+            self._sections.append((offset, size))
+            data = view[offset:offset + size]
+            setattr(self, section, data if section == "strings" else _column(data, typecode))
+        try:
+            self.name = self.string(name_index)
+            self.exam_code = self.string(exam_code_index)
+        except (IndexError, UnicodeDecodeError):
+            raise SnapshotError(f"{path} is corrupt (string table)")
+        self.questions = _Questions(self)
+
+    def string(self, index):
+        if index == NO_STRING:
+            return None
+        return str(self.strings[self.string_offsets[index]:self.string_offsets[index + 1]], "utf-8")
+
+    def _strings(self, indexes):
+        return tuple(self.string(index) for index in indexes)
+
+    def question_at(self, position):
+        if position < 0:
+            position += len(self.ids)
+        if not 0 <= position < len(self.ids):
+            raise IndexError(position)
+        first, last = self.option_start[position], self.option_start[position + 1]
+        # Each question's image references are its question images followed by its explanation images
+        images = self.explanation_image_start[position]
+        explanation_images = self.question_image_start[position + 1]
+        end = self.explanation_image_start[position + 1]
+        return CompiledQuestion(
+            id=self.ids[position],
+            question_text=self.string(self.question_text[position]),
+            explanation=self.string(self.explanation[position]),
+            question_images=self._strings(self.image_refs[images:explanation_images]),
+            explanation_images=self._strings(self.image_refs[explanation_images:end]),
+            options=self._strings(self.option_text[first:last]),
+            option_images=self._strings(self.option_image[first:last]),
+            is_correct=tuple(bool(flag) for flag in self.option_correct[first:last]),
+            is_true_false=bool(self.flags[position] & FLAG_TRUE_FALSE),
+        )
+
+    def iter_questions(self):
+        """Decode every question in order, resolving each column against the string table once."""
+        data = bytes(self.strings)
+        offsets = self.string_offsets.tolist()
+        strings = [data[start:end].decode("utf-8") for start, end in zip(offsets, offsets[1:])]
+
+        def texts(column):
+            return [None if index == NO_STRING else strings[index] for index in column.tolist()]
+
+        question_text, explanation = texts(self.question_text), texts(self.explanation)
+        option_text, option_image, image_refs = texts(self.option_text), texts(self.option_image), texts(self.image_refs)
+        option_correct = [flag == 1 for flag in self.option_correct.tolist()]
+        flags, option_start = self.flags.tolist(), self.option_start.tolist()
+        image_start, explanation_start = self.question_image_start.tolist(), self.explanation_image_start.tolist()
+        for position, question_id in enumerate(self.ids.tolist()):
+            first, last = option_start[position], option_start[position + 1]
+            images, explanation_images = explanation_start[position], image_start[position + 1]
+            yield CompiledQuestion(
+                id=question_id,
+                question_text=question_text[position],
+                explanation=explanation[position],
+                question_images=tuple(image_refs[images:explanation_images]),
+                explanation_images=tuple(image_refs[explanation_images:explanation_start[position + 1]]),
+                options=tuple(option_text[first:last]),
+                option_images=tuple(option_image[first:last]),
+                is_correct=tuple(option_correct[first:last]),
+                is_true_false=bool(flags[position] & FLAG_TRUE_FALSE),
+            )
+
+    def key_rows(self):
+        """(question id, option count, is true/false, correct options) for every question, without decoding text."""
+        option_start, option_correct = self.option_start.tolist(), self.option_correct.tolist()
+        flags = self.flags.tolist()
+        for position, question_id in enumerate(self.ids.tolist()):
+            first, last = option_start[position], option_start[position + 1]
+            yield question_id, last - first, bool(flags[position] & FLAG_TRUE_FALSE), option_correct[first:last]
+
+    def position(self, question_id):
+        """Index of a question by id (ids are stored in ascending order), or None."""
+        position = bisect.bisect_left(self.ids, question_id)
+        if position < len(self.ids) and self.ids[position] == question_id:
+            return position
+        return None
+
+    def question(self, question_id):
+        position = self.position(question_id)
+        return None if position is None else self.question_at(position)
+
+    def verify(self):
+        """Check the checksum and internal consistency; returns a list of problems."""
+        problems = []
+        start = self._sections[0][0]
+        end = max(offset + size for offset, size in self._sections)
+        if zlib.crc32(memoryview(self._map)[start:end]) != self.checksum:
+            problems.append("checksum mismatch")
+        questions, options, refs = len(self.ids), len(self.option_text), len(self.image_refs)
+        strings = len(self.string_offsets) - 1
+        expected = {"Q": questions, "Q+1": questions + 1, "O": options, "R": refs, "S+1": strings + 1,
+                    "B": self.string_offsets[-1]}
+        for section, _, count in SECTIONS:
+            if len(getattr(self, section)) != expected[count]:
+                problems.append(f"{section} has {len(getattr(self, section))} entries, expected {expected[count]}")
+        if problems:
+            return problems
+        if any(self.ids[i] >= self.ids[i + 1] for i in range(questions - 1)):
+            problems.append("question ids are not in ascending order")
+        starts = self.option_start
+        if starts[0] != 0 or starts[-1] != options or any(starts[i] > starts[i + 1] for i in range(questions)):
+            problems.append("option_start offsets are out of range")
+        images, explanation_images = self.question_image_start, self.explanation_image_start
+        if images[0] != 0 or explanation_images[0] != 0 or explanation_images[-1] != refs or any(
+            not explanation_images[i] <= images[i + 1] <= explanation_images[i + 1] for i in range(questions)
+        ):
+            problems.append("image offsets are out of range")
+        for section in ("question_text", "explanation", "option_text", "option_image", "image_refs"):
+            if any(index != NO_STRING and index >= strings for index in getattr(self, section)):
+                problems.append(f"{section} references a missing string")
+        return problems
+
+
+class SnapshotStore:
+    """Snapshots in a directory, one file per bank, opened on demand."""
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def load(self, test_bank_id, version=None):
+        """The bank's snapshot, or None if there is none, it is unreadable, or it is not at ``version``."""
+        path = path_for(self.directory, test_bank_id)
+        if not os.path.exists(path):
+            return None
+        try:
+            snapshot = BankSnapshot(path)
+        except (OSError, SnapshotError) as e:
+            logger.warning("Ignoring snapshot %s: %s", path, e)
+            return None
+        if snapshot.id != test_bank_id or (version is not None and snapshot.version != version):
+            return None
+        return snapshot
+
+    def load_all(self, verify=True):
+        """Every readable snapshot in the directory, by bank id; with verify, only those that pass verify()."""
+        banks = {}
+        for entry in sorted(os.listdir(self.directory)):
+            if not entry.endswith(SUFFIX):
+                continue
+            path = os.path.join(self.directory, entry)
+            try:
+                snapshot = BankSnapshot(path)
+            except (OSError, SnapshotError) as e:
+                logger.warning("Ignoring snapshot %s: %s", path, e)
+                continue
+            problems = snapshot.verify() if verify else []
+            if problems:
+                logger.warning("Ignoring snapshot %s: %s", path, "; ".join(problems))
+                continue
+            banks[snapshot.id] = snapshot
+        return banks
+
+
+def compare(snapshot, bank, image_base=""):
+    """Differences between a snapshot and the compiled bank it should hold."""
+    problems = []
+    if snapshot.version != bank.version:
+        problems.append(f"content version {snapshot.version}, database has {bank.version}")
+    if len(snapshot.questions) != len(bank.questions):
+        problems.append(f"{len(snapshot.questions)} questions, database has {len(bank.questions)}")
+        return problems
+    for stored, expected in zip(snapshot.questions, bank.questions):
+        expected = expected._replace(
+            question_images=tuple(_with_base(url, image_base) for url in expected.question_images),
+            explanation_images=tuple(_with_base(url, image_base) for url in expected.explanation_images),
+            option_images=tuple(_with_base(url, image_base) for url in expected.option_images),
+        )
+        if stored != expected:
+            problems.append(f"question {expected.id} differs")
+            if len(problems) >= 10:
+                break
+    return problems
+
+
+def _bank_names(conn, bank_ids):
+    rows = conn.execute("SELECT id, name FROM test_banks WHERE deleted_at IS NULL ORDER BY id").fetchall()
+    return [(bank_id, name) for bank_id, name in rows if not bank_ids or bank_id in bank_ids]
+
+
+def main():
+    from db import Database
+    from image_store import ImageStore
+
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
+    parser = argparse.ArgumentParser(description="Build and verify memory-mapped test bank snapshots.")
+    parser.add_argument("command", choices=("build", "verify"), help="build snapshots from the database, or verify them")
+    parser.add_argument("--db", default="test_engine.db", help="Path to SQLite database file (default: test_engine.db)")
+    parser.add_argument("--out", default="snapshots", help="Snapshot directory (default: snapshots)")
+    parser.add_argument("--store", default="image_store", help="Image store directory (default: image_store)")
+    parser.add_argument("--bank", type=int, action="append", help="Only this test bank id (repeatable)")
+    parser.add_argument(
+        "--image-base", default="",
+        help="Prefix for image URLs, e.g. https://cdn.example.com, when the snapshots are served elsewhere",
+    )
+    parser.add_argument("--offline", action="store_true", help="verify: only check the files, not the database")
+    args = parser.parse_args()
+
+    if args.command == "verify" and args.offline:
+        failed = 0
+        for entry in sorted(os.listdir(args.out)):
+            if entry.endswith(SUFFIX):
+                failed += _report(os.path.join(args.out, entry), None, args.image_base)
+        raise SystemExit(1 if failed else 0)
+
+    if not os.path.exists(args.db):
+        parser.error(f"database {args.db} does not exist")
+    database = Database(args.db)
+    store = ImageStore(database, args.store)
+    os.makedirs(args.out, exist_ok=True)
+    failed = 0
+    try:
+        conn = database.connection()
+        banks = _bank_names(conn, set(args.bank or ()))
+        if args.command == "build" and not args.bank:
+            # Banks deleted since the last build must not keep being served
+            live = {path_for(args.out, bank_id) for bank_id, _ in banks}
+            for entry in os.listdir(args.out):
+                path = os.path.join(args.out, entry)
+                if entry.endswith(SUFFIX) and path not in live:
+                    os.remove(path)
+                    logging.info(f"Removed {path}")
+        for bank_id, name in banks:
+            path = path_for(args.out, bank_id)
+            with database.transaction(immediate=False):
+                bank = compile_bank(conn, bank_id, store.url_for)
+            if bank is None:
+                continue
+            if args.command == "build":
+                write_snapshot(path, bank, name, args.image_base)
+                logging.info(f"Wrote {path}: {len(bank.questions)} questions, {os.path.getsize(path)} bytes")
+            elif not os.path.exists(path):
+                logging.error(f"{path}: missing")
+                failed += 1
+            else:
+                failed += _report(path, bank, args.image_base)
+    finally:
+        database.close_all()
+    raise SystemExit(1 if failed else 0)
+
+
+def _report(path, bank, image_base):
+    try:
+        snapshot = BankSnapshot(path)
+    except (OSError, SnapshotError) as e:
+        logging.error(str(e))
+        return 1
+    problems = snapshot.verify()
+    if not problems and bank is not None:
+        problems = compare(snapshot, bank, image_base)
+    for problem in problems:
+        logging.error(f"{path}: {problem}")
+    if not problems:
+        logging.info(f"{path}: OK ({len(snapshot.questions)} questions, content version {snapshot.version})")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    main()
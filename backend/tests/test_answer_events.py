@@ -0,0 +1,18 @@
+import threading
+
+import answer_events
+
+
+def test_dropped_events_are_all_counted():
+    # Nothing drains the queue, so every event past the first is dropped
+    log = answer_events.AnswerEventLog(database=None, max_queue=1)
+    threads = [
+        threading.Thread(target=lambda: [log.record(1, 1, 1, True) for _ in range(2000)])
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert log.queued == 1
+    assert log.dropped == 8 * 2000 - 1
@@ -0,0 +1,42 @@
+from answer_keys import AnswerKeyIndex
+
+
+class FakeBank:
+    def __init__(self, id, rows):
+        self.id = id
+        self.rows = rows
+
+    def key_rows(self):
+        return iter(self.rows)
+
+
+BANK = FakeBank(1, [(10, 4, False, (False, True, False, False)), (11, 2, True, (True, False))])
+
+
+def test_stale_bank_is_not_indexed_after_invalidation():
+    index = AnswerKeyIndex()
+    generation = index.generation
+    # The bank changes while a request is still compiling the old copy
+    index.invalidate(1)
+    assert index.add_bank(BANK, generation) is False
+    assert index.lookup(10) is None
+
+    assert index.add_bank(BANK, index.generation) is True
+    key = index.lookup(10)
+    assert (key.test_bank_id, key.option_count, key.is_true_false, key.mask) == (1, 4, False, 0b10)
+
+
+def test_questions_without_options_are_remembered_until_invalidated():
+    index = AnswerKeyIndex()
+    generation = index.generation
+    index.add_bank(BANK, generation)
+    index.add_missing(1, 12, generation)
+    assert index.is_missing(12)
+    assert index.lookup(12) is None
+
+    index.invalidate(1)
+    assert not index.is_missing(12)
+    assert index.lookup(10) is None
+    # A negative entry from before an invalidation is not recorded either
+    index.add_missing(1, 12, generation)
+    assert not index.is_missing(12)
@@ -0,0 +1,41 @@
+import sqlite3
+
+import coherence
+from db import Database
+from migrations import migrate
+
+
+def _write(path, *statements):
+    # Another process's connection: only its commits move PRAGMA data_version
+    conn = sqlite3.connect(path)
+    with conn:
+        for sql, params in statements:
+            conn.execute(sql, params)
+        coherence.bump_generation(conn.cursor())
+    conn.close()
+
+
+def test_monitor_reports_created_changed_and_deleted_banks(tmp_path):
+    path = str(tmp_path / "test.db")
+    database = Database(path)
+    migrate(database)
+    _write(path, ("INSERT INTO test_banks (id, name, exam_code) VALUES (?, ?, ?)", (1, "One", "ONE")))
+
+    changed = []
+    monitor = coherence.ChangeMonitor(database, on_bank_changed=changed.append)
+    assert monitor.check() is False
+
+    _write(path, ("INSERT INTO test_banks (id, name, exam_code) VALUES (?, ?, ?)", (2, "Two", "TWO")))
+    assert monitor.check() is True
+    assert changed == [2]
+
+    changed.clear()
+    _write(path, ("UPDATE test_banks SET content_version = content_version + 1 WHERE id = ?", (1,)))
+    monitor.check()
+    assert changed == [1]
+
+    changed.clear()
+    _write(path, ("DELETE FROM test_banks WHERE id = ?", (2,)))
+    monitor.check()
+    assert changed == [2]
+    assert monitor.check() is False
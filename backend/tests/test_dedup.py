@@ -0,0 +1,63 @@
+import json
+
+import dedup
+import importer
+from db import Database
+from migrations import migrate
+
+OPTIONS = ["Paris", "London", "Berlin", "Madrid"]
+QUESTION = "Which city is the capital of France, according to the course notes?"
+
+
+def _question(correct, question=QUESTION, options=OPTIONS):
+    return {
+        "question": question,
+        "options": [{"text": text, "is_correct": i in correct} for i, text in enumerate(options)],
+    }
+
+
+def _sign(q):
+    options = q["options"]
+    return dedup.signature(q["question"], [o["text"] for o in options], [o["is_correct"] for o in options])
+
+
+def test_reordered_options_are_duplicates():
+    index = dedup.LSHIndex()
+    index.add(1, _sign(_question({0})))
+    reordered = _question({3}, options=list(reversed(OPTIONS)))
+    assert index.find(_sign(reordered)) == (1, 1.0)
+
+
+def test_same_text_with_different_answer_is_not_a_duplicate():
+    index = dedup.LSHIndex()
+    index.add(1, _sign(_question({0})))
+    assert index.find(_sign(_question({1}))) is None
+    assert index.find(_sign(_question({0, 1}))) is None
+
+
+def _import(tmp_path, questions, name, **kwargs):
+    path = tmp_path / name
+    path.write_text(json.dumps({"exam_name": "Geo", "exam_code": "GEO-1", "questions": questions}))
+    job = importer.ImportJob(name)
+    importer.run_import(kwargs.pop("database"), str(path), job, **kwargs)
+    assert job.status == "completed", job.errors
+    return job
+
+
+def test_import_keeps_questions_that_differ_only_in_answer(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    database = Database(str(tmp_path / "test.db"))
+    migrate(database)
+
+    _import(tmp_path, [_question({0})], "first.json", database=database)
+    # Same text, different answer: imported under every policy
+    for policy, correct in zip(importer.DUPLICATE_POLICIES, ({1}, {2}, {3}, {1, 2})):
+        job = _import(tmp_path, [_question(correct)], f"{policy}.json", database=database, duplicates=policy)
+        assert job.questions_done == 1
+        assert job.duplicates == []
+
+    # A true duplicate is dropped only when asked to, and reported by default
+    job = _import(tmp_path, [_question({0})], "default.json", database=database)
+    assert job.questions_done == 1 and len(job.duplicates) == 1
+    job = _import(tmp_path, [_question({0})], "skip.json", database=database, duplicates="skip")
+    assert job.questions_done == 0 and job.duplicates_skipped == 1
@@ -0,0 +1,32 @@
+from starlette.requests import Request
+
+import http_cache
+
+
+def _request(**headers):
+    raw = [(name.replace("_", "-").encode(), value.encode()) for name, value in headers.items()]
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": raw})
+
+
+BODY = b"[" + b"1," * 2000 + b"1]"
+
+
+def test_each_encoding_gets_its_own_etag():
+    etag = http_cache.content_etag(BODY)
+    plain = http_cache.json_response(_request(), etag, lambda: BODY)
+    gzipped = http_cache.json_response(_request(accept_encoding="gzip"), etag, lambda: BODY)
+    assert plain.headers["etag"] == etag
+    assert gzipped.headers["content-encoding"] == "gzip"
+    assert gzipped.headers["etag"] != plain.headers["etag"]
+
+
+def test_revalidation_matches_any_encoding_of_the_same_body():
+    etag = http_cache.content_etag(BODY)
+    gzip_etag = http_cache.encoded_etag(etag, "gzip")
+    response = http_cache.json_response(_request(accept_encoding="gzip", if_none_match=gzip_etag), etag, lambda: BODY)
+    assert response.status_code == 304
+    assert response.headers["etag"] == gzip_etag
+    response = http_cache.json_response(_request(if_none_match="W/" + etag), etag, lambda: BODY)
+    assert response.status_code == 304 and response.headers["etag"] == etag
+    stale = http_cache.encoded_etag(http_cache.content_etag(b"{}"), "gzip")
+    assert http_cache.json_response(_request(if_none_match=stale), etag, lambda: BODY).status_code == 200
@@ -0,0 +1,54 @@
+import os
+
+from db import Database
+from image_store import ImageStore
+from migrations import migrate
+
+
+def _setup(tmp_path):
+    database = Database(str(tmp_path / "test.db"))
+    migrate(database)
+    with database.transaction() as conn:
+        conn.execute("INSERT INTO test_banks (name, exam_code) VALUES ('Geo', 'GEO-1')")
+    folder = tmp_path / "exams" / "GEO-1" / "images"
+    folder.mkdir(parents=True)
+    return database, ImageStore(database, str(tmp_path / "store")), folder
+
+
+def _digest(database, name):
+    with database.transaction(immediate=False) as conn:
+        return conn.execute("SELECT digest FROM image_names WHERE name = ?", (name,)).fetchone()[0]
+
+
+def test_exam_images_stay_writable_copies(tmp_path):
+    database, store, folder = _setup(tmp_path)
+    image = folder / "map.png"
+    image.write_bytes(b"first version")
+    store.sweep(str(tmp_path / "exams"))
+    first = _digest(database, "map.png")
+    assert os.stat(image).st_nlink == 1
+
+    # Replacing the image by hand stores it as a new blob and leaves the old one intact
+    image.write_bytes(b"second version")
+    os.utime(image, (1, 1))
+    store.sweep(str(tmp_path / "exams"))
+    assert _digest(database, "map.png") != first
+    with open(store.blob_path(first), "rb") as blob:
+        assert blob.read() == b"first version"
+
+
+def test_sweep_detaches_files_hard_linked_to_blobs(tmp_path):
+    database, store, folder = _setup(tmp_path)
+    image = folder / "map.png"
+    image.write_bytes(b"linked")
+    store.sweep(str(tmp_path / "exams"))
+    blob = store.blob_path(_digest(database, "map.png"))
+    # As left behind by earlier versions: the exam file is the read-only blob itself
+    os.remove(image)
+    os.link(blob, image)
+
+    store.sweep(str(tmp_path / "exams"))
+    assert not os.path.samefile(image, blob)
+    image.write_bytes(b"edited")
+    with open(blob, "rb") as src:
+        assert src.read() == b"linked"
@@ -0,0 +1,29 @@
+import json
+import zipfile
+
+import importer
+from db import Database
+from image_store import ImageStore
+from migrations import migrate
+
+
+def test_failed_bundle_import_leaves_no_exam_directory(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    database = Database(str(tmp_path / "test.db"))
+    migrate(database)
+    store = ImageStore(database, str(tmp_path / "blobs"))
+
+    path = tmp_path / "bad.zip"
+    with zipfile.ZipFile(path, "w") as bundle:
+        bundle.writestr("questions.json", json.dumps({
+            "exam_name": "Broken", "exam_code": "BRK-1",
+            "questions": [{"question": "Q?", "question_images": ["a.png"], "options": [{"text": "A", "is_correct": True}]}],
+        }))
+        bundle.writestr("images/a.png", b"not an image")
+
+    job = importer.ImportJob("bad.zip")
+    importer.run_import(database, str(path), job, image_store=store)
+    assert job.status == "failed"
+    assert not (tmp_path / "exams" / "BRK-1").exists()
+    with database.transaction(immediate=False) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM test_banks").fetchone()[0] == 0
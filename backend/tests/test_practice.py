@@ -0,0 +1,34 @@
+from types import SimpleNamespace
+
+import answer_events
+import practice
+from db import Database
+from migrations import migrate
+
+BANK = SimpleNamespace(id=1, version=1, questions=[SimpleNamespace(id=qid) for qid in (10, 11, 12)])
+
+
+def _database(tmp_path):
+    database = Database(str(tmp_path / "test.db"))
+    migrate(database)
+    with database.transaction() as conn:
+        conn.execute("INSERT INTO test_banks (id, name, exam_code) VALUES (1, 'One', 'ONE')")
+    return database
+
+
+def test_answers_before_the_first_next_are_not_new(tmp_path):
+    database = _database(tmp_path)
+    scheduler = practice.PracticeScheduler()
+    log = answer_events.AnswerEventLog(database, on_written=scheduler.written)
+
+    # Answered before the bank's queue exists, and before the log is written
+    event = log.record(1, 10, 0b1, True)
+    scheduler.record(1, 10, True, now=event.created_at)
+    picked = scheduler.next(database.connection(), BANK, 3, now=event.created_at + 60)
+    assert [(qid, reason) for qid, reason, _ in picked] == [(11, "new"), (12, "new"), (10, "ahead")]
+
+    # Once written, the answer comes from practice_schedule and is applied only once
+    log.flush()
+    scheduler.invalidate(1)
+    picked = scheduler.next(database.connection(), BANK, 3, now=event.created_at + 60)
+    assert picked[2][0] == 10 and picked[2][2].reps == 1
@@ -0,0 +1,22 @@
+import reaper
+from db import Database
+from migrations import migrate
+
+
+def test_exam_folder_is_kept_when_an_import_reuses_the_code(tmp_path):
+    database = Database(str(tmp_path / "test.db"))
+    migrate(database)
+    folder = tmp_path / "exams" / "GEO-1"
+    folder.mkdir(parents=True)
+    bank_reaper = reaper.Reaper(database, exams_root=str(tmp_path / "exams"), exams_lock=str(tmp_path / "exams.lock"))
+
+    # The purge has committed, but an import created a bank with the same code meanwhile
+    with database.transaction() as conn:
+        conn.execute("INSERT INTO test_banks (name, exam_code) VALUES ('Geo', 'GEO-1')")
+    bank_reaper._release_files("GEO-1", [], True)
+    assert folder.exists()
+
+    with database.transaction() as conn:
+        conn.execute("DELETE FROM test_banks")
+    bank_reaper._release_files("GEO-1", [], True)
+    assert not folder.exists()
@@ -0,0 +1,49 @@
+import random
+import sqlite3
+from collections import Counter
+
+from bank_cache import sample_ids
+
+# Two runs of ids with a gap between them, as left behind by deleted questions
+BANK_IDS = list(range(1, 11)) + list(range(21, 31))
+# Mostly gaps: too sparse for random probes alone
+SPARSE_IDS = list(range(1, 11)) + list(range(1001, 1011))
+
+
+def _connection(ids):
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE questions (id INTEGER PRIMARY KEY, test_bank_id INTEGER)")
+    conn.execute("CREATE TABLE options (id INTEGER PRIMARY KEY, question_id INTEGER)")
+    conn.execute("CREATE INDEX idx_questions_bank ON questions (test_bank_id, id)")
+    conn.execute("CREATE INDEX idx_options_question ON options (question_id, id)")
+    conn.executemany("INSERT INTO questions VALUES (?, 1)", [(qid,) for qid in ids])
+    conn.executemany("INSERT INTO options (question_id) VALUES (?)", [(qid,) for qid in ids])
+    # Another bank's questions sit inside the gap, and one of ours has no options
+    conn.executemany("INSERT INTO questions VALUES (?, 2)", [(qid,) for qid in range(11, 21)])
+    conn.execute("INSERT INTO questions VALUES (31, 1)")
+    return conn
+
+
+def test_sample_has_exact_size():
+    for ids in (BANK_IDS, SPARSE_IDS):
+        conn = _connection(ids)
+        rng = random.Random(1)
+        for count in (1, 5, 19, 20):
+            sample = sample_ids(conn, 1, count, rng)
+            assert len(sample) == count
+            assert len(set(sample)) == count
+            assert set(sample) <= set(ids)
+        assert sample_ids(conn, 1, 50, rng) == ids
+        assert sample_ids(conn, 3, 5, rng) == []
+
+
+def test_sample_is_uniform_across_gaps():
+    conn = _connection(BANK_IDS)
+    rng = random.Random(2)
+    draws = 4000
+    seen = Counter()
+    for _ in range(draws):
+        seen.update(sample_ids(conn, 1, 5, rng))
+    expected = draws * 5 / len(BANK_IDS)
+    for qid in BANK_IDS:
+        assert abs(seen[qid] - expected) < expected * 0.15, (qid, seen[qid], expected)
@@ -0,0 +1,67 @@
+import time
+
+import reaper
+from db import Database
+from migrations import migrate
+from sessions import SessionStore
+
+
+def _count(database):
+    with database.transaction(immediate=False) as conn:
+        return conn.execute("SELECT COUNT(*) FROM exam_sessions").fetchone()[0]
+
+
+def test_expired_sessions_are_hidden_dropped_and_deleted(tmp_path):
+    database = Database(str(tmp_path / "test.db"))
+    migrate(database)
+    with database.transaction() as conn:
+        conn.execute("INSERT INTO test_banks (id, name, exam_code) VALUES (1, 'One', 'ONE')")
+    store = SessionStore(database, ttl=60)
+    stale = store.create(1, [1, 2], shuffle=False)
+    fresh = store.create(1, [1, 2], shuffle=False)
+    store.checkpoint()
+    stale.updated_at = time.time() - 120
+    with database.transaction() as conn:
+        conn.execute("UPDATE exam_sessions SET updated_at = ? WHERE id = ?", (stale.updated_at, stale.id))
+    store.checkpoint()
+
+    assert store.get(stale.id) is None
+    assert store.get(fresh.id) is fresh
+    assert len(store) == 1
+    assert _count(database) == 2
+
+    assert reaper.Reaper(database, session_ttl=60, chunk_size=1).expire_sessions() == 1
+    assert _count(database) == 1
+    assert store.get(fresh.id) is fresh
+
+
+def test_shared_store_hides_expired_sessions(tmp_path):
+    database = Database(str(tmp_path / "test.db"))
+    migrate(database)
+    with database.transaction() as conn:
+        conn.execute("INSERT INTO test_banks (id, name, exam_code) VALUES (1, 'One', 'ONE')")
+    store = SessionStore(database, shared=True, ttl=60)
+    session = store.create(1, [1], shuffle=False)
+    with database.transaction() as conn:
+        conn.execute("UPDATE exam_sessions SET updated_at = ?", (time.time() - 120,))
+    assert store.get(session.id) is None
+
+
+def test_answers_to_an_evicted_session_are_checkpointed(tmp_path):
+    database = Database(str(tmp_path / "test.db"))
+    migrate(database)
+    with database.transaction() as conn:
+        conn.execute("INSERT INTO test_banks (id, name, exam_code) VALUES (1, 'One', 'ONE')")
+    store = SessionStore(database, max_in_memory=0)
+    held = store.create(1, [1, 2], shuffle=False)
+    # Written and then evicted while a request still holds it
+    store.checkpoint()
+    assert len(store) == 0
+    reloaded = store.get(held.id)
+    store.checkpoint()
+
+    assert store.record(held, 0, 0b1, True)
+    assert not store.record(reloaded, 0, 0b10, False)
+    store.checkpoint()
+    with database.transaction(immediate=False) as conn:
+        assert store._load(conn, held.id).responses[0] == 0b1
@@ -47,12 +47,9 @@ export class ExamListComponent {
 
     this.http.post('http://127.0.0.1:8000/import', formData).subscribe(
       (response: any) => {
-        console.log('Import successful:', response);
-        alert(response.message);
+        console.log('Import started:', response);
         event.target.value = '';
-        setTimeout(() => {
-          this.showExamList.emit();
-        }, 100);
+        this.waitForImport(response.job_id);
       },
       (error) => {
         console.error('Import failed:', error);
@@ -61,4 +58,24 @@ export class ExamListComponent {
       }
     );
   }
+
+  private waitForImport(jobId: string): void {
+    this.http.get(`http://127.0.0.1:8000/import/${jobId}`).subscribe(
+      (job: any) => {
+        if (job.status === 'completed') {
+          alert(`Successfully imported ${job.questions_done} questions into ${job.exam_name} (${job.exam_code})`);
+          this.showExamList.emit();
+        } else if (job.status === 'failed') {
+          console.error('Import failed:', job.errors);
+          alert(`Failed to import questions: ${job.errors.join('; ')}`);
+        } else {
+          setTimeout(() => this.waitForImport(jobId), 500);
+        }
+      },
+      (error) => {
+        console.error('Failed to check import status:', error);
+        alert('Failed to import questions. Please check the file format and try again.');
+      }
+    );
+  }
 }
\ No newline at end of file
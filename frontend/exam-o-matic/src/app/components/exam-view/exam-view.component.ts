@@ -143,7 +143,8 @@ export class ExamViewComponent implements OnInit, AfterViewInit {
     const currentQuestion = this.questions[this.currentQuestionIndex];
     const answer = {
       question_id: currentQuestion.id,
-      selected_answer: this.isMultipleChoice() ? this.selectedAnswers.join(',') : this.currentAnswer
+      selected_answer: this.isMultipleChoice() ? this.selectedAnswers.join(',') : this.currentAnswer,
+      shuffle: this.shuffleQuestions
     };
 
     this.http.post<AnswerResponse>(`${this.apiBaseUrl}/answer`, answer)